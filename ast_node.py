@@ -1,13 +1,29 @@
-class NumberNode(object):
+from type_operate import make_number, String
+from operators import binary_operator, unary_operator
+
+
+class Node(object):
+    """
+    AST节点的基类
+    节点使用__slots__，不创建__dict__，大脚本的AST占用的内存更少；
+    子类新增的属性（包括resolver等pass填充的属性）都需要写在子类的__slots__中
+    """
+    __slots__ = ('pos_start', 'pos_end')
+
+
+class NumberNode(Node):
     """
     数字节点
     """
+    __slots__ = ('tok', 'value')
 
     def __init__(self, tok):
         """
         :param tok: 节点的token
         """
         self.tok = tok
+        # 解析时就创建好对应的值，执行时直接使用
+        self.value = make_number(tok.value)
 
         self.pos_start = self.tok.pos_start
         self.pos_end = self.tok.pos_end
@@ -15,16 +31,18 @@ class NumberNode(object):
     def __repr__(self):
         return f'{self.tok}'
 
-class StringNode(object):
+class StringNode(Node):
     """
     字符串节点
     """
+    __slots__ = ('tok', 'value')
 
     def __init__(self, tok):
         """
         :param tok: 节点的token
         """
         self.tok = tok
+        self.value = String(tok.value)
 
         self.pos_start = self.tok.pos_start
         self.pos_end = self.tok.pos_end
@@ -33,7 +51,9 @@ class StringNode(object):
         return f'{self.tok}'
 
 
-class ListNode(object):
+class ListNode(Node):
+    __slots__ = ('element_nodes',)
+
     def __init__(self, element_nodes, pos_start, pos_end):
         """
         list列表
@@ -46,16 +66,19 @@ class ListNode(object):
         self.pos_end = pos_end
 
 
-class VarAccessNode(object):
+class VarAccessNode(Node):
     """
     访问变量名
     """
+    __slots__ = ('var_name_tok', 'slot')
 
     def __init__(self, var_name_tok):
         """
         :param var_name_tok: 变量名token
         """
         self.var_name_tok = var_name_tok
+        # 由 resolver.py 填充：当前函数中局部变量的槽位，slot为None表示不是当前函数的局部变量（按名字动态查找）
+        self.slot = None
 
         self.pos_start = self.var_name_tok.pos_start
         self.pos_end = self.var_name_tok.pos_end
@@ -65,10 +88,11 @@ class VarAccessNode(object):
 
 
 
-class VarAssignNode(object):
+class VarAssignNode(Node):
     """
     为变量分配值
     """
+    __slots__ = ('var_name_tok', 'value_node', 'slot')
 
     def __init__(self, var_name_tok, value_node):
         """
@@ -77,6 +101,8 @@ class VarAssignNode(object):
         """
         self.var_name_tok = var_name_tok
         self.value_node = value_node
+        # 由 resolver.py 填充：赋值总是发生在当前作用域，slot为None表示全局变量
+        self.slot = None
 
         self.pos_start = self.var_name_tok.pos_start
         self.pos_end = self.var_name_tok.pos_end
@@ -85,10 +111,12 @@ class VarAssignNode(object):
         return f'({self.var_name_tok}, {self.value_node})'
 
 
-class BinOpNode(object):
+class BinOpNode(Node):
     """
     二元操作
     """
+    # quick_*：运行时特化使用（见 Interpreter.quicken），与解析结果无关，不写入AST缓存
+    __slots__ = ('left_node', 'op_tok', 'right_node', 'operator', 'quick_types', 'quick_count')
 
     def __init__(self, left_node, op_tok, right_node):
         """
@@ -100,6 +128,11 @@ class BinOpNode(object):
         self.left_node = left_node
         self.op_tok = op_tok
         self.right_node = right_node
+        # 解析时就确定操作符的分派表，执行时不再判断op_tok
+        self.operator = binary_operator(op_tok)
+        # 最近观察到的操作数值类型 (type(left.value), type(right.value))，以及连续观察到的次数，-1表示不再观察（已特化或不能特化）
+        self.quick_types = None
+        self.quick_count = 0
 
         self.pos_start = self.left_node.pos_start
         self.pos_end = self.right_node.pos_end
@@ -108,10 +141,18 @@ class BinOpNode(object):
         return f'({self.left_node}, {self.op_tok}, {self.right_node})'
 
 
-class UnaryOpNode(object):
+class QuickBinOpNode(BinOpNode):
+    """
+    运行时特化后的BinOpNode：执行时由BinOpNode修改 __class__ 得到，左右值类型为 quick_types 时直接运算
+    """
+    __slots__ = ()
+
+
+class UnaryOpNode(Node):
     """
     一元操作
     """
+    __slots__ = ('op_tok', 'node', 'operator')
 
     def __init__(self, op_tok, node):
         """
@@ -121,6 +162,7 @@ class UnaryOpNode(object):
         """
         self.op_tok = op_tok
         self.node = node
+        self.operator = unary_operator(op_tok)
 
         self.pos_start = self.op_tok.pos_start
         self.pos_end = self.node.pos_end
@@ -129,10 +171,12 @@ class UnaryOpNode(object):
         return f'({self.op_tok}, {self.node})'
 
 
-class IfNode(object):
+class IfNode(Node):
     """
     if相关操作
     """
+    __slots__ = ('case', 'else_case')
+
     def __init__(self, case, else_case):
         """
         :param case:
@@ -155,10 +199,13 @@ class IfNode(object):
         return f'({result})'
 
 
-class ForNode(object):
+class ForNode(Node):
     """
     for循环
     """
+    __slots__ = ('var_name_tok', 'start_value_node', 'end_value_node', 'step_value_node', 'body_node', 'should_return_null', 'var_slot',
+                 'result_unused')
+
     def __init__(self, var_name_tok, start_value_node, end_value_node, step_value_node, body_node, should_return_null):
         """
         :param var_name_tok: 循环变量
@@ -191,15 +238,20 @@ class ForNode(object):
         self.step_value_node = step_value_node
         self.body_node = body_node
         self.should_return_null = should_return_null
-
+        # 由 resolver.py 填充：循环变量的槽位
+        self.var_slot = None
+        # 由 optimizer.py 填充：循环的值没有被使用，不需要收集每次循环的结果
+        self.result_unused = False
 
         self.pos_start = self.var_name_tok.pos_start
         self.pos_end = self.body_node.pos_end
 
-class WhileNode(object):
+class WhileNode(Node):
     """
     while循环
     """
+    __slots__ = ('condition_node', 'body_node', 'should_return_null', 'result_unused')
+
     def __init__(self, condition_node, body_node, should_return_null):
         """
         while codition_node then
@@ -211,12 +263,16 @@ class WhileNode(object):
         self.condition_node = condition_node
         self.body_node = body_node
         self.should_return_null = should_return_null
+        # 由 optimizer.py 填充，同ForNode
+        self.result_unused = False
 
         self.pos_start = self.condition_node.pos_start
         self.pos_end = self.body_node.pos_end
 
 
-class FuncNode(object):
+class FuncNode(Node):
+    __slots__ = ('var_name_tok', 'arg_name_toks', 'body_node', 'should_auto_return', 'var_slot', 'local_names')
+
     def __init__(self, var_name_tok, arg_name_toks, body_node, should_auto_return):
         """
         :param var_name_tok: 函数名
@@ -228,6 +284,9 @@ class FuncNode(object):
         self.arg_name_toks = arg_name_toks
         self.body_node = body_node
         self.should_auto_return = should_auto_return
+        # 由 resolver.py 填充：函数名在外层作用域中的槽位，以及函数自身的局部变量表（参数在前）
+        self.var_slot = None
+        self.local_names = None
 
         if self.var_name_tok: # 函数有函数名时
             self.pos_start = self.var_name_tok.pos_start
@@ -239,8 +298,10 @@ class FuncNode(object):
         self.pos_end = self.body_node.pos_end
 
 
-class CallNode(object):
+class CallNode(Node):
     """调用函数节点"""
+    __slots__ = ('node_to_call', 'arg_nodes', 'is_tail_call')
+
     def __init__(self, node_to_call, arg_nodes):
         """
         :param node_to_call: 函数调用对象 ->
@@ -248,6 +309,8 @@ class CallNode(object):
         """
         self.node_to_call = node_to_call
         self.arg_nodes = arg_nodes
+        # 是否处于尾调用位置（return f(...)、-> f(...)），由 mark_tail_calls 在解析函数定义时标记
+        self.is_tail_call = False
 
         self.pos_start = self.node_to_call.pos_start
 
@@ -257,7 +320,9 @@ class CallNode(object):
             self.pos_end = self.node_to_call.pos_end
 
 
-class ReturnNode(object):
+class ReturnNode(Node):
+    __slots__ = ('node_to_return',)
+
     def __init__(self, node_to_return, pos_start, pos_end):
         """
 
@@ -271,19 +336,92 @@ class ReturnNode(object):
         self.pos_end = pos_end
 
 
-class ContinueNode(object):
+class ContinueNode(Node):
     """
     continue操作，跳过此次循环
     """
+    __slots__ = ()
+
     def __init__(self, pos_start, pos_end):
         self.pos_start = pos_start
         self.pos_end = pos_end
 
 
-class BreakNode(object):
+class BreakNode(Node):
     """
     break操作，跳出整个循环
     """
+    __slots__ = ()
+
     def __init__(self, pos_start, pos_end):
         self.pos_start = pos_start
-        self.pos_end = pos_end
\ No newline at end of file
+        self.pos_end = pos_end
+
+
+def child_nodes(node):
+    """
+    获得节点的直接子节点，便于各个遍历AST的pass使用
+    :param node: AST节点
+    :return: list
+    """
+    if isinstance(node, ListNode):
+        return node.element_nodes
+    if isinstance(node, VarAssignNode):
+        return [node.value_node]
+    if isinstance(node, BinOpNode):
+        return [node.left_node, node.right_node]
+    if isinstance(node, UnaryOpNode):
+        return [node.node]
+    if isinstance(node, IfNode):
+        children = []
+        for condition, expr, _ in node.case:
+            children.extend((condition, expr))
+        if node.else_case:
+            children.append(node.else_case[0])
+        return children
+    if isinstance(node, ForNode):
+        return [n for n in (node.start_value_node, node.end_value_node, node.step_value_node, node.body_node) if n]
+    if isinstance(node, WhileNode):
+        return [node.condition_node, node.body_node]
+    if isinstance(node, FuncNode):
+        return [node.body_node]
+    if isinstance(node, CallNode):
+        return [node.node_to_call] + node.arg_nodes
+    if isinstance(node, ReturnNode):
+        return [node.node_to_return] if node.node_to_return else []
+    return []
+
+
+def mark_tail_calls(func_node):
+    """
+    标记函数体中处于尾调用位置的CallNode
+    尾调用位置：return 后的表达式，-> 形式函数的函数体；
+    位于其中的单行if表达式，各分支的值同样处于尾调用位置
+    :param func_node: FuncNode
+    :return:
+    """
+    if func_node.should_auto_return:
+        mark_tail_position(func_node.body_node)
+        return
+
+    nodes = [func_node.body_node]
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, ReturnNode):
+            if node.node_to_return:
+                mark_tail_position(node.node_to_return)
+        elif not isinstance(node, FuncNode):
+            # 嵌套函数的return属于嵌套函数自身，解析嵌套函数时已经标记过
+            nodes.extend(child_nodes(node))
+
+
+def mark_tail_position(node):
+    """node的值就是函数的返回值"""
+    if isinstance(node, CallNode):
+        node.is_tail_call = True
+    elif isinstance(node, IfNode):
+        for _, expr, should_return_null in node.case:
+            if not should_return_null:
+                mark_tail_position(expr)
+        if node.else_case and not node.else_case[1]:
+            mark_tail_position(node.else_case[0])
@@ -0,0 +1,701 @@
+import gc
+import os
+import pickle
+import sys
+import time
+import tempfile
+import tracemalloc
+
+from main import run, parse, MODES
+from cache import ASTCache
+from lexer import Lexer, RegexLexer
+from parser import Parser
+from result import ParserResult
+from error import InvalidSyntaxError
+from tokens import *
+from ast_node import BinOpNode, UnaryOpNode, child_nodes
+from flat_ast import FlatAST, BIN_OP
+from position import SourceText
+from interpreter import Interpreter
+from closure_compiler import ClosureCompiler
+from transpiler import Transpiler
+from tiered import TieredInterpreter
+from optimizer import Optimizer
+from context import Context
+from built_variable import global_symbol_table
+
+
+####################
+# BENCHMARK 性能测试
+# python benchmark.py          => 运行全部
+# python benchmark.py fib      => 只运行 bench_fib
+####################
+
+FIB_SCRIPT = '''
+func Fib(n)
+    if n <= 0 then
+        return 0
+    elif n == 1 then
+        return 1
+    else
+        return Fib(n-1) + Fib(n-2)
+    end
+end
+Fib(18)
+'''
+
+
+def timeit(fn, repeat=3):
+    """多次执行取最快的一次，单位：秒"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        cost = time.perf_counter() - start
+        best = cost if best is None else min(best, cost)
+    return best
+
+
+def check(result, error):
+    if error:
+        raise Exception(error.as_string())
+    return result
+
+
+def bench_fib():
+    """递归Fib，比较不同执行模式"""
+    print('== fib: Fib(18)')
+    for mode in MODES:
+        cost = timeit(lambda: check(*run('<bench>', FIB_SCRIPT, mode)))
+        print(f'{mode:<12} {cost * 1000:>10.1f} ms')
+
+
+SCOPE_SCRIPT = '''
+var G = 1
+func down(n)
+    if n == 0 then
+        var s = 0
+        for i = 0 to 2000 then
+            var s = s + G
+        end
+        return s
+    end
+    return down(n - 1)
+end
+down(%d)
+'''
+
+
+def bench_scope():
+    """在不同递归深度下访问全局变量，比较变量查找的耗时"""
+    print('== scope: global lookups at recursion depth n')
+    for depth in (1, 90, 300, 1000):
+        script = SCOPE_SCRIPT % depth
+        costs = [timeit(lambda: check(*run('<bench>', script, mode))) for mode in ('interpreter', 'vm')]
+        print(f'depth={depth:<6} interpreter {costs[0] * 1000:>8.1f} ms   vm {costs[1] * 1000:>8.1f} ms')
+
+
+LIST_READ_SCRIPT = '''
+var big = for i = 0 to 100000 then i
+var s = 0
+for j = 0 to 300 then
+    var s = s + big / j
+end
+s
+'''
+
+
+def bench_list_read():
+    """循环中反复读取一个10万元素的list"""
+    print('== list_read: 300 reads of a 100k-element list')
+    for mode in ('interpreter', 'vm'):
+        cost = timeit(lambda: check(*run('<bench>', LIST_READ_SCRIPT, mode)))
+        print(f'{mode:<12} {cost * 1000:>10.1f} ms')
+
+
+ARITH_SCRIPT = '''
+var s = 0
+for i = 0 to 50000 then
+    var s = s + i * 2 - 1
+end
+s
+'''
+
+
+def bench_arith():
+    """算术密集的循环"""
+    print('== arith: 50k iterations of s = s + i * 2 - 1')
+    for mode in MODES:
+        cost = timeit(lambda: check(*run('<bench>', ARITH_SCRIPT, mode)))
+        print(f'{mode:<12} {cost * 1000:>10.1f} ms')
+
+
+WHILE_SCRIPT = '''
+var i = 0
+while i < 100000 then var i = i + 1
+i
+'''
+
+
+def bench_while():
+    """while i < n 的紧凑循环，主要开销是比较与小整数运算"""
+    print('== while: 100k iterations of while i < n')
+    for mode in MODES:
+        cost = timeit(lambda: check(*run('<bench>', WHILE_SCRIPT, mode)))
+        print(f'{mode:<12} {cost * 1000:>10.1f} ms')
+
+
+TAIL_SCRIPT = '''
+func sum(n, acc)
+    if n == 0 then return acc
+    return sum(n - 1, acc + n)
+end
+var total = 0
+for i = 0 to %d then
+    var total = total + sum(%d, 0)
+end
+total
+'''
+
+
+def bench_tail():
+    """累加器形式的尾递归，较浅的递归重复多次，较深的递归只执行一次"""
+    print('== tail: accumulator recursion sum(n, 0)')
+    for repeat, depth in ((100, 50), (1, 5000)):
+        script = TAIL_SCRIPT % (repeat, depth)
+        costs = []
+        for mode in ('interpreter', 'vm'):
+            try:
+                costs.append(f'{timeit(lambda: check(*run("<bench>", script, mode))) * 1000:>8.1f} ms')
+            except RecursionError:
+                costs.append(f'{"RecursionError":>11}')
+        print(f'{repeat}x depth={depth:<6} interpreter {costs[0]}   vm {costs[1]}')
+
+
+DEEP_SCRIPT = '''
+func down(n)
+    if n == 0 then return 0
+    return 1 + down(n - 1)
+end
+down(%d)
+'''
+
+
+def bench_deep():
+    """非尾递归，递归深度超过python的递归上限"""
+    print('== deep: non-tail recursion 1 + down(n - 1)')
+    for depth in (100, 5000):
+        script = DEEP_SCRIPT % depth
+        costs = []
+        for mode in ('interpreter', 'vm'):
+            try:
+                costs.append(f'{timeit(lambda: check(*run("<bench>", script, mode))) * 1000:>8.1f} ms')
+            except RecursionError:
+                costs.append(f'{"RecursionError":>11}')
+        print(f'depth={depth:<6} interpreter {costs[0]}   vm {costs[1]}')
+
+
+def big_script(functions=500):
+    """生成一个较大的脚本：大量函数定义，最后只调用其中一个，执行时间主要花在解析上"""
+    lines = []
+    for i in range(functions):
+        lines.append(f'func f{i}(a, b)')
+        lines.append(f'    var l = [a, b, {i}]')
+        lines.append(f'    if a > b then return a * 2 + {i} elif a == b then return l / 2 else return b - {i}')
+        lines.append(f'    for j = 0 to len(l) then var a = a + j')
+        lines.append(f'    return a')
+        lines.append('end')
+    lines.append('f0(1, 2)')
+    return '\n'.join(lines)
+
+
+def bench_cache():
+    """解析大脚本 vs 从AST缓存加载"""
+    text = big_script()
+    print(f'== cache: {len(text) // 1024} KB script')
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = ASTCache(cache_dir)
+        fn = os.path.join(cache_dir, 'big.pl')
+        cost = timeit(lambda: check(*run(fn, text)))
+        print(f'{"no cache":<12} {cost * 1000:>10.1f} ms')
+        check(*run(fn, text, cache=cache)) # 写入缓存
+        cost = timeit(lambda: check(*run(fn, text, cache=cache)))
+        print(f'{"cache hit":<12} {cost * 1000:>10.1f} ms')
+        cost = timeit(lambda: parse(fn, text))
+        print(f'{"parse only":<12} {cost * 1000:>10.1f} ms')
+        cost = timeit(lambda: cache.load(fn, text))
+        print(f'{"load only":<12} {cost * 1000:>10.1f} ms')
+        print(cache.stats())
+
+
+def bench_lexer(functions=20000):
+    """词法分析吞吐量，比较逐字符的Lexer与基于正则的RegexLexer"""
+    text = big_script(functions)
+    size = len(text) / 1024 / 1024
+    print(f'== lexer: {size:.1f} MB source')
+    for lexer_class in (Lexer, RegexLexer):
+        tokens = []
+
+        def lex():
+            tokens[:], error = lexer_class('<bench>', text).make_tokens()
+            check(None, error)
+
+        cost = timeit(lex, repeat=1)
+        print(f'{lexer_class.__name__:<12} {cost * 1000:>10.1f} ms  {size / cost:>6.2f} MB/s  {len(tokens) / cost / 1e6:>6.2f} M tokens/s')
+
+
+def parse_token_list(fn, text):
+    """先生成完整的Token列表再解析，作为TokenStream的对照"""
+    tokens, error = RegexLexer(fn, text).make_tokens()
+    check(None, error)
+    ast = Parser(tokens).parse()
+    check(None, ast.error)
+    return ast.node
+
+
+def bench_stream(functions=5000):
+    """解析时的内存峰值：完整Token列表 vs TokenStream按需生成"""
+    text = big_script(functions)
+    print(f'== stream: {len(text) / 1024 / 1024:.1f} MB source')
+    for name, parse_text in (('token list', parse_token_list), ('stream', lambda fn, text: check(*parse(fn, text)))):
+        tracemalloc.start()
+        start = time.perf_counter()
+        node = parse_text('<bench>', text)
+        cost = time.perf_counter() - start
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del node
+        print(f'{name:<12} {cost * 1000:>10.1f} ms  peak {peak / 1024 / 1024:>7.1f} MB  retained {retained / 1024 / 1024:>7.1f} MB')
+
+
+def count_nodes(node):
+    """AST节点个数"""
+    count = 0
+    nodes = [node]
+    while nodes:
+        node = nodes.pop()
+        count += 1
+        nodes.extend(child_nodes(node))
+    return count
+
+
+def bench_memory(functions=5000):
+    """Token与AST占用的内存，与源码大小对比"""
+    text = big_script(functions)
+    source_size = len(text.encode('utf-8'))
+    print(f'== memory: {source_size / 1024 / 1024:.1f} MB source')
+    gc.collect()
+    tracemalloc.start()
+    tokens, error = RegexLexer('<bench>', text).make_tokens()
+    check(None, error)
+    token_size = tracemalloc.get_traced_memory()[0]
+    token_count = len(tokens)
+    node = Parser(tokens).parse().node
+    del tokens
+    gc.collect()
+    # Token列表释放后，剩下的是AST（包括AST引用的Token）
+    ast_size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    node_count = count_nodes(node)
+    print(f'{"tokens":<12} {token_size / 1024 / 1024:>7.1f} MB  {token_size / source_size:>5.1f}x source  {token_size / token_count:>6.0f} B/token')
+    print(f'{"AST":<12} {ast_size / 1024 / 1024:>7.1f} MB  {ast_size / source_size:>5.1f}x source  {ast_size / node_count:>6.0f} B/node')
+
+
+def bench_flat(functions=2000):
+    """FlatAST与对象AST：序列化的大小与耗时，以及遍历全部节点的耗时"""
+    text = big_script(functions)
+    node = check(*parse('<bench>', text))
+    source = SourceText('<bench>', text)
+    print(f'== flat: {len(text) // 1024} KB script, {count_nodes(node)} nodes')
+
+    pickled = pickle.dumps(node, pickle.HIGHEST_PROTOCOL)
+    flat = FlatAST.from_node(node)
+    data = flat.to_bytes()
+    gc.disable()
+    try:
+        costs = (
+            timeit(lambda: pickle.dumps(node, pickle.HIGHEST_PROTOCOL)), timeit(lambda: pickle.loads(pickled)),
+            timeit(lambda: FlatAST.from_node(node).to_bytes()), timeit(lambda: FlatAST.from_bytes(data).to_node(source)),
+        )
+    finally:
+        gc.enable()
+    print(f'{"pickle":<12} {len(pickled) / 1024:>8.0f} KB  dump {costs[0] * 1000:>7.1f} ms  load {costs[1] * 1000:>7.1f} ms')
+    print(f'{"flat":<12} {len(data) / 1024:>8.0f} KB  dump {costs[2] * 1000:>7.1f} ms  load {costs[3] * 1000:>7.1f} ms')
+
+    # 遍历：统计BinOpNode个数
+    def walk_nodes():
+        count = 0
+        nodes = [node]
+        while nodes:
+            current = nodes.pop()
+            if type(current) is BinOpNode:
+                count += 1
+            nodes.extend(child_nodes(current))
+        return count
+
+    def walk_flat():
+        return flat.kinds.count(BIN_OP)
+
+    print(f'{"walk nodes":<12} {timeit(walk_nodes) * 1000:>10.1f} ms')
+    print(f'{"walk flat":<12} {timeit(walk_flat) * 1000:>10.1f} ms')
+
+
+def statement_list(lines=20000):
+    """生成一个很长的语句列表，其中包含函数体、循环体等嵌套的语句块"""
+    body = [
+        'var x = x + 1',
+        'if x > 10 then return x',
+        'func g(a)',
+        '    var a = a * 2',
+        '    return',
+        'end',
+        'while x < 3 then',
+        '    var x = x + 1',
+        '    continue',
+        'end',
+    ]
+    return 'var x = 0\n' + '\n'.join(body[i % len(body)] for i in range(lines))
+
+
+def expression_list(lines=20000):
+    """生成表达式密集的脚本：运算、比较、函数调用参数与列表元素"""
+    body = [
+        'var y = a * 2 + b / (c - 1) ^ 2',
+        'var ok = a < b and not c == d or e >= 10',
+        'f(a, b, 1, 2, "s", [1, 2, 3, x])',
+        'var l = [a, b + 1, -c, f(x), (a + b) * c]',
+    ]
+    return '\n'.join(body[i % len(body)] for i in range(lines))
+
+
+class TowerParser(Parser):
+    """
+    表达式逐层递归下降：expr -> comp-expr -> arith-expr -> term -> factor -> power -> call -> atom
+    Parser改用优先级爬升之前的解析方式，用于对比
+    """
+
+    def binary(self, min_prec):
+        """只在 expr 中以 PREC_LOGIC 调用，其余各级由下面的产生式逐层解析"""
+        return self.bin_op(self.comp_expr, ((TT_KEYWORD, 'and'), (TT_KEYWORD, 'or')))
+
+    def power(self):
+        """
+        power       : call (POW factor)*
+        :return:
+        """
+        return self.bin_op(self.call, (TT_POW,), self.factor)
+
+    def factor(self):
+        """
+        factor  : (PLUS|MINUS) factor
+                : power
+        :return:
+        """
+        res = ParserResult()
+        tok = self.current_tok
+
+        # factor  : (PLUS|MINUS) factor
+        if tok.type in (TT_PLUS, TT_MINUS):
+            res.register_advancement()
+            self.advance()
+            factor = res.register(self.factor())
+            if res.error: return res
+            # UnaryOpNode 一元操作 => (PLUS|MINUS) factor
+            return res.success(UnaryOpNode(tok, factor))
+        # factor    : power
+        return self.power()
+
+    def term(self):
+        """
+        term    : factor (MUL|DIV) factor)*
+        :return:
+        """
+        return self.bin_op(self.factor, (TT_MUL, TT_DIV))
+
+    def comp_expr(self):
+        res = ParserResult()
+
+        # comp-expr   : NOT comp-expr
+        if self.current_tok.matches(TT_KEYWORD, 'not'):
+            op_tok = self.current_tok
+            res.register_advancement()
+            self.advance()
+            node = res.register(self.comp_expr())
+            if res.error: return res
+            return res.success(UnaryOpNode(op_tok, node))
+        else:
+            # comp-expr    : arith-expr ((EE|LT|GT|LTE|GTE) arith-expr)*
+            node = res.register(self.bin_op(self.arith_expr, (TT_EE, TT_NE, TT_LT, TT_GT, TT_LTE, TT_GTE)))
+            if res.error:
+                return res.failure(InvalidSyntaxError(
+                    self.current_tok.pos_start, self.current_tok.pos_end,
+                    "Expected int, float, identifier, '+', '-', '(' or 'not'"
+                ))
+            return res.success(node)
+
+    def arith_expr(self):
+        # arith-expr  : term ((PLUS|MINUS) term)*
+        return self.bin_op(self.term, (TT_PLUS, TT_MINUS))
+
+    def bin_op(self, func_a, ops, func_b=None):
+        if func_b == None:
+            func_b = func_a
+        res = ParserResult()
+        left = res.register((func_a()))  # 递归调用
+        if res.error: return res
+
+        while self.current_tok.type in ops or (self.current_tok.type, self.current_tok.value) in ops:
+            op_tok = self.current_tok
+            res.register_advancement()
+            self.advance()
+            right = res.register(func_b())
+            if res.error: return res
+            left = BinOpNode(left, op_tok, right)
+        return res.success(left)
+
+
+def bench_parse():
+    """语法分析耗时，Tokens预先生成，只计算Parser；与 main.parse 一样，解析期间暂停循环垃圾回收"""
+    scripts = (('statements', statement_list()), ('functions', big_script(2000)), ('expressions', expression_list()))
+    for name, text in scripts:
+        tokens, error = RegexLexer('<bench>', text).make_tokens()
+        check(None, error)
+        print(f'== parse: {name}, {len(tokens)} tokens')
+        for parser_class in (TowerParser, Parser):
+            gc.disable()
+            try:
+                cost = timeit(lambda: check(None, parser_class(tokens).parse().error), repeat=5)
+            finally:
+                gc.enable()
+            print(f'{parser_class.__name__:<12} {cost * 1000:>10.1f} ms  {len(tokens) / cost / 1e6:>6.2f} M tokens/s')
+
+
+OPERATOR_EXPRS = (
+    '3', # 只有字面量，作为对照
+    '3 + 2', '3 - 2', '3 * 2', '3 / 2', '3 ^ 2',
+    '3 == 2', '3 != 2', '3 < 2', '3 > 2', '3 <= 2', '3 >= 2',
+    '3 and 2', '3 or 2', '"a" + "b"', '[1] + 2', '-3', 'not 3',
+)
+
+
+def bench_ops(loops=20000):
+    """单个运算节点的耗时，只计算Interpreter.visit本身，不含词法、语法分析"""
+    print(f'== ops: cost per operator node ({loops} visits)')
+    interpreter = Interpreter()
+    context = Context('<bench>')
+    context.symbol_table = global_symbol_table
+    for expr in OPERATOR_EXPRS:
+        tokens, error = Lexer('<bench>', expr).make_tokens()
+        node = Parser(tokens).parse().node.element_nodes[0]
+        visit = interpreter.visit
+
+        def loop():
+            for _ in range(loops):
+                visit(node, context)
+
+        cost = timeit(loop, repeat=7)
+        print(f'{expr:<12} {cost / loops * 1e9:>8.0f} ns')
+
+
+FOLD_SCRIPT = '''
+var s = 0
+for i = 0 to 50000 then
+    var s = s + i * (60 * 60 * 24) / (2 ^ 10) - (3 - 2) * 1
+end
+s
+'''
+
+
+def bench_fold():
+    """循环体中包含常量子表达式，比较是否经过 optimizer.py 的常量折叠与代数化简"""
+    print('== fold: 50k iterations with constant subexpressions')
+    for mode in ('interpreter', 'vm'):
+        for optimize in (False, True):
+            cost = timeit(lambda: check(*run('<bench>', FOLD_SCRIPT, mode, optimize=optimize)))
+            label = f'{mode}{" optimized" if optimize else ""}'
+            print(f'{label:<22} {cost * 1000:>10.1f} ms')
+
+
+DCE_SCRIPT = '''
+var DEBUG = 0
+var s = 0
+for i = 0 to 50000 then
+    if 0 then print(i) elif DEBUG then print(s)
+    if 1 then var s = s + i else var s = s - i
+    continue
+    var s = s * 2
+end
+s
+'''
+
+
+def bench_dce():
+    """循环体中包含常量条件的分支与continue之后的死代码，比较是否经过死代码消除"""
+    print('== dce: 50k iterations with constant branches and unreachable statements')
+    for mode in ('interpreter', 'vm'):
+        for optimize in (False, True):
+            cost = timeit(lambda: check(*run('<bench>', DCE_SCRIPT, mode, optimize=optimize)))
+            label = f'{mode}{" optimized" if optimize else ""}'
+            print(f'{label:<22} {cost * 1000:>10.1f} ms')
+
+
+UNUSED_LOOP_SCRIPT = '''
+var res = 0
+for i = 0 to 200000 then var res = res + i
+res
+'''
+
+
+def bench_unused():
+    """值没有被使用的单行循环，比较是否收集每次循环的结果（耗时与内存峰值）"""
+    print('== unused: 200k iterations of a single-line loop whose value is discarded')
+    for mode in ('interpreter', 'vm'):
+        for optimize in (False, True):
+            script_run = lambda: check(*run('<bench>', UNUSED_LOOP_SCRIPT, mode, optimize=optimize))
+            cost = timeit(script_run)
+            tracemalloc.start()
+            script_run()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            label = f'{mode}{" optimized" if optimize else ""}'
+            print(f'{label:<22} {cost * 1000:>10.1f} ms {peak / 1024 / 1024:>8.1f} MB peak')
+
+
+LOOP_ITERATIONS = 200000
+
+# 初值为float时 loop_values 逐次比较、累加（stepped），都是int时使用range（counted）
+LOOP_SCRIPT = '''
+for i = 0{point} to {n} then i
+for i = {n}{point} to 0 step -1 then
+    if i == 7 then continue
+    i
+end
+0
+'''
+LOOP_SCRIPTS = {
+    'stepped': LOOP_SCRIPT.format(n=LOOP_ITERATIONS, point='.0'),
+    'counted': LOOP_SCRIPT.format(n=LOOP_ITERATIONS, point=''),
+}
+
+
+def visit_result(interpreter, node, context):
+    result = interpreter.visit(node, context)
+    return result.value, result.error
+
+
+def bench_loop():
+    """for循环本身的开销（循环体只有一个变量访问），单位：每秒循环次数"""
+    print(f'== loop: counted for loops, 2 x {LOOP_ITERATIONS} iterations')
+    nodes = {}
+    for name, script in LOOP_SCRIPTS.items():
+        node, error = parse('<bench>', script)
+        check(node, error)
+        nodes[name] = Optimizer().optimize_program(node)
+    iterations = 2 * LOOP_ITERATIONS
+    context = Context('<bench>')
+    context.symbol_table = global_symbol_table
+    interpreter = Interpreter()
+    best = {}
+    # 机器负载波动较大，两种循环交替执行，各取最快的一次
+    for _ in range(5):
+        for name, node in nodes.items():
+            cost = timeit(lambda: check(*visit_result(interpreter, node, context)), repeat=1)
+            best[name] = min(best.get(name, cost), cost)
+    for name, cost in best.items():
+        print(f'interpreter {name:<10} {iterations / cost:>12,.0f} iterations/s')
+    cost = timeit(lambda: check(*run('<bench>', LOOP_SCRIPTS['counted'], 'vm')), repeat=5)
+    print(f'{"vm counted":<22} {iterations / cost:>12,.0f} iterations/s')
+
+
+def bench_closure(loops=20):
+    """test_toypl.pl：遍历AST的解释器、编译成闭包、转译成python源码的对比，不含词法、语法分析，后两者包含编译"""
+    print(f'== closure: test_toypl.pl x {loops}')
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test_toypl.pl')) as f:
+        script = f.read()
+    node, error = parse('test_toypl.pl', script)
+    check(node, error)
+    node = Optimizer().optimize_program(node)
+    context = Context('<bench>')
+    context.symbol_table = global_symbol_table
+
+    def script_loop(make_backend):
+        for _ in range(loops):
+            check(*visit_result(make_backend(), node, context))
+
+    backends = (
+        ('interpreter', Interpreter),
+        ('closure', ClosureCompiler),
+        ('python', lambda: Transpiler('test_toypl.pl').transpile(node)),
+    )
+    for name, make_backend in backends:
+        cost = timeit(lambda: script_loop(make_backend), repeat=5)
+        print(f'{name:<12} {cost * 1000:>10.1f} ms')
+
+
+TIERED_SCRIPT = '''
+func scale(x) -> (x * 3 + 1) / 2
+func inner(n)
+    var s = 0
+    for j = 0 to n then var s = s + scale(j)
+    return s
+end
+var total = 0
+for i = 0 to 300 then var total = total + inner(40)
+total
+'''
+
+
+def bench_tiered():
+    """热点函数：解释器、全部转译成python、分层执行（不同升级阈值）的对比，顶层循环始终由解释器执行"""
+    print('== tiered: 300 calls of a 40-iteration loop calling a small function')
+    for mode in ('interpreter', 'python'):
+        cost = timeit(lambda: check(*run('<bench>', TIERED_SCRIPT, mode)))
+        print(f'{mode:<22} {cost * 1000:>10.1f} ms')
+    for threshold in (1, TieredInterpreter.HOT_THRESHOLD, 10000):
+        cost = timeit(lambda: check(*run('<bench>', TIERED_SCRIPT, 'tiered', tiered=TieredInterpreter('<bench>', threshold=threshold))))
+        print(f'{f"tiered threshold={threshold}":<22} {cost * 1000:>10.1f} ms')
+
+
+class GenericInterpreter(Interpreter):
+    """BinOpNode不做运行时特化"""
+
+    def quicken(self, node, left, right):
+        node.quick_count = -1
+
+
+def bench_quicken():
+    """BinOpNode运行时特化的效果，每次重新解析（特化会修改节点），两种实现交替执行，各取最快的一次"""
+    print('== quicken: interpreter with and without BinOpNode specialization')
+    for label, script in (('fib', FIB_SCRIPT), ('arith', ARITH_SCRIPT), ('while', WHILE_SCRIPT)):
+        best = {}
+        for _ in range(3):
+            for name, make_interpreter in (('generic', GenericInterpreter), ('quickened', Interpreter)):
+                interpreter = make_interpreter()
+                cost = timeit(lambda: check(*run('<bench>', script, interpreter=interpreter)), repeat=1)
+                best[name] = min(best.get(name, cost), cost)
+        print(f'{label:<8} generic {best["generic"] * 1000:>8.1f} ms  quickened {best["quickened"] * 1000:>8.1f} ms  '
+              f'({interpreter.specialized} specialized)')
+
+
+MEMO_FIB_SCRIPT = '''
+func Fib(n)
+    if n <= 2 then return 1
+    return Fib(n - 1) + Fib(n - 2)
+end
+%s
+Fib(22)
+'''
+
+
+def bench_memoize():
+    """递归Fib与 var Fib = memoize(Fib) 的对比"""
+    print('== memoize: Fib(22)')
+    for mode in ('interpreter', 'vm'):
+        for label, setup in (('plain', ''), ('memoized', 'var Fib = memoize(Fib)')):
+            cost = timeit(lambda: check(*run('<bench>', MEMO_FIB_SCRIPT % setup, mode)), repeat=3)
+            print(f'{mode:<12} {label:<10} {cost * 1000:>10.2f} ms')
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or [name[len('bench_'):] for name in list(globals()) if name.startswith('bench_')]
+    for name in names:
+        globals()[f'bench_{name}']()
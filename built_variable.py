@@ -23,3 +23,5 @@ global_symbol_table.set("append", BuiltInFunction.append)
 global_symbol_table.set("pop", BuiltInFunction.pop)
 global_symbol_table.set("extend", BuiltInFunction.extend)
 global_symbol_table.set("len", BuiltInFunction.len)
+global_symbol_table.set("memoize", BuiltInFunction.memoize)
+global_symbol_table.set("memo_stats", BuiltInFunction.memo_stats)
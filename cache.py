@@ -0,0 +1,115 @@
+import gc
+import os
+import sys
+import pickle
+import hashlib
+
+from flat_ast import FlatAST
+from position import SourceText
+
+
+####################
+# AST CACHE 语法树缓存
+# 与python的__pycache__类似，脚本解析得到的AST保存在脚本所在目录的 __toyplcache__ 中，
+# 再次执行同一个脚本时直接加载，跳过词法分析与语法分析
+# AST以 flat_ast.FlatAST 的形式保存：只有若干数组与常量池，不包含源码，加载时由当前脚本内容还原位置
+####################
+
+CACHE_DIR = '__toyplcache__'
+# AST节点、Token、Position等结构变化时需要修改版本号，旧的缓存会自动失效
+CACHE_VERSION = 4
+
+
+def source_key(fn, text):
+    """
+    缓存key：解释器版本 + python版本 + 文件名 + 脚本内容的sha256
+    文件名也会记录在Position中（报错时显示），所以也要参与计算
+    """
+    version = f'{CACHE_VERSION}|{sys.version_info[0]}.{sys.version_info[1]}|{fn}\0'
+    return hashlib.sha256((version + text).encode('utf-8')).hexdigest()
+
+
+class ASTCache(object):
+    """
+    每个脚本对应一个缓存文件 <脚本名>.ast，文件中保存 (key, FlatAST.to_bytes())
+    key与当前脚本不一致（脚本被修改、解释器版本变化）时视为未命中，重新解析后覆盖
+    """
+
+    def __init__(self, cache_dir):
+        """
+        :param cache_dir: 缓存目录
+        """
+        self.cache_dir = cache_dir
+        self.hits = 0 # 命中
+        self.misses = 0 # 未命中（没有缓存或缓存已过期）
+        self.invalid = 0 # 缓存文件损坏，无法加载
+        self.stores = 0 # 写入缓存
+
+    @classmethod
+    def for_script(cls, fn_path):
+        """缓存目录位于脚本所在目录"""
+        return cls(os.path.join(os.path.dirname(os.path.abspath(fn_path)), CACHE_DIR))
+
+    def path(self, fn):
+        return os.path.join(self.cache_dir, os.path.basename(fn) + '.ast')
+
+    def load(self, fn, text):
+        """
+        加载AST
+        :param fn: 文件名
+        :param text: 脚本内容
+        :return: 未命中返回None
+        """
+        path = self.path(fn)
+        # 与 RegexLexer.make_tokens 一样，加载大量节点时暂停循环垃圾回收
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            with open(path, 'rb') as f:
+                key, data = pickle.load(f)
+            if key != source_key(fn, text):
+                self.misses += 1
+                return None
+            node = FlatAST.from_bytes(data).to_node(SourceText(fn, text))
+        except OSError:
+            # 没有缓存文件，或缓存目录无法访问
+            self.misses += 1
+            return None
+        except Exception:
+            # 缓存文件损坏（写入中断、版本不兼容等），删除后重新解析
+            self.invalid += 1
+            self.misses += 1
+            self.remove(path)
+            return None
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+        self.hits += 1
+        return node
+
+    def store(self, fn, text, node):
+        """
+        写入AST，先写临时文件再替换，避免其他进程读到写了一半的缓存
+        缓存只是加速手段，写入失败（目录不可写、AST不是由RegexLexer生成等）时直接忽略
+        """
+        path = self.path(fn)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        try:
+            data = FlatAST.from_node(node).to_bytes()
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                pickle.dump((source_key(fn, text), data), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+            self.stores += 1
+        except (OSError, ValueError):
+            self.remove(tmp_path)
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def stats(self):
+        return f'cache: {self.hits} hits, {self.misses} misses, {self.invalid} invalid, {self.stores} stores'
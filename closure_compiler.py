@@ -0,0 +1,314 @@
+from function import *
+
+
+####################
+# CLOSURE COMPILER 闭包编译
+# 执行前遍历一次AST，每个节点编译成一个python闭包 closure(context) => 值，子节点的闭包在编译时就已绑定，
+# 执行时直接调用闭包，不再经过 Interpreter.visit 的 getattr 分派，也不再为每个节点创建RTResult
+# return/break/continue/尾调用/报错通过下面的异常跳出嵌套的闭包，在 ClosureCompiler.visit 中还原成RTResult，
+# 所以函数调用仍然通过 Function.execute，执行结果、报错与Interpreter完全相同
+####################
+
+class Signal(Exception):
+    """控制流异常的基类，闭包中抛出，ClosureCompiler.visit 中转换为RTResult"""
+
+    def to_result(self):
+        raise NotImplementedError
+
+
+class ReturnSignal(Signal):
+    def __init__(self, value):
+        self.value = value
+
+    def to_result(self):
+        return RTResult().success_return(self.value)
+
+
+class ContinueSignal(Signal):
+    def to_result(self):
+        return RTResult().success_continue()
+
+
+class BreakSignal(Signal):
+    def to_result(self):
+        return RTResult().success_break()
+
+
+class TailCallSignal(Signal):
+    def __init__(self, func, args):
+        self.func = func
+        self.args = args
+
+    def to_result(self):
+        return RTResult().success_tail_call(self.func, self.args)
+
+
+class ErrorSignal(Signal):
+    def __init__(self, error):
+        self.error = error
+
+    def to_result(self):
+        return RTResult().failure(self.error)
+
+
+def raise_for(res):
+    """
+    把 should_return() 为True的RTResult（如函数调用的结果）重新抛出为对应的异常
+    与 RTResult.should_return 的判断顺序一致
+    """
+    if res.error: raise ErrorSignal(res.error)
+    if res.func_return_value: raise ReturnSignal(res.func_return_value)
+    if res.loop_should_continue: raise ContinueSignal()
+    if res.loop_should_break: raise BreakSignal()
+    raise TailCallSignal(*res.tail_call)
+
+
+class ClosureCompiler(object):
+    """
+    与Interpreter的接口相同：visit(node, context) => RTResult，可以直接传给 Function.execute
+    ClosureCompiler类方法名的规则: "compile_" + ast_node.py中的类名，返回该节点的闭包
+    """
+
+    def __init__(self, executor=None):
+        """
+        :param executor: 调用函数时传给 Function.execute 的对象，为None时是自身（TieredInterpreter 传入自身，见 tiered.py）
+        """
+        # 已编译的节点 => 闭包，函数体在定义函数的节点编译时一起编译，调用函数时直接取出
+        self.closures = {}
+        self.executor = executor or self
+
+    def visit(self, node, context):
+        """
+        执行节点，节点没有编译过时先编译（例如之前的脚本中定义、保存在全局符号表中的函数）
+        :return: RTResult
+        """
+        closure = self.closures.get(node)
+        if closure is None:
+            closure = self.compile(node)
+        try:
+            return RTResult().success(closure(context))
+        except Signal as signal:
+            return signal.to_result()
+
+    def execute_function(self, func, context):
+        """见 Interpreter.execute_function"""
+        return self.visit(func.body_node, context)
+
+    def compile(self, node):
+        method_name = f'compile_{type(node).__name__}'
+        method = getattr(self, method_name, self.no_compile_method)
+        closure = self.closures[node] = method(node)
+        return closure
+
+    def no_compile_method(self, node):
+        raise Exception(f'No compile_{type(node).__name__} method defined')
+
+    #########  字面量与变量  ###########
+
+    def compile_NumberNode(self, node):
+        value = node.value
+
+        def number(context):
+            return value
+        return number
+
+    compile_StringNode = compile_NumberNode
+
+    def compile_ListNode(self, node):
+        element_closures = [self.compile(element_node) for element_node in node.element_nodes]
+
+        def list_(context):
+            return List([element(context) for element in element_closures])
+        return list_
+
+    def compile_VarAccessNode(self, node):
+        var_name = node.var_name_tok.value
+        pos_start, pos_end = node.pos_start, node.pos_end
+
+        def var_access(context):
+            value = context.symbol_table.get(var_name)
+            if not value:
+                raise ErrorSignal(RTError(pos_start, pos_end, f"{var_name} is not defined", context))
+            # 见 Interpreter.visit_VarAccessNode
+            return value.copy()
+        return var_access
+
+    def compile_VarAssignNode(self, node):
+        var_name = node.var_name_tok.value
+        value_closure = self.compile(node.value_node)
+
+        def var_assign(context):
+            value = value_closure(context)
+            context.symbol_table.set(var_name, value)
+            return value
+        return var_assign
+
+    #########  运算  ###########
+
+    def compile_BinOpNode(self, node):
+        left_closure = self.compile(node.left_node)
+        right_closure = self.compile(node.right_node)
+        operator = node.operator
+
+        if operator is None:
+            def unsupported(context):
+                left_closure(context)
+                right_closure(context)
+                raise ErrorSignal(RTError(node.pos_start, node.pos_end, f"{node.op_tok.type} is not suppert", context))
+            return unsupported
+
+        table = operator.table
+        generic = operator.generic
+
+        def bin_op(context):
+            left = left_closure(context)
+            right = right_closure(context)
+            operate = table.get((type(left), type(right)))
+            if operate is None:
+                result, error = generic(left, right)
+            else:
+                result, error = operate(left, right)
+            if error:
+                # 见 Interpreter.visit_BinOpNode
+                span = node.right_node if error.at_right_operand else node
+                raise ErrorSignal(error.locate(span.pos_start, span.pos_end, context))
+            return result
+        return bin_op
+
+    # 由Interpreter特化过的节点（TieredInterpreter升级函数时），按通用的BinOpNode处理
+    compile_QuickBinOpNode = compile_BinOpNode
+
+    def compile_UnaryOpNode(self, node):
+        operand_closure = self.compile(node.node)
+        table = node.operator.table
+        generic = node.operator.generic
+
+        def unary_op(context):
+            operand = operand_closure(context)
+            result, error = table.get(type(operand), generic)(operand)
+            if error:
+                raise ErrorSignal(error.locate(node.pos_start, node.pos_end, context))
+            return result
+        return unary_op
+
+    #########  控制流  ###########
+
+    def compile_IfNode(self, node):
+        cases = [(self.compile(condition), self.compile(expr), should_return_null)
+                 for condition, expr, should_return_null in node.case]
+        if node.else_case:
+            else_closure = self.compile(node.else_case[0])
+            else_return_null = node.else_case[1]
+        else:
+            else_closure = None
+
+        def if_(context):
+            for condition, expr, should_return_null in cases:
+                if condition(context).is_true():
+                    value = expr(context)
+                    return Number.null if should_return_null else value
+            if else_closure:
+                value = else_closure(context)
+                return Number.null if else_return_null else value
+            return Number.null
+        return if_
+
+    def compile_ForNode(self, node):
+        start_closure = self.compile(node.start_value_node)
+        end_closure = self.compile(node.end_value_node)
+        step_closure = self.compile(node.step_value_node) if node.step_value_node else None
+        body_closure = self.compile(node.body_node)
+        var_name = node.var_name_tok.value
+        collect = not (node.should_return_null or node.result_unused)
+
+        def for_(context):
+            start_value = start_closure(context)
+            end_value = end_closure(context)
+            step_value = step_closure(context) if step_closure else make_number(1)
+            # 见 Interpreter.visit_ForNode
+            symbols = context.symbol_table.symbols
+            elements = []
+            for i in loop_values(start_value.value, end_value.value, step_value.value):
+                symbols[var_name] = make_number(i)
+                try:
+                    value = body_closure(context)
+                except ContinueSignal:
+                    continue
+                except BreakSignal:
+                    break
+                if collect:
+                    elements.append(value)
+            return List(elements) if collect else Number.null
+        return for_
+
+    def compile_WhileNode(self, node):
+        condition_closure = self.compile(node.condition_node)
+        body_closure = self.compile(node.body_node)
+        collect = not (node.should_return_null or node.result_unused)
+
+        def while_(context):
+            elements = []
+            # 条件中的continue/break不属于这个循环，不在try中执行
+            while condition_closure(context).is_true():
+                try:
+                    value = body_closure(context)
+                except ContinueSignal:
+                    continue
+                except BreakSignal:
+                    break
+                if collect:
+                    elements.append(value)
+            return List(elements) if collect else Number.null
+        return while_
+
+    def compile_ReturnNode(self, node):
+        value_closure = self.compile(node.node_to_return) if node.node_to_return else None
+
+        def return_(context):
+            raise ReturnSignal(value_closure(context) if value_closure else Number.null)
+        return return_
+
+    def compile_ContinueNode(self, node):
+        def continue_(context):
+            raise ContinueSignal()
+        return continue_
+
+    def compile_BreakNode(self, node):
+        def break_(context):
+            raise BreakSignal()
+        return break_
+
+    #########  函数  ###########
+
+    def compile_FuncNode(self, node):
+        func_name = node.var_name_tok.value if node.var_name_tok else None
+        body_node = node.body_node
+        arg_names = [arg_name.value for arg_name in node.arg_name_toks]
+        should_auto_return = node.should_auto_return
+        # 函数体执行时由 Function.execute 调用 self.visit(body_node, ...)，从self.closures中取出
+        self.compile(body_node)
+
+        def func(context):
+            func_value = Function(func_name, body_node, arg_names, should_auto_return).set_context(context).set_pos(node.pos_start, node.pos_end)
+            if func_name:
+                context.symbol_table.set(func_name, func_value)
+            return func_value
+        return func
+
+    def compile_CallNode(self, node):
+        callee_closure = self.compile(node.node_to_call)
+        arg_closures = [self.compile(arg_node) for arg_node in node.arg_nodes]
+        is_tail_call = node.is_tail_call
+        pos_start, pos_end = node.pos_start, node.pos_end
+        executor = self.executor
+
+        def call(context):
+            value_to_call = callee_closure(context).copy().set_pos(pos_start, pos_end).set_context(context)
+            args = [arg(context) for arg in arg_closures]
+            if is_tail_call:
+                # 见 Interpreter.visit_CallNode
+                raise TailCallSignal(value_to_call, args)
+            res = value_to_call.execute(args, executor)
+            if res.should_return(): raise_for(res)
+            return res.value
+        return call
@@ -0,0 +1,331 @@
+from opcodes import *
+from resolver import LOCAL_NAMES
+from type_operate import make_number
+
+
+####################
+# CODE OBJECT 字节码对象
+####################
+
+class CodeObject(object):
+    """
+    编译后的字节码，ops/args/positions 为三个平行数组
+    """
+    def __init__(self, name, arg_names=None, should_auto_return=False, local_names=None):
+        """
+        :param name: 函数名，顶层程序为 <program>
+        :param arg_names: 函数参数名
+        :param should_auto_return: 是否自动返回函数体的值（-> 形式的函数）
+        :param local_names: 局部变量名（Resolver计算），下标即Frame中的槽位
+        """
+        self.name = name
+        self.arg_names = arg_names or []
+        self.should_auto_return = should_auto_return
+        self.local_names = local_names or []
+        self.slot_map = {name: slot for slot, name in enumerate(self.local_names)}
+        self.ops = [] # 指令
+        self.args = [] # 指令参数
+        self.positions = [] # 指令对应的 (pos_start, pos_end)，用于报错
+        self.operand_positions = {} # BINARY_OP指令右操作数的位置，除数为0等错误定位到右操作数
+        self.constants = [] # 常量池
+        self.const_index = {} # id(常量) -> 下标
+
+    def add_const(self, value):
+        """常量池中同一个对象只保存一次（小整数缓存让相同的字面量共享同一个Number）"""
+        index = self.const_index.get(id(value))
+        if index is None:
+            index = self.const_index[id(value)] = len(self.constants)
+            self.constants.append(value)
+        return index
+
+    def disassemble(self):
+        """
+        反汇编，便于调试
+        :return:
+        """
+        lines = []
+        for pc, (op, arg) in enumerate(zip(self.ops, self.args)):
+            if op == LOAD_CONST or op == MAKE_FUNCTION:
+                arg = f'{arg} ({self.constants[arg]!r})'
+            lines.append(f'{pc:>4} {OPNAMES[op]:<18} {"" if arg is None else arg}')
+        return '\n'.join(lines)
+
+    def __repr__(self):
+        return f'<code {self.name}>'
+
+
+####################
+# COMPILER 编译器
+####################
+
+class Compiler(object):
+    """
+    将Parser生成的AST编译成字节码
+    Compiler类方法名的规则: "compile_" + ast_node.py中的类名
+    """
+
+    # 每条指令对栈深度的影响，用于break/continue时清理栈
+    STACK_EFFECT = {
+        LOAD_CONST: 1, LOAD_NAME: 1, STORE_NAME: 0, LOAD_NULL: 1, POP_TOP: -1,
+        LOAD_FAST: 1, STORE_FAST: 0, LOAD_GLOBAL: 1,
+        BINARY_OP: -1, UNARY_OP: 0, JUMP: 0, POP_JUMP_IF_FALSE: -1,
+        LIST_NEW: 1, LIST_APPEND: -1, LIST_BUILD: 0, FOR_PREP: -2, FOR_ITER: 0,
+        MAKE_FUNCTION: 1, RETURN_VALUE: -1, END: -1,
+    }
+
+    def __init__(self):
+        self.code = None
+        self.depth = 0 # 当前栈深度
+        self.loops = [] # 循环信息 [(continue_target, break_jumps, depth)]
+        self.in_function = False # 是否在编译函数体
+
+    def compile(self, node, name='<program>', arg_names=None, should_auto_return=False, local_names=None):
+        """
+        编译整个程序或函数体，AST需要先经过 Resolver 处理
+        :param node: AST根节点
+        :return: CodeObject
+        """
+        outer = (self.code, self.depth, self.loops, self.in_function)
+        self.code = CodeObject(name, arg_names, should_auto_return, local_names)
+        self.depth = 0
+        self.loops = []
+        self.in_function = arg_names is not None
+
+        self.visit(node)
+        self.emit(END)
+
+        code = self.code
+        self.code, self.depth, self.loops, self.in_function = outer
+        return code
+
+    def visit(self, node):
+        method_name = f'compile_{type(node).__name__}'
+        method = getattr(self, method_name, self.no_compile_method)
+        return method(node)
+
+    def no_compile_method(self, node):
+        raise Exception(f'No compile_{type(node).__name__} method defined')
+
+    def emit(self, op, arg=None, node=None):
+        """
+        写入一条指令
+        :return: 指令所在位置，便于回填跳转地址
+        """
+        code = self.code
+        code.ops.append(op)
+        code.args.append(arg)
+        code.positions.append((node.pos_start, node.pos_end) if node else None)
+
+        if op == BUILD_LIST:
+            self.depth += 1 - arg
+        elif op == CALL or op == TAIL_CALL:
+            self.depth -= arg
+        else:
+            self.depth += self.STACK_EFFECT[op]
+        return len(code.ops) - 1
+
+    def add_const(self, value):
+        return self.code.add_const(value)
+
+    def patch(self, pc, target=None):
+        """回填跳转地址"""
+        self.code.args[pc] = len(self.code.ops) if target is None else target
+
+    def pop_to(self, depth, node):
+        """弹出多余的栈元素，直到栈深度为depth"""
+        for _ in range(self.depth - depth):
+            self.emit(POP_TOP, node=node)
+
+    def compile_NumberNode(self, node):
+        self.emit(LOAD_CONST, self.add_const(node.value), node)
+
+    def compile_StringNode(self, node):
+        self.emit(LOAD_CONST, self.add_const(node.value), node)
+
+    def compile_ListNode(self, node):
+        for element_node in node.element_nodes:
+            self.visit(element_node)
+        self.emit(BUILD_LIST, len(node.element_nodes), node)
+
+    def compile_VarAccessNode(self, node):
+        name = node.var_name_tok.value
+        if node.slot is None:
+            # 函数中的名字如果没有被任何函数绑定过，调用者的Frame中一定没有，不需要沿调用者链查找
+            self.emit(LOAD_GLOBAL if self.in_function and name not in LOCAL_NAMES else LOAD_NAME, name, node)
+        else:
+            self.emit(LOAD_FAST, node.slot, node)
+
+    def compile_VarAssignNode(self, node):
+        self.visit(node.value_node)
+        self.emit_store(node.var_name_tok.value, node.slot, node)
+
+    def emit_store(self, name, slot, node):
+        if slot is None:
+            self.emit(STORE_NAME, name, node)
+        else:
+            self.emit(STORE_FAST, slot, node)
+
+    def compile_BinOpNode(self, node):
+        self.visit(node.left_node)
+        self.visit(node.right_node)
+        pc = self.emit(BINARY_OP, node.operator, node)
+        self.code.operand_positions[pc] = (node.right_node.pos_start, node.right_node.pos_end)
+
+    def compile_UnaryOpNode(self, node):
+        self.visit(node.node)
+        self.emit(UNARY_OP, node.operator, node)
+
+    def compile_IfNode(self, node):
+        """
+        if c1 then e1 elif c2 then e2 else e3 =>
+            <c1> POP_JUMP_IF_FALSE L1 <e1> JUMP END
+        L1: <c2> POP_JUMP_IF_FALSE L2 <e2> JUMP END
+        L2: <e3>
+        END:
+        """
+        end_jumps = []
+        depth = self.depth
+
+        for condition, expr, should_return_null in node.case:
+            self.visit(condition)
+            next_jump = self.emit(POP_JUMP_IF_FALSE, node=condition)
+            self.compile_branch(expr, should_return_null)
+            end_jumps.append(self.emit(JUMP))
+            self.patch(next_jump)
+            self.depth = depth
+
+        if node.else_case:
+            expr, should_return_null = node.else_case
+            self.compile_branch(expr, should_return_null)
+        else:
+            self.emit(LOAD_NULL)
+
+        for pc in end_jumps:
+            self.patch(pc)
+
+    def compile_branch(self, expr, should_return_null):
+        self.visit(expr)
+        if should_return_null:
+            self.emit(POP_TOP)
+            self.emit(LOAD_NULL)
+
+    def compile_ForNode(self, node):
+        """
+        [LIST_NEW] <start> <end> <step> FOR_PREP
+        ITER:  FOR_ITER (var, slot, END) <body> LIST_APPEND|POP_TOP JUMP ITER
+        BREAK: POP_TOP
+        END:   LIST_BUILD|LOAD_NULL
+        """
+        collect = not (node.should_return_null or node.result_unused)
+        if collect:
+            self.emit(LIST_NEW)
+
+        self.visit(node.start_value_node)
+        self.visit(node.end_value_node)
+        if node.step_value_node:
+            self.visit(node.step_value_node)
+        else:
+            self.emit(LOAD_CONST, self.add_const(make_number(1)))
+        self.emit(FOR_PREP, node=node)
+
+        loop_start = len(self.code.ops)
+        iter_pc = self.emit(FOR_ITER, None, node)
+        # 收集器在循环状态之下
+        break_jumps = self.compile_loop_body(node, loop_start, collect, 2)
+        self.emit(JUMP, loop_start)
+
+        for pc in break_jumps:
+            self.patch(pc)
+        self.emit(POP_TOP) # 弹出循环状态
+        self.code.args[iter_pc] = (node.var_name_tok.value, node.var_slot, len(self.code.ops))
+        self.finish_loop(node, collect)
+
+    def compile_WhileNode(self, node):
+        """
+        [LIST_NEW]
+        COND: <condition> POP_JUMP_IF_FALSE END <body> LIST_APPEND|POP_TOP JUMP COND
+        END:  LIST_BUILD|LOAD_NULL
+        """
+        collect = not (node.should_return_null or node.result_unused)
+        if collect:
+            self.emit(LIST_NEW)
+
+        loop_start = len(self.code.ops)
+        self.visit(node.condition_node)
+        exit_jump = self.emit(POP_JUMP_IF_FALSE, node=node.condition_node)
+        break_jumps = self.compile_loop_body(node, loop_start, collect, 1)
+        self.emit(JUMP, loop_start)
+
+        self.patch(exit_jump)
+        for pc in break_jumps:
+            self.patch(pc)
+        self.finish_loop(node, collect)
+
+    def compile_loop_body(self, node, loop_start, collect, collector_offset):
+        """
+        编译循环体
+        :param collector_offset: 循环体的值出栈后，收集器在栈中的位置 stack[-collector_offset]
+        :return: break对应的跳转指令，由调用方回填
+        """
+        break_jumps = []
+        self.loops.append((loop_start, break_jumps, self.depth))
+        self.visit(node.body_node)
+        self.loops.pop()
+
+        if collect:
+            self.emit(LIST_APPEND, collector_offset)
+        else:
+            self.emit(POP_TOP)
+        return break_jumps
+
+    def finish_loop(self, node, collect):
+        if collect:
+            self.emit(LIST_BUILD, node=node)
+        else:
+            self.emit(LOAD_NULL)
+
+    def compile_FuncNode(self, node):
+        func_name = node.var_name_tok.value if node.var_name_tok else None
+        arg_names = [arg_name.value for arg_name in node.arg_name_toks]
+        # 函数体单独编译成CodeObject，保存在常量池中
+        code = Compiler().compile(node.body_node, func_name, arg_names, node.should_auto_return, node.local_names)
+        self.emit(MAKE_FUNCTION, self.add_const(code), node)
+        if node.var_name_tok:
+            self.emit_store(func_name, node.var_slot, node)
+
+    def compile_CallNode(self, node):
+        self.visit(node.node_to_call)
+        for arg_node in node.arg_nodes:
+            self.visit(arg_node)
+        self.emit(TAIL_CALL if node.is_tail_call else CALL, len(node.arg_nodes), node)
+
+    def compile_ReturnNode(self, node):
+        depth = self.depth
+        if node.node_to_return:
+            self.visit(node.node_to_return)
+        else:
+            self.emit(LOAD_NULL)
+        self.emit(RETURN_VALUE, node=node)
+        # return 之后的代码不可达，但return在语法上是表达式，这里按产生一个值来统计栈深度
+        self.depth = depth + 1
+
+    def compile_ContinueNode(self, node):
+        self.compile_loop_jump(node, is_break=False)
+
+    def compile_BreakNode(self, node):
+        self.compile_loop_jump(node, is_break=True)
+
+    def compile_loop_jump(self, node, is_break):
+        depth = self.depth
+        if not self.loops:
+            # 循环外的 break/continue，直接结束当前函数（程序）
+            self.emit(LOAD_NULL)
+            self.emit(RETURN_VALUE, node=node)
+        else:
+            loop_start, break_jumps, loop_depth = self.loops[-1]
+            self.pop_to(loop_depth, node)
+            if is_break:
+                break_jumps.append(self.emit(JUMP, node=node))
+            else:
+                self.emit(JUMP, loop_start, node)
+        self.depth = depth + 1
@@ -13,4 +13,5 @@ class Context(object):
         self.display_name = display_name
         self.parent = parent
         self.parent_entry_pos = parent_entry_pos
-        self.symbol_table = None # 符号表
\ No newline at end of file
+        self.symbol_table = None # 符号表
+        self.frame = None # 局部变量帧，VM执行函数时使用（见symbol_table.Frame）
\ No newline at end of file
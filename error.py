@@ -49,6 +49,20 @@ class RTError(Error):
     def __init__(self, pos_start, pos_end, detail, context):
         super().__init__(pos_start, pos_end, "Runtime Error", detail)
         self.context = context
+        # 是否由右操作数引起（如除数为0），决定 locate 时使用哪个节点的位置
+        self.at_right_operand = False
+
+    def locate(self, pos_start, pos_end, context):
+        """
+        运行时的值不记录位置，值运算产生的错误由执行它的节点补全位置与上下文
+        :return: self
+        """
+        if self.pos_start is None:
+            self.pos_start = pos_start
+            self.pos_end = pos_end
+        if self.context is None:
+            self.context = context
+        return self
 
     def as_string(self):
         result = self.generate_traceback()
@@ -0,0 +1,309 @@
+import marshal
+from array import array
+
+from tokens import Token
+from ast_node import *
+from position import OffsetPosition, EndPosition
+
+
+####################
+# FLAT AST 扁平化的AST
+# AST节点按后序（子节点在前）编号，节点的类型、位置、子节点都保存在并行的数组中，
+# Token的类型与值保存在常量池中。遍历时只需要按下标访问数组，不需要为每个节点创建对象；
+# 数组可以直接转换成bytes，用于 cache.py 的AST缓存
+####################
+
+# 节点类型 => kinds数组中的编号
+NODE_CLASSES = (
+    NumberNode, StringNode, ListNode, VarAccessNode, VarAssignNode, BinOpNode, UnaryOpNode,
+    IfNode, ForNode, WhileNode, FuncNode, CallNode, ReturnNode, ContinueNode, BreakNode,
+)
+(
+    NUMBER, STRING, LIST, VAR_ACCESS, VAR_ASSIGN, BIN_OP, UNARY_OP,
+    IF, FOR, WHILE, FUNC, CALL, RETURN, CONTINUE, BREAK,
+) = range(len(NODE_CLASSES))
+NODE_KINDS = {node_class: kind for kind, node_class in enumerate(NODE_CLASSES)}
+
+# pos_flags 中的标记：位置为 EndPosition（否则为 OffsetPosition）
+POS_START_END = 1
+POS_END_END = 2
+
+# 序列化格式的版本号
+FLAT_VERSION = 1
+
+# 序列化时数组的顺序
+ARRAY_FIELDS = (
+    'kinds', 'pos_start', 'pos_end', 'pos_flags', 'child_start', 'children', 'operands', 'extra',
+    'tok_types', 'tok_values', 'tok_start', 'tok_end',
+)
+
+
+class FlatAST(object):
+    """
+    节点i：
+        kinds[i]        节点类型，见 NODE_CLASSES
+        pos_start[i]    起始位置的偏移量，pos_end[i] 同理，pos_flags[i] 记录位置的类型
+        children[child_start[i]:child_start[i + 1]]  子节点的下标，顺序与 ast_node.child_nodes 相同
+        operands[i]     与节点类型相关的整数：
+                        NUMBER、STRING、VAR_ACCESS、VAR_ASSIGN、BIN_OP、UNARY_OP => Token下标
+                        WHILE => should_return_null，CALL => is_tail_call
+                        IF、FOR、FUNC => extra中的起始下标
+        extra           IF   => [分支个数, 每个分支的should_return_null..., else分支的should_return_null（没有else为-1）]
+                        FOR  => [循环变量Token下标, 是否有step, should_return_null]
+                        FUNC => [函数名Token下标（匿名函数为-1）, should_auto_return, 参数个数, 参数Token下标...]
+    Token j：
+        tok_types[j]、tok_values[j]  常量池constants中的下标，值为None时为-1
+        tok_start[j]、tok_end[j]     起始、结束位置的偏移量
+    最后一个节点为根节点
+    """
+
+    def __init__(self):
+        self.kinds = array('B')
+        self.pos_start = array('i')
+        self.pos_end = array('i')
+        self.pos_flags = array('B')
+        self.child_start = array('i', [0])
+        self.children = array('i')
+        self.operands = array('i')
+        self.extra = array('i')
+        self.tok_types = array('i')
+        self.tok_values = array('i')
+        self.tok_start = array('i')
+        self.tok_end = array('i')
+        self.constants = []
+
+    def __len__(self):
+        return len(self.kinds)
+
+    @property
+    def root(self):
+        return len(self.kinds) - 1
+
+    def child_indexes(self, index):
+        """节点index的子节点下标"""
+        return self.children[self.child_start[index]:self.child_start[index + 1]]
+
+    def token_type(self, tok):
+        return self.constants[self.tok_types[tok]]
+
+    def token_value(self, tok):
+        value = self.tok_values[tok]
+        return None if value < 0 else self.constants[value]
+
+    #########  AST => FlatAST  ###########
+
+    @classmethod
+    def from_node(cls, node):
+        """
+        由Parser生成的AST构建FlatAST
+        位置必须是 RegexLexer 生成的 OffsetPosition/EndPosition，只需要保存偏移量
+        :param node: AST根节点
+        :return: FlatAST
+        """
+        return FlatEncoder().encode(node)
+
+    #########  FlatAST => AST  ###########
+
+    def to_node(self, source):
+        """
+        还原成AST对象，节点按后序编号，所以子节点总是先于父节点创建
+        :param source: SourceText，还原出的位置都引用它
+        :return: AST根节点
+        """
+        kinds = self.kinds
+        child_start = self.child_start
+        children = self.children
+        operands = self.operands
+        extra = self.extra
+        tokens = self.make_tokens(source)
+        nodes = []
+        append = nodes.append
+
+        for i in range(len(kinds)):
+            kind = kinds[i]
+            kids = [nodes[j] for j in children[child_start[i]:child_start[i + 1]]]
+            operand = operands[i]
+
+            if kind == BIN_OP:
+                node = BinOpNode(kids[0], tokens[operand], kids[1])
+            elif kind == VAR_ACCESS:
+                node = VarAccessNode(tokens[operand])
+            elif kind == NUMBER:
+                node = NumberNode(tokens[operand])
+            elif kind == CALL:
+                node = CallNode(kids[0], kids[1:])
+                node.is_tail_call = bool(operand)
+            elif kind == LIST:
+                node = ListNode(kids, *self.positions(i, source))
+            elif kind == VAR_ASSIGN:
+                node = VarAssignNode(tokens[operand], kids[0])
+            elif kind == STRING:
+                node = StringNode(tokens[operand])
+            elif kind == UNARY_OP:
+                node = UnaryOpNode(tokens[operand], kids[0])
+            elif kind == IF:
+                case_count = extra[operand]
+                cases = [(kids[2 * c], kids[2 * c + 1], bool(extra[operand + 1 + c])) for c in range(case_count)]
+                else_flag = extra[operand + 1 + case_count]
+                node = IfNode(cases, None if else_flag < 0 else (kids[-1], bool(else_flag)))
+            elif kind == FOR:
+                var_tok, has_step, should_return_null = extra[operand:operand + 3]
+                step = kids[2] if has_step else None
+                node = ForNode(tokens[var_tok], kids[0], kids[1], step, kids[-1], bool(should_return_null))
+            elif kind == WHILE:
+                node = WhileNode(kids[0], kids[1], bool(operand))
+            elif kind == FUNC:
+                name_tok, should_auto_return, arg_count = extra[operand:operand + 3]
+                arg_toks = [tokens[t] for t in extra[operand + 3:operand + 3 + arg_count]]
+                node = FuncNode(None if name_tok < 0 else tokens[name_tok], arg_toks, kids[0], bool(should_auto_return))
+            elif kind == RETURN:
+                node = ReturnNode(kids[0] if kids else None, *self.positions(i, source))
+            elif kind == CONTINUE:
+                node = ContinueNode(*self.positions(i, source))
+            elif kind == BREAK:
+                node = BreakNode(*self.positions(i, source))
+            else:
+                raise ValueError(f'Unknown node kind {kind}')
+            append(node)
+
+        return nodes[-1]
+
+    def make_tokens(self, source):
+        constants = self.constants
+        tokens = []
+        for tok_type, tok_value, start, end in zip(self.tok_types, self.tok_values, self.tok_start, self.tok_end):
+            token = Token(constants[tok_type], None if tok_value < 0 else constants[tok_value])
+            token.pos_start = OffsetPosition(start, source)
+            token.pos_end = EndPosition(end, source)
+            tokens.append(token)
+        return tokens
+
+    def positions(self, index, source):
+        """节点index的 (pos_start, pos_end)"""
+        flags = self.pos_flags[index]
+        pos_start = (EndPosition if flags & POS_START_END else OffsetPosition)(self.pos_start[index], source)
+        pos_end = (EndPosition if flags & POS_END_END else OffsetPosition)(self.pos_end[index], source)
+        return pos_start, pos_end
+
+    #########  序列化  ###########
+
+    def to_bytes(self):
+        fields = [getattr(self, name).tobytes() for name in ARRAY_FIELDS]
+        return marshal.dumps((FLAT_VERSION, fields, self.constants))
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        :param data: to_bytes的结果
+        :return: FlatAST，版本不一致时抛出ValueError
+        """
+        version, fields, constants = marshal.loads(data)
+        if version != FLAT_VERSION:
+            raise ValueError(f'Unsupported flat AST version {version}')
+        flat = cls()
+        for name, field in zip(ARRAY_FIELDS, fields):
+            values = array(getattr(flat, name).typecode)
+            values.frombytes(field)
+            setattr(flat, name, values)
+        flat.constants = constants
+        return flat
+
+
+class FlatEncoder(object):
+    """后序遍历AST，写入FlatAST的各个数组；使用显式的栈，嵌套很深的AST也不会超出python的递归上限"""
+
+    def __init__(self):
+        self.flat = FlatAST()
+        self.constant_index = {} # (type, value) => 常量池下标，1与1.0要区分开
+        self.token_index = {} # id(Token) => Token下标，多个节点共享的Token只保存一次
+
+    def encode(self, root):
+        flat = self.flat
+        indexes = [] # 已编号的子节点下标
+        stack = [(root, False)]
+        while stack:
+            node, expanded = stack.pop()
+            kids = child_nodes(node)
+            if not expanded:
+                stack.append((node, True))
+                stack.extend((kid, False) for kid in reversed(kids))
+                continue
+            # 子节点都已经编号，依次位于indexes的末尾
+            if kids:
+                kid_indexes = indexes[-len(kids):]
+                del indexes[-len(kids):]
+            else:
+                kid_indexes = []
+            indexes.append(self.add_node(node, kid_indexes))
+        return flat
+
+    def add_node(self, node, kid_indexes):
+        flat = self.flat
+        kind = NODE_KINDS[type(node)]
+        flat.kinds.append(kind)
+        flags = 0
+        flat.pos_start.append(self.offset(node.pos_start))
+        if isinstance(node.pos_start, EndPosition): flags |= POS_START_END
+        flat.pos_end.append(self.offset(node.pos_end))
+        if isinstance(node.pos_end, EndPosition): flags |= POS_END_END
+        flat.pos_flags.append(flags)
+        flat.children.extend(kid_indexes)
+        flat.child_start.append(len(flat.children))
+        flat.operands.append(self.operand(kind, node))
+        return len(flat.kinds) - 1
+
+    def operand(self, kind, node):
+        extra = self.flat.extra
+        if kind in (NUMBER, STRING):
+            return self.token(node.tok)
+        if kind in (VAR_ACCESS, VAR_ASSIGN):
+            return self.token(node.var_name_tok)
+        if kind in (BIN_OP, UNARY_OP):
+            return self.token(node.op_tok)
+        if kind == CALL:
+            return int(node.is_tail_call)
+        if kind == WHILE:
+            return int(node.should_return_null)
+        if kind == IF:
+            start = len(extra)
+            extra.append(len(node.case))
+            extra.extend(int(should_return_null) for _, _, should_return_null in node.case)
+            extra.append(-1 if node.else_case is None else int(node.else_case[1]))
+            return start
+        if kind == FOR:
+            start = len(extra)
+            extra.extend((self.token(node.var_name_tok), int(node.step_value_node is not None), int(node.should_return_null)))
+            return start
+        if kind == FUNC:
+            name_tok = -1 if node.var_name_tok is None else self.token(node.var_name_tok)
+            arg_toks = [self.token(tok) for tok in node.arg_name_toks]
+            start = len(extra)
+            extra.extend((name_tok, int(node.should_auto_return), len(arg_toks)))
+            extra.extend(arg_toks)
+            return start
+        return 0
+
+    def token(self, tok):
+        index = self.token_index.get(id(tok))
+        if index is None:
+            flat = self.flat
+            index = self.token_index[id(tok)] = len(flat.tok_types)
+            flat.tok_types.append(self.constant(tok.type))
+            flat.tok_values.append(-1 if tok.value is None else self.constant(tok.value))
+            flat.tok_start.append(self.offset(tok.pos_start))
+            flat.tok_end.append(self.offset(tok.pos_end))
+        return index
+
+    def constant(self, value):
+        key = (type(value), value)
+        index = self.constant_index.get(key)
+        if index is None:
+            index = self.constant_index[key] = len(self.flat.constants)
+            self.flat.constants.append(value)
+        return index
+
+    def offset(self, pos):
+        if not isinstance(pos, OffsetPosition):
+            # Lexer生成的Position带有行号、列号，不能只用偏移量表示
+            raise ValueError('Flat AST requires positions from RegexLexer')
+        return pos.idx
@@ -1,16 +1,31 @@
 import os
+from collections import OrderedDict
 
-from symbol_table import SymbolTable
+from symbol_table import SymbolTable, Frame
 from result import RTResult
 from context import Context
 from type_operate import *
 from error import *
+from ast_node import VarAccessNode, VarAssignNode, ForNode, FuncNode, child_nodes
+from opcodes import LOAD_NAME, LOAD_GLOBAL, MAKE_FUNCTION
 
 
 class BaseFunction(Value):
     def __init__(self, name):
         super().__init__()
         self.name = name or "<anonymous>"
+        # 函数对象仍然记录调用位置与调用者的上下文，用于创建函数上下文与生成错误栈
+        self.set_pos()
+        self.set_context()
+
+    def set_pos(self, pos_start=None, pos_end=None):
+        self.pos_start = pos_start
+        self.pos_end = pos_end
+        return self
+
+    def set_context(self, context=None):
+        self.context = context
+        return self
 
     def generate_new_context(self):
         """
@@ -65,8 +80,6 @@ class BaseFunction(Value):
         for i in range(len(args)):
             arg_name = arg_names[i]
             arg_value = args[i]
-            # 更新当前节点的上下文，方便报错时定位
-            arg_value.set_context(exec_ctx)
             # 将调用函数时，传入的参数值存入函数符号表中
             exec_ctx.symbol_table.set(arg_name, arg_value)
 
@@ -99,24 +112,94 @@ class Function(BaseFunction):
         :return:
         """
         res = RTResult()
-        # 为函数单独创建新的解释器
-        # interpreter = Interpreter()
-        exec_ctx = self.generate_new_context()
-        res.register(self.check_and_populate_args(self.arg_names, args, exec_ctx))
-        if res.should_return(): return res
+        func = self
+        # 尾调用不会在函数体内执行，而是作为结果返回到这里，循环执行被调用的函数，
+        # 所以 return f(...) 形式的递归不再增加python调用栈
+        while True:
+            # 为函数单独创建新的解释器
+            # interpreter = Interpreter()
+            exec_ctx = func.generate_new_context()
+            res.register(func.check_and_populate_args(func.arg_names, args, exec_ctx))
+            if res.should_return(): return res
+
+            # 通过解释器执行函数体中的逻辑
+            value = res.register(interpreter.execute_function(func, exec_ctx))
+            if res.tail_call:
+                func, args = res.tail_call
+                if isinstance(func, Function): continue
+                # 内建函数等直接执行
+                return func.execute(args, interpreter)
+            # 如果函数应该返回且函数返回值（func_return_value）为None，则直接返回res
+            if res.should_return() and res.func_return_value == None:
+                return res
+            # 如果应该自动返回
+            ret_value = (value if func.should_auto_return else None) or res.func_return_value or Number.null
+
+            return res.success(ret_value)
 
-        # 通过解释器执行函数体中的逻辑
-        value = res.register(interpreter.visit(self.body_node, exec_ctx))
-        # 如果函数应该返回且函数返回值（func_return_value）为None，则直接返回res
-        if res.should_return() and res.func_return_value == None:
-            return res
-        # 如果应该自动返回
-        ret_value = (value if self.should_auto_return else None) or res.func_return_value or Number.null
+    def copy(self):
+        copy = Function(self.name, self.body_node, self.arg_names, self.should_auto_return)
+        copy.set_context(self.context)
+        copy.set_pos(self.pos_start, self.pos_end)
+        return copy
+
+    def __repr__(self):
+        return f"<function {self.name}>"
 
-        return res.success(ret_value)
+
+class CompiledFunction(BaseFunction):
+    def __init__(self, name, code):
+        """
+        字节码函数对象，由VM的MAKE_FUNCTION指令创建
+        :param name: 函数名
+        :param code: 函数体编译后的CodeObject
+        """
+        super().__init__(name)
+        self.code = code
+
+    def generate_new_context(self):
+        """
+        局部变量存放在新的Frame中，不再为每次调用创建符号表，访问局部变量不随调用深度变慢
+        其他变量与Function一样沿调用者链查找（context.parent，见 VM.lookup）
+        :return:
+        """
+        new_context = Context(self.name, self.context, self.pos_start)
+        new_context.symbol_table = self.context.symbol_table
+        new_context.frame = Frame(self.code.local_names, self.code.slot_map)
+        return new_context
+
+    def populate_args(self, arg_names, args, exec_ctx):
+        """参数依次存入Frame的前几个槽位"""
+        exec_ctx.frame.slots[:len(args)] = args
+
+    def execute(self, args, vm):
+        """
+        执行函数，与Function.execute的逻辑一致，只是函数体交给VM执行
+        :param args: 执行函数时，传入的参数
+        :param vm: 虚拟机
+        :return:
+        """
+        res = RTResult()
+        func = self
+        while True:
+            exec_ctx = func.generate_new_context()
+            res.register(func.check_and_populate_args(func.code.arg_names, args, exec_ctx))
+            if res.should_return(): return res
+
+            value = res.register(vm.run(func.code, exec_ctx))
+            if res.tail_call:
+                # TAIL_CALL指令，见 Function.execute
+                func, args = res.tail_call
+                if isinstance(func, CompiledFunction): continue
+                return func.execute(args, vm)
+            if res.should_return() and res.func_return_value == None:
+                return res
+            ret_value = (value if func.code.should_auto_return else None) or res.func_return_value or Number.null
+
+            return res.success(ret_value)
 
     def copy(self):
-        copy = Function(self.name, self.body_node, self.arg_names, self.should_auto_return)
+        copy = CompiledFunction(self.name, self.code)
         copy.set_context(self.context)
         copy.set_pos(self.pos_start, self.pos_end)
         return copy
@@ -125,6 +208,163 @@ class Function(BaseFunction):
         return f"<function {self.name}>"
 
 
+####################
+# MEMOIZE 记忆化
+# memoize(func[, max_size]) 返回带LRU缓存的函数，参数值相同时直接返回之前的结果，不再执行函数体
+# 只能用于纯函数：函数体（以及其中按名字调用、当前可以找到的函数）引用了有副作用的内建函数时拒绝
+####################
+
+# 有副作用（输入输出、就地修改列表）的内建函数
+IMPURE_BUILTINS = ('print', 'input', 'clear', 'append', 'pop', 'extend')
+# memoize 默认的缓存大小
+MEMOIZE_MAX_SIZE = 128
+
+
+def memo_key(value):
+    """
+    参数值 => 缓存key，1与1.0的运算结果不同，key中包含python值的类型
+    :return: 不能作为key的值（函数等）返回None
+    """
+    if isinstance(value, (Number, String)):
+        return (type(value), type(value.value), value.value)
+    if isinstance(value, List):
+        keys = tuple(memo_key(element) for element in value.elements)
+        if None in keys: return None
+        return (List, keys)
+    return None
+
+
+def referenced_names(func):
+    """
+    函数体中按名字读取的外部变量，包括其中定义的函数
+    :param func: Function（遍历AST）或 CompiledFunction（遍历字节码，局部变量不会编译成LOAD_NAME/LOAD_GLOBAL）
+    """
+    names = set()
+    if isinstance(func, Function):
+        # 参数以及函数体中赋值、定义的名字视为局部变量
+        bound = set(func.arg_names)
+        nodes = [func.body_node]
+        while nodes:
+            node = nodes.pop()
+            if isinstance(node, VarAccessNode):
+                names.add(node.var_name_tok.value)
+            elif isinstance(node, (VarAssignNode, ForNode)):
+                bound.add(node.var_name_tok.value)
+            elif isinstance(node, FuncNode):
+                if node.var_name_tok: bound.add(node.var_name_tok.value)
+                bound.update(tok.value for tok in node.arg_name_toks)
+            nodes.extend(child_nodes(node))
+        names -= bound
+    else:
+        codes = [func.code]
+        while codes:
+            code = codes.pop()
+            for op, arg in zip(code.ops, code.args):
+                if op == LOAD_NAME or op == LOAD_GLOBAL:
+                    names.add(arg)
+                elif op == MAKE_FUNCTION:
+                    codes.append(code.constants[arg])
+    return names
+
+
+def impure_builtin(func, symbol_table, checked=None):
+    """
+    检查函数是否引用了有副作用的内建函数，函数体中引用的其他函数从symbol_table中查找，一并检查
+    作用域是动态的，调用时名字可能对应其他函数，这里只检查记忆化时能找到的函数
+    :return: 引用的内建函数名，没有返回None
+    """
+    checked = set() if checked is None else checked
+    checked.add(func.body_node if isinstance(func, Function) else func.code)
+    for name in sorted(referenced_names(func)):
+        if name in IMPURE_BUILTINS: return name
+        value = symbol_table.get(name)
+        if isinstance(value, MemoizedFunction):
+            value = value.func
+        if isinstance(value, BuiltInFunction) and value.name in IMPURE_BUILTINS:
+            return value.name
+        if isinstance(value, (Function, CompiledFunction)):
+            if (value.body_node if isinstance(value, Function) else value.code) in checked: continue
+            impure = impure_builtin(value, symbol_table, checked)
+            if impure: return impure
+    return None
+
+
+class MemoCache(object):
+    """
+    LRU缓存，读取变量、调用函数时MemoizedFunction会被copy，副本共享同一个MemoCache
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.values = OrderedDict() # key => 返回值，最近使用的在最后
+        self.hits = 0
+        self.misses = 0
+
+
+class MemoizedFunction(BaseFunction):
+    def __init__(self, func, cache):
+        """
+        记忆化的函数，由内建函数memoize创建
+        :param func: 被记忆化的 Function/CompiledFunction
+        :param cache: MemoCache
+        """
+        super().__init__(func.name)
+        self.func = func
+        self.cache = cache
+
+    def execute(self, args, interpreter):
+        """
+        缓存命中时直接返回结果，否则执行被记忆化的函数，出错时不缓存
+        VM中调用字节码函数时不经过这里，由VM压栈执行（见 VM.run 的CALL指令）
+        :param args: 执行函数时，传入的参数
+        :return:
+        """
+        key, value = self.lookup(args)
+        if value is not None:
+            return RTResult().success(value)
+
+        func = self.func.copy().set_pos(self.pos_start, self.pos_end).set_context(self.context)
+        res = func.execute(args, interpreter)
+        if res.should_return(): return res
+        self.store(key, res.value)
+        return res
+
+    def lookup(self, args):
+        """
+        查找缓存并计数
+        :return: (key, 返回值)，参数不能作为key时key为None；未命中时返回值为None
+        """
+        cache = self.cache
+        keys = tuple(memo_key(arg) for arg in args)
+        key = None if None in keys else keys
+        if key is not None:
+            value = cache.values.get(key)
+            if value is not None:
+                cache.values.move_to_end(key)
+                cache.hits += 1
+                # List是值语义，返回副本，调用者修改返回值不影响缓存
+                return key, value.copy()
+        cache.misses += 1
+        return key, None
+
+    def store(self, key, value):
+        """缓存函数的返回值，超过max_size时淘汰最久未使用的结果"""
+        if key is None: return
+        cache = self.cache
+        cache.values[key] = value.copy()
+        if len(cache.values) > cache.max_size:
+            cache.values.popitem(last=False)
+
+    def copy(self):
+        copy = MemoizedFunction(self.func, self.cache)
+        copy.set_context(self.context)
+        copy.set_pos(self.pos_start, self.pos_end)
+        return copy
+
+    def __repr__(self):
+        return f"<memoized function {self.name}>"
+
+
 class BuiltInFunction(BaseFunction):
     """
     内建函数
@@ -145,6 +385,11 @@ class BuiltInFunction(BaseFunction):
         method_name = f'execute_{self.name}'
         method = getattr(self, method_name, self.no_visit_method)
 
+        # 省略的可选参数使用默认值（见 execute_memoize.defaults）
+        defaults = getattr(method, 'defaults', None)
+        if defaults and len(method.arg_names) - len(defaults) <= len(args) < len(method.arg_names):
+            args = args + defaults[len(args) - len(method.arg_names):]
+
         # 检测函数参数以及将参数填充到函数上下文的符号表中
         res.register(self.check_and_populate_args(method.arg_names, args, exec_ctx))
         if res.should_return(): return res
@@ -233,7 +478,7 @@ class BuiltInFunction(BaseFunction):
                 exec_ctx
             ))
 
-        list_.elements.append(value)
+        list_.append(value)
         return RTResult().success(list_)
     execute_append.arg_names = ["list", "value"]
 
@@ -261,7 +506,7 @@ class BuiltInFunction(BaseFunction):
             ))
 
         try:
-            element = list_.elements.pop(index.value)
+            element = list_.pop(index.value)
         except:
             return RTResult.failure(RTError(
                 self.pos_start, self.pos_end,
@@ -290,7 +535,7 @@ class BuiltInFunction(BaseFunction):
                 exec_ctx
             ))
 
-        list_1.elements.extend(list_2.elements)
+        list_1.extend(list_2.elements)
         return RTResult().success(list_1)
     execute_extend.arg_names = ["list_1", "list_2"]
 
@@ -304,9 +549,61 @@ class BuiltInFunction(BaseFunction):
                 exec_ctx
             ))
 
-        return RTResult().success(Number(len(list_.elements)))
+        return RTResult().success(make_number(len(list_.elements)))
     execute_len.arg_names = ["list"]
 
+    def execute_memoize(self, exec_ctx):
+        """
+        记忆化：memoize(func) 或 memoize(func, max_size)
+        var Fib = memoize(Fib) 之后，Fib中递归调用的Fib也会使用缓存
+        """
+        func = exec_ctx.symbol_table.get('func')
+        max_size = exec_ctx.symbol_table.get('max_size')
+
+        if isinstance(func, MemoizedFunction):
+            func = func.func
+        if not isinstance(func, (Function, CompiledFunction)):
+            return RTResult().failure(RTError(
+                self.pos_start, self.pos_end,
+                "First argument must be function",
+                exec_ctx
+            ))
+
+        if not isinstance(max_size, Number) or not isinstance(max_size.value, int) or max_size.value < 1:
+            return RTResult().failure(RTError(
+                self.pos_start, self.pos_end,
+                "Secord argument must be positive integer",
+                exec_ctx
+            ))
+
+        # 从调用memoize的位置查找函数体中引用的函数（exec_ctx的符号表中还有参数func、max_size）
+        impure = impure_builtin(func, exec_ctx.parent.symbol_table)
+        if impure:
+            return RTResult().failure(RTError(
+                self.pos_start, self.pos_end,
+                f"Cannot memoize '{func.name}', it calls '{impure}'",
+                exec_ctx
+            ))
+
+        memoized = MemoizedFunction(func, MemoCache(max_size.value))
+        return RTResult().success(memoized.set_context(func.context).set_pos(func.pos_start, func.pos_end))
+    execute_memoize.arg_names = ['func', 'max_size']
+    execute_memoize.defaults = [make_number(MEMOIZE_MAX_SIZE)]
+
+    def execute_memo_stats(self, exec_ctx):
+        """记忆化函数的缓存统计：[命中次数, 未命中次数, 缓存的结果数]"""
+        func = exec_ctx.symbol_table.get('func')
+        if not isinstance(func, MemoizedFunction):
+            return RTResult().failure(RTError(
+                self.pos_start, self.pos_end,
+                "Argment must be memoized function",
+                exec_ctx
+            ))
+
+        cache = func.cache
+        return RTResult().success(List([make_number(cache.hits), make_number(cache.misses), make_number(len(cache.values))]))
+    execute_memo_stats.arg_names = ['func']
+
 
 # 内建函数
 BuiltInFunction.print       = BuiltInFunction("print")
@@ -320,3 +617,5 @@ BuiltInFunction.append      = BuiltInFunction("append")
 BuiltInFunction.pop         = BuiltInFunction("pop")
 BuiltInFunction.extend      = BuiltInFunction("extend")
 BuiltInFunction.len         = BuiltInFunction("len")
+BuiltInFunction.memoize     = BuiltInFunction("memoize")
+BuiltInFunction.memo_stats  = BuiltInFunction("memo_stats")
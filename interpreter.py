@@ -1,5 +1,7 @@
 from tokens import *
 from function import *
+from ast_node import BinOpNode, QuickBinOpNode
+from operators import QUICK_VALUE_TYPES
 
 
 class Interpreter(object):
@@ -7,6 +9,13 @@ class Interpreter(object):
     解释器
     Interpreter类方法名的规则: "visit_" + ast_node.py中的类名
     """
+    # 循环回边数（每执行一次循环体加1），TieredInterpreter 用来判断函数是否为热点（见 tiered.py）
+    back_edges = 0
+    # 运行时特化：BinOpNode连续 QUICKEN_THRESHOLD 次观察到同样的int/float操作数类型后，改为QuickBinOpNode
+    QUICKEN_THRESHOLD = 8
+    specialized = 0 # 特化的节点数
+    despecialized = 0 # 守卫失败、退回BinOpNode的节点数
+
     def visit(self, node, context):
         """
         递归下降算法
@@ -21,18 +30,23 @@ class Interpreter(object):
     def no_visit_method(self, node, context):
         raise Exception(f'No visit_{type(node).__name__} method defined')
 
+    def execute_function(self, func, context):
+        """
+        Function.execute 执行函数体的入口
+        :param func: Function
+        :param context: 函数上下文
+        :return: RTResult
+        """
+        return self.visit(func.body_node, context)
+
     def visit_NumberNode(self, node, context):
         # visit 循环调用，由NumberNode终结符结束
-        # set_context 设置当前ast node的上下文
-        # set_pos 设置当前ast node的position
-        return RTResult().success(
-            Number(node.tok.value).set_context(context).set_pos(node.pos_start, node.pos_end)
-        )
+        # 值不记录位置与上下文，报错时由当前节点补全（见 RTError.locate）
+        # 字面量的值在解析时就已创建
+        return RTResult().success(node.value)
 
     def visit_StringNode(self, node, context):
-        return RTResult().success(
-            String(node.tok.value).set_context(context).set_pos(node.pos_start, node.pos_end)
-        )
+        return RTResult().success(node.value)
 
     def visit_ListNode(self, node, context):
         """
@@ -49,7 +63,7 @@ class Interpreter(object):
             elements.append(res.register(self.visit(en, context)))
             if res.should_return(): return res
 
-        return res.success(List(elements).set_context(context).set_pos(node.pos_start, node.pos_end))
+        return res.success(List(elements))
 
     def visit_VarAccessNode(self, node ,context):
         """
@@ -69,8 +83,8 @@ class Interpreter(object):
                 context
             ))
         # copy本身，避免影响后续操作（引用型语言要考虑的问题）
-        value = value.copy().set_pos(node.pos_start, node.pos_end)
-        return res.success(value)
+        # Number、String不可变，copy返回自身；List为写时复制
+        return res.success(value.copy())
 
     def visit_VarAssignNode(self, node, context):
         """
@@ -104,45 +118,91 @@ class Interpreter(object):
         right = res.register(self.visit(node.right_node, context))
         if res.should_return():
             return res
+        return self.operate(node, left, right, res, context)
 
-        if node.op_tok.type == TT_PLUS: # 加法操作符
-            result, error = left.added_by(right)
-        elif node.op_tok.type == TT_MINUS: # 减法操作符
-            result, error = left.subbed_by(right)
-        elif node.op_tok.type == TT_MUL: # 乘法操作符
-            result, error = left.multed_by(right)
-        elif node.op_tok.type == TT_DIV: # 除法操作符
-            result, error = left.dived_by(right)
-        elif node.op_tok.type == TT_POW: # 幂运算
-            result, error = left.powed_by(right)
-        elif node.op_tok.type == TT_EE:
-            result, error = left.get_comparison_eq(right)
-        elif node.op_tok.type == TT_NE:
-            result, error = left.get_comparison_ne(right)
-        elif node.op_tok.type == TT_LT:
-            result, error = left.get_comparison_lt(right)
-        elif node.op_tok.type == TT_GT:
-            result, error = left.get_comparison_gt(right)
-        elif node.op_tok.type == TT_LTE:
-            result, error = left.get_comparison_lte(right)
-        elif node.op_tok.type == TT_GTE:
-            result, error = left.get_comparison_gte(right)
-        elif node.op_tok.matches(TT_KEYWORD, 'and'):
-            result, error = left.anded_by(right)
-        elif node.op_tok.matches(TT_KEYWORD, 'or'):
-            result, error = left.ored_by(right)
+    def visit_QuickBinOpNode(self, node, context):
+        """
+        特化后的二元操作，左右值类型与特化时相同则直接对python值运算
+        :param node: QuickBinOpNode
+        :param context:
+        :return:
+        """
+        res = RTResult()
+        left = res.register(self.visit(node.left_node, context))
+        if res.should_return():
+            return res
+        right = res.register(self.visit(node.right_node, context))
+        if res.should_return():
+            return res
+
+        left_type, right_type = node.quick_types
+        if type(left) is Number and type(right) is Number and type(left.value) is left_type and type(right.value) is right_type:
+            result = node.operator.quick(left.value, right.value)
+            # 返回None（如除数为0）时由通用路径生成错误
+            if result is not None:
+                return res.success(result)
         else:
+            # 守卫失败：退回BinOpNode，不再特化
+            node.__class__ = BinOpNode
+            self.despecialized += 1
+        return self.operate(node, left, right, res, context)
+
+    def operate(self, node, left, right, res, context):
+        """
+        二元操作的通用路径
+        :param node: BinOpNode/QuickBinOpNode
+        :param left: 左值
+        :param right: 右值
+        :param res: 已经登记了左右值的RTResult
+        :return: RTResult
+        """
+        # 操作符在解析时已经确定（见 operators.py），这里按左右值的类型查表
+        operator = node.operator
+        if operator is None:
             # 不支持某种操作
             return res.failure(RTError(
                 node.pos_start, node.pos_end,
                 f"{node.op_tok.type} is not suppert",
                 context
             ))
+        operate = operator.table.get((type(left), type(right)))
+        if operate is None:
+            result, error = operator.generic(left, right)
+        else:
+            result, error = operate(left, right)
 
         if error:
-            return res.failure(error)
-        else:
-            return res.success(result.set_pos(node.pos_start, node.pos_end))
+            # 除数为0等错误定位到右操作数，其他错误定位到整个表达式
+            span = node.right_node if error.at_right_operand else node
+            return res.failure(error.locate(span.pos_start, span.pos_end, context))
+        if node.quick_count >= 0:
+            self.quicken(node, left, right)
+        return res.success(result)
+
+    def quicken(self, node, left, right):
+        """
+        记录BinOpNode的操作数类型，连续 QUICKEN_THRESHOLD 次相同时把节点改为QuickBinOpNode
+        操作数不是Number、值不是int/float、操作符没有特化实现时，节点不再特化
+        """
+        if type(left) is not Number or type(right) is not Number or node.operator.quick is None:
+            node.quick_count = -1
+            return
+        types = (type(left.value), type(right.value))
+        if types != node.quick_types:
+            if types[0] in QUICK_VALUE_TYPES and types[1] in QUICK_VALUE_TYPES:
+                node.quick_types = types
+                node.quick_count = 1
+            else:
+                node.quick_count = -1
+            return
+        node.quick_count += 1
+        if node.quick_count >= self.QUICKEN_THRESHOLD:
+            node.__class__ = QuickBinOpNode
+            node.quick_count = -1
+            self.specialized += 1
+
+    def quicken_stats(self):
+        return f'quickening: {self.specialized} specialized, {self.despecialized} despecialized'
 
     def visit_UnaryOpNode(self, node, context):
         """
@@ -157,17 +217,14 @@ class Interpreter(object):
         if res.should_return():
             return res
 
-        error = None
-
-        if node.op_tok.type == TT_MINUS: # 负数
-            number, error = number.multed_by(Number(-1))
-        elif node.op_tok.matches(TT_KEYWORD, 'not'):
-            number, error = number.notted()
+        operator = node.operator
+        operate = operator.table.get(type(number), operator.generic)
+        number, error = operate(number)
 
         if error:
-            return res.failure(error)
+            return res.failure(error.locate(node.pos_start, node.pos_end, context))
         else:
-            return res.success(number.set_pos(node.pos_start, node.pos_end))
+            return res.success(number)
 
     def visit_IfNode(self, node, context):
         """
@@ -217,6 +274,8 @@ class Interpreter(object):
         """
         res = RTResult()
         elements = []
+        # 多行循环体，或者循环的值没有被使用（见 optimizer.ResultUsage）时，不收集每次循环的结果
+        collect = not (node.should_return_null or node.result_unused)
 
         start_value = res.register(self.visit(node.start_value_node, context))
         if res.should_return(): return res
@@ -228,35 +287,25 @@ class Interpreter(object):
             step_value = res.register(self.visit(node.step_value_node, context))
             if res.should_return(): return res
         else:
-            step_value = Number(1) # 默认每次循环，只跳过一个元素
-
-        # 允许 step 为负数
-        i = start_value.value
-
-        # In [8]: condition = lambda: i<4
-        # In [9]: i = 1
-        # In [10]: while condition():
-        #     ...:     print(i)
-        #     ...:     i += 1
-        # 1
-        # 2
-        # 3
-        # 4
-        if step_value.value >= 0:
-            # step_value 为正数时，循环start_value -> end_value 从小到大
-            condition = lambda: i < end_value.value
-        else:
-            # step_value 为负数时，循环start_value -> end_value 从大到小
-            condition = lambda : i > end_value.value
-
-        while condition():
-            # node.var_name_tok.value =>  KEYWORD:for IDENTIFIER EQ expr 中的 IDENTIFIER 变量名
-            # 这里将for循环中的变量名的值存入符号表中，让该变量值，在循环后，依旧可以获得累加或累减后的结果
-            context.symbol_table.set(node.var_name_tok.value, Number(i))
-            i += step_value.value # 循环
+            step_value = make_number(1) # 默认每次循环，只跳过一个元素
+
+        # 允许 step 为负数；都是int时循环次数在开始前就已确定，见 type_operate.loop_values
+        values = loop_values(start_value.value, end_value.value, step_value.value)
+
+        # node.var_name_tok.value =>  KEYWORD:for IDENTIFIER EQ expr 中的 IDENTIFIER 变量名
+        # 这里将for循环中的变量名的值存入符号表中，让该变量值，在循环后，依旧可以获得累加或累减后的结果
+        # 循环期间直接写入当前符号表的symbols（与 SymbolTable.set 相同），不再每次调用方法
+        var_name = node.var_name_tok.value
+        symbols = context.symbol_table.symbols
+        body_node = node.body_node
+        visit = self.visit
+
+        for i in values:
+            self.back_edges += 1
+            symbols[var_name] = make_number(i)
             # 执行循环体对应的expr
             # body_node可以对应着多行代码
-            value = res.register(self.visit(node.body_node, context))
+            value = res.register(visit(body_node, context))
             if res.should_return() and res.loop_should_continue == False and res.loop_should_break == False:
                 return res
             # 跳过此次循环
@@ -265,13 +314,14 @@ class Interpreter(object):
             # 跳出此次循环
             if res.loop_should_break:
                 break
-            elements.append(value)
+            if collect:
+                elements.append(value)
 
-        if node.should_return_null:
-            return res.success(Number.null)
+        if collect:
+            # 返回循环体中每次循环逻辑执行后返回的值
+            return res.success(List(elements))
         else:
-            # 不为null，则返回循环体中每次循环逻辑执行后返回的值
-            return res.success(List(elements).set_pos(node.pos_start, node.pos_end).set_context(context))
+            return res.success(Number.null)
 
     def visit_WhileNode(self, node, context):
         """
@@ -282,12 +332,14 @@ class Interpreter(object):
         """
         res = RTResult()
         elements = []
+        collect = not (node.should_return_null or node.result_unused)
 
         while True:
             condition = res.register(self.visit(node.condition_node, context))
             if res.should_return(): return res
 
             if not condition.is_true(): break # while条件为False时，跳出while循环
+            self.back_edges += 1
 
             value = res.register(self.visit(node.body_node, context))
             # 只希望 res.error 为 True的时候返回res
@@ -299,13 +351,14 @@ class Interpreter(object):
             # 跳出此次循环
             if res.loop_should_break:
                 break
-            elements.append(value)
+            if collect:
+                elements.append(value)
 
-        if node.should_return_null:
-            return res.success(Number.null)
+        if collect:
+            # 返回循环体中每次循环逻辑执行后返回的值
+            return res.success(List(elements))
         else:
-            # 不为null，则返回循环体中每次循环逻辑执行后返回的值
-            return res.success(List(elements).set_pos(node.pos_start, node.pos_end).set_context(context))
+            return res.success(Number.null)
 
 
     def visit_FuncNode(self, node, context):
@@ -349,6 +402,9 @@ class Interpreter(object):
             # 函数参数可能是执行式，也可以只是个数字 => a(1+2, 5)
             args.append(res.register(self.visit(arg_node, context)))
             if res.should_return(): return res
+        if node.is_tail_call:
+            # 尾调用：当前函数到此结束，由外层 Function.execute 的循环调用，不再增加python调用栈
+            return res.success_tail_call(value_to_call, args)
         # 函数的执行需要传入解释器 interpreter
         return_value = res.register(value_to_call.execute(args, self))
         if res.should_return(): return res
@@ -1,4 +1,7 @@
-from position import Position
+import gc
+import re
+
+from position import Position, OffsetPosition, EndPosition, SourceText
 from tokens import *
 from error import *
 
@@ -119,9 +122,9 @@ class Lexer(object):
                 num_str += self.current_char
             self.advance()
         if dot_coumt == 0: # 整数
-            return Token(TT_INT, int(num_str), pos_start, self.pos)
+            return Token(TT_INT, int(num_str), pos_start, self.pos.copy())
         else:
-            return Token(TT_FLOAT, float(num_str), pos_start, self.pos)
+            return Token(TT_FLOAT, float(num_str), pos_start, self.pos.copy())
 
     def make_string(self):
         string = ''
@@ -148,7 +151,7 @@ class Lexer(object):
             self.advance()
 
         self.advance()
-        return Token(TT_STRING, string, pos_start, self.pos)
+        return Token(TT_STRING, string, pos_start, self.pos.copy())
 
 
     def make_identifier(self):
@@ -169,7 +172,7 @@ class Lexer(object):
         else:
             tok_type = TT_IDENTIFIER
 
-        return Token(tok_type, variable_str, pos_start, self.pos)
+        return Token(tok_type, variable_str, pos_start, self.pos.copy())
 
     def make_not_equals(self):
         """
@@ -181,7 +184,7 @@ class Lexer(object):
         self.advance()
         if self.current_char == '=': # != 不等于
             self.advance()
-            return Token(TT_NE, pos_start=pos_start, pos_end=self.pos), None
+            return Token(TT_NE, pos_start=pos_start, pos_end=self.pos.copy()), None
 
         self.advance()
         return None, ExpectedCharError(pos_start, self.pos, "'=' (after '!')")
@@ -198,7 +201,7 @@ class Lexer(object):
         if self.current_char == '=': # ==
             self.advance()
             tok_type = TT_EE
-        return Token(tok_type, pos_start=pos_start, pos_end=self.pos)
+        return Token(tok_type, pos_start=pos_start, pos_end=self.pos.copy())
 
     def make_less_than(self):
         """
@@ -212,7 +215,7 @@ class Lexer(object):
         if self.current_char == '=': # <=
             self.advance()
             tok_type = TT_LTE
-        return Token(tok_type, pos_start=pos_start, pos_end=self.pos)
+        return Token(tok_type, pos_start=pos_start, pos_end=self.pos.copy())
 
     def make_greater_than(self):
         """
@@ -226,7 +229,7 @@ class Lexer(object):
         if self.current_char == '=': # >=
             self.advance()
             tok_type = TT_GTE
-        return Token(tok_type, pos_start=pos_start, pos_end=self.pos)
+        return Token(tok_type, pos_start=pos_start, pos_end=self.pos.copy())
 
     def make_minus_or_arrow(self):
         """
@@ -241,4 +244,220 @@ class Lexer(object):
             self.advance()
             tok_type = TT_ARROW
 
-        return Token(tok_type, pos_start=pos_start, pos_end=self.pos)
\ No newline at end of file
+        return Token(tok_type, pos_start=pos_start, pos_end=self.pos.copy())
+
+
+####################
+# REGEX LEXER 基于正则表达式的词法分析
+####################
+
+# 固定的操作符、分隔符 -> Token类型，长的写在前面（== 先于 =）
+OPERATORS = {
+    '==': TT_EE,
+    '!=': TT_NE,
+    '<=': TT_LTE,
+    '>=': TT_GTE,
+    '->': TT_ARROW,
+    '+': TT_PLUS,
+    '-': TT_MINUS,
+    '*': TT_MUL,
+    '/': TT_DIV,
+    '^': TT_POW,
+    '(': TT_LPAREN,
+    ')': TT_RPAREN,
+    '[': TT_LSQUARE,
+    ']': TT_RSQUARE,
+    ',': TT_COMMA,
+    '=': TT_EQ,
+    '<': TT_LT,
+    '>': TT_GT,
+    ';': TT_NEWLINE,
+    '\n': TT_NEWLINE,
+}
+
+# 所有Token规则合并成一个正则，每个分组对应一种规则，通过 match.lastgroup 判断匹配到了哪种
+# 规则与Lexer保持一致：标识符以字母开头；数字最多一个小数点；注释连同行尾的换行一起跳过
+MASTER_PATTERN = re.compile('|'.join([
+    r'(?P<SKIP>[ \t]+|#[^\n]*\n?)',
+    r'(?P<NUMBER>[0-9]+(?:\.[0-9]*)?)',
+    r'(?P<IDENTIFIER>[A-Za-z][A-Za-z0-9_]*)',
+    r'(?P<STRING>"(?:[^"\\]|\\.)*")',
+    r'(?P<UNTERMINATED>"(?:[^"\\]|\\.)*\\?)', # 没有结束的引号，字符串直到源码末尾
+    '(?P<OPERATOR>' + '|'.join(re.escape(op) for op in OPERATORS) + ')',
+    r'(?P<BANG>!)',
+    r'(?P<ILLEGAL>.)',
+]), re.DOTALL)
+
+STRING_ESCAPE = re.compile(r'\\(.)', re.DOTALL)
+ESCAPE_CHARACTERS = {
+    'n': '\n',
+    't': '\t'
+}
+KEYWORD_SET = frozenset(KEYWORDS)
+
+
+class LexError(Exception):
+    """RegexLexer.generate_tokens 遇到非法字符时抛出，error为对应的Error"""
+
+    def __init__(self, error):
+        super().__init__(error.as_string())
+        self.error = error
+
+
+class RegexLexer(object):
+    """
+    与Lexer生成相同的Tokens，但一次正则匹配得到一个Token，
+    Token只记录偏移量（OffsetPosition），行号、列号在报错时才计算
+    """
+
+    def __init__(self, fn, text):
+        self.fn = fn
+        self.text = text
+        self.source = SourceText(fn, text)
+
+    def make_tokens(self):
+        # Token之间没有循环引用，生成大量Token时暂停python的循环垃圾回收，
+        # 否则每创建一批对象GC就要扫描一遍已经生成的全部Token
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return list(self.generate_tokens()), None
+        except LexError as e:
+            return [], e.error
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def generate_tokens(self):
+        """
+        生成器，按顺序逐个生成Token，最后一个为EOF
+        遇到非法字符时抛出LexError
+        """
+        source = self.source
+        eof = len(self.text)
+
+        for match in MASTER_PATTERN.finditer(self.text):
+            kind = match.lastgroup
+            if kind == 'SKIP':
+                continue
+
+            start, end = match.span()
+            if kind == 'IDENTIFIER':
+                value = match.group()
+                # 如果字符串在KEYWORDS中，说明该Token是关键字，否则则是变量名
+                token = Token(TT_KEYWORD if value in KEYWORD_SET else TT_IDENTIFIER, value)
+            elif kind == 'OPERATOR':
+                token = Token(OPERATORS[match.group()])
+            elif kind == 'NUMBER':
+                value = match.group()
+                if '.' in value:
+                    token = Token(TT_FLOAT, float(value))
+                else:
+                    token = Token(TT_INT, int(value))
+            elif kind == 'STRING':
+                token = Token(TT_STRING, self.unescape(match.group()[1:-1]))
+            elif kind == 'UNTERMINATED':
+                # 没有结束的引号，与Lexer一样，结束位置多算一个字符；末尾单独的 \ 丢弃
+                value = match.group()[1:]
+                if STRING_ESCAPE.sub('', value).endswith('\\'):
+                    value = value[:-1]
+                token = Token(TT_STRING, self.unescape(value))
+                end = eof = end + 1
+            elif kind == 'BANG':
+                # 与 Lexer.make_not_equals 一致，报错范围包括 ! 后的一个字符
+                raise LexError(ExpectedCharError(OffsetPosition(start, source), EndPosition(start + 2, source), "'=' (after '!')"))
+            else:
+                # 没有匹配任何Token
+                raise LexError(IllegalCharError(OffsetPosition(start, source), EndPosition(end, source), f"'{match.group()}'"))
+
+            # 直接设置位置，Token.__init__ 会复制传入的位置，而这里的位置不会被修改，不需要复制
+            token.pos_start = OffsetPosition(start, source)
+            token.pos_end = EndPosition(end, source)
+            yield token
+
+        token = Token(TT_EOF)
+        token.pos_start = OffsetPosition(eof, source)
+        token.pos_end = EndPosition(eof + 1, source)
+        yield token
+
+    def unescape(self, body):
+        """
+        :param body: 去掉引号后的原始字符串
+        :return: 转义字符替换为字符原始的值
+        """
+        if '\\' in body:
+            body = STRING_ESCAPE.sub(lambda m: ESCAPE_CHARACTERS.get(m.group(1), m.group(1)), body)
+        return body
+
+
+####################
+# TOKEN STREAM Token流
+####################
+
+# 默认最多保留的已读取Token个数，即最多可以回退的步数
+# Parser是预测分析，只向前读取，不需要回退，保留少量Token即可
+LOOKBEHIND_WINDOW = 64
+
+
+class BacktrackError(Exception):
+    """回退的步数超出了TokenStream保留的范围"""
+
+
+class TokenStream(object):
+    """
+    按需从生成器中读取Token，Parser不再需要完整的Token列表
+    只保留最近读取的Token（至多2倍window个），内存占用与脚本大小无关
+    """
+
+    def __init__(self, tokens, window=LOOKBEHIND_WINDOW):
+        """
+        :param tokens: Token的可迭代对象，最后一个为EOF，例如 RegexLexer.generate_tokens()
+        :param window: 至少保留的已读取Token个数
+        """
+        self.tokens = iter(tokens)
+        self.window = window
+        self.buffer = [] # 已读取的Token
+        self.base = 0 # buffer[0] 在整个Token序列中的下标
+        self.eof = None # 读取到的EOF Token，之后的下标都返回它
+        self.error = None # 词法分析的错误（LexError）
+
+    def __getitem__(self, idx):
+        """
+        下标idx对应的Token，超过末尾时返回EOF
+        :param idx: 在整个Token序列中的下标
+        :return: Token
+        """
+        buffer = self.buffer
+        while idx >= self.base + len(buffer):
+            if self.eof:
+                return self.eof
+            self.read()
+        if idx < self.base:
+            raise BacktrackError(f'cannot backtrack more than {self.window} tokens')
+        return buffer[idx - self.base]
+
+    def read(self):
+        """读取下一个Token，超出2倍window时丢弃较早的一半"""
+        try:
+            token = next(self.tokens)
+        except LexError as e:
+            # 词法错误：记录下来，用错误位置的EOF结束Token流，由调用者优先报告该错误
+            self.error = e.error
+            token = Token(TT_EOF)
+            token.pos_start = e.error.pos_start
+            token.pos_end = e.error.pos_end
+
+        if token.type == TT_EOF:
+            self.eof = token
+
+        buffer = self.buffer
+        buffer.append(token)
+        if self.window is not None and len(buffer) > 2 * self.window:
+            drop = len(buffer) - self.window
+            del buffer[:drop]
+            self.base += drop
+
+    def drain(self):
+        """读取剩余的全部Token（只保留window个），用于检查后面的源码是否有词法错误"""
+        while not self.eof:
+            self.read()
@@ -1,27 +1,97 @@
-from lexer import Lexer
+import gc
+
+from lexer import RegexLexer, TokenStream
 from parser import Parser
 from interpreter import Interpreter
+from closure_compiler import ClosureCompiler
+from transpiler import Transpiler
+from tiered import TieredInterpreter
+from compiler import Compiler
+from resolver import Resolver
+from optimizer import Optimizer
+from vm import VM, MAX_CALL_DEPTH
 from context import Context
 from built_variable import global_symbol_table
 
 
-def run(fn, text):
-    # 生成Tokens
-    lexer = Lexer(fn, text)
-    tokens, error = lexer.make_tokens()
-    if error: return None, error
-    # print(tokens)
+# 执行模式：
+# interpreter => 遍历AST的解释器（参考实现）
+# vm => 先将AST编译成字节码，再交给栈式虚拟机执行；函数调用使用虚拟机自己的调用栈，
+#       递归深度由 max_call_depth 限制，不依赖python的递归
+# closure => 先将AST编译成嵌套的python闭包再执行，与解释器的语义完全相同，但不再逐个节点分派
+# python => 先将AST转译成python源码，通过 compile/exec 执行，语义同上
+# tiered => 由解释器执行，调用次数与循环次数多的函数再转译成python源码执行（见 tiered.py）
+MODES = ('interpreter', 'vm', 'closure', 'python', 'tiered')
+
+
+def parse(fn, text):
+    """
+    词法分析 + 语法分析
+    :return: (AST, error)
+    """
+    # 生成Tokens，RegexLexer与Lexer生成的Tokens相同，但只记录偏移量，速度更快
+    # Tokens通过TokenStream按需生成，Parser读取到哪里，词法分析就进行到哪里，不再保存完整的Token列表
+    lexer = RegexLexer(fn, text)
+    tokens = TokenStream(lexer.generate_tokens())
 
     # 生成AST，通过__repr__形式打印出树结构而已
-    parser = Parser(tokens)
-    ast = parser.parse()
+    # AST与Token都没有循环引用，解析期间暂停循环垃圾回收（见 RegexLexer.make_tokens）
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        parser = Parser(tokens)
+        ast = parser.parse()
+        if ast.error:
+            # 与先完成词法分析再解析一样，词法错误优先报告，所以需要检查剩余的源码
+            tokens.drain()
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    if tokens.error: return None, tokens.error
     if ast.error: return None, ast.error
     # print(ast.node)
+    return ast.node, None
+
+
+def run(fn, text, mode='interpreter', max_call_depth=MAX_CALL_DEPTH, cache=None, optimize=True, optimizer=None,
+        tiered=None, interpreter=None):
+    """
+    :param cache: ASTCache（见 cache.py），不为None时优先从缓存中加载AST
+    :param optimize: 是否对AST做常量折叠、代数化简、死代码消除与结果使用分析（见 optimizer.py）
+    :param optimizer: 使用的Optimizer，执行后可以从中获取统计与删除的代码，为None时新建一个
+    :param tiered: tiered模式使用的TieredInterpreter，执行后可以从中获取升级记录，为None时新建一个
+    :param interpreter: interpreter模式使用的Interpreter，执行后可以从中获取特化统计，为None时新建一个
+    """
+    node = cache.load(fn, text) if cache else None
+    if node is None:
+        node, error = parse(fn, text)
+        if error: return None, error
+        if cache: cache.store(fn, text, node)
+
+    # 缓存中保存的是解析得到的AST，与是否优化无关
+    if optimize: node = (optimizer or Optimizer()).optimize_program(node)
 
-    # 通过解释器执行程序
-    interpreter = Interpreter()
     context = Context("<program>")
     context.symbol_table = global_symbol_table
-    result = interpreter.visit(ast.node, context)
 
-    return result.value, result.error
\ No newline at end of file
+    if mode == 'vm':
+        # 解析变量作用域，编译成字节码，通过虚拟机执行
+        Resolver().resolve(node)
+        code = Compiler().compile(node)
+        result = VM(max_call_depth).run(code, context)
+    elif mode == 'closure':
+        # 编译成闭包后执行，接口与Interpreter相同
+        result = ClosureCompiler().visit(node, context)
+    elif mode == 'python':
+        # 转译成python源码后执行，接口与Interpreter相同
+        result = Transpiler(fn).transpile(node).visit(node, context)
+    elif mode == 'tiered':
+        # 顶层代码由解释器执行，热点函数升级后执行编译结果
+        result = (tiered or TieredInterpreter(fn)).run(node, context)
+    else:
+        # 通过解释器执行程序
+        interpreter = interpreter or Interpreter()
+        result = interpreter.visit(node, context)
+
+    return result.value, result.error
@@ -0,0 +1,44 @@
+####################
+# OPCODES 字节码指令
+####################
+
+# 栈操作
+LOAD_CONST = 0 # 常量入栈
+LOAD_NAME = 1 # 按变量名取值入栈：顶层从符号表，函数中沿调用者链动态查找（见 VM.lookup）
+STORE_NAME = 2 # 栈顶值存入符号表（不出栈，赋值本身是表达式）
+LOAD_NULL = 3 # Number.null 入栈
+POP_TOP = 4 # 弹出栈顶
+LOAD_FAST = 19 # 从当前Frame的槽位取值
+STORE_FAST = 20 # 栈顶值存入当前Frame的槽位（不出栈）
+LOAD_GLOBAL = 23 # 函数中没有被任何函数绑定为局部变量的名字，直接从全局符号表取值入栈
+
+# 运算
+BINARY_OP = 5 # 二元运算，参数为BinaryOperator（见 operators.py）
+UNARY_OP = 6 # 一元运算，参数为UnaryOperator
+
+# 跳转
+JUMP = 7 # 无条件跳转
+POP_JUMP_IF_FALSE = 8 # 弹出栈顶，为False时跳转
+
+# list
+BUILD_LIST = 9 # 弹出n个值构建List
+LIST_NEW = 10 # 循环结果收集器（python list）入栈
+LIST_APPEND = 11 # 弹出栈顶，追加到 stack[-n] 的收集器中
+LIST_BUILD = 12 # 收集器转为List
+
+# for循环
+FOR_PREP = 13 # 弹出 start, end, step，压入循环状态
+FOR_ITER = 14 # 循环变量赋值，循环结束则弹出状态并跳转
+
+# 函数
+MAKE_FUNCTION = 15 # 根据CodeObject创建函数对象
+CALL = 16 # 调用函数，参数为参数个数
+RETURN_VALUE = 17 # 返回栈顶值
+END = 18 # 程序/函数体执行结束，栈顶为结果
+TAIL_CALL = 22 # 尾调用，参数为参数个数；结束当前函数，由 CompiledFunction.execute 循环调用
+
+
+OPNAMES = {
+    value: name for name, value in list(globals().items())
+    if name.isupper() and isinstance(value, int)
+}
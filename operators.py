@@ -0,0 +1,266 @@
+from tokens import *
+from type_operate import *
+
+
+####################
+# OPERATORS 操作符分派表
+# 解析时通过操作符token取得对应的 BinaryOperator/UnaryOperator，保存在AST节点上，
+# 执行时只需按 (左值类型, 右值类型) 查一次表，不再逐个比较操作符token
+####################
+
+# 二元操作符 -> Value上对应的方法名
+BIN_OP_METHODS = {
+    TT_PLUS: 'added_by',
+    TT_MINUS: 'subbed_by',
+    TT_MUL: 'multed_by',
+    TT_DIV: 'dived_by',
+    TT_POW: 'powed_by',
+    TT_EE: 'get_comparison_eq',
+    TT_NE: 'get_comparison_ne',
+    TT_LT: 'get_comparison_lt',
+    TT_GT: 'get_comparison_gt',
+    TT_LTE: 'get_comparison_lte',
+    TT_GTE: 'get_comparison_gte',
+    (TT_KEYWORD, 'and'): 'anded_by',
+    (TT_KEYWORD, 'or'): 'ored_by',
+}
+
+# 参与特化的值类型
+VALUE_TYPES = (Number, String, List)
+
+
+def op_key(op_tok):
+    """操作符token对应的key，关键字操作符（and/or/not）需要带上关键字本身"""
+    if op_tok.type == TT_KEYWORD:
+        return (op_tok.type, op_tok.value)
+    return op_tok.type
+
+
+def illegal(left, right=None):
+    """左值类型不支持该操作"""
+    return None, left.illegal_operation(right)
+
+
+#########  Number 与 Number 的特化实现  ###########
+# 表中已经确定了两个操作数都是Number，省去方法内部的 isinstance 判断
+
+def number_add(left, right):
+    return make_number(left.value + right.value), None
+
+
+def number_sub(left, right):
+    return make_number(left.value - right.value), None
+
+
+def number_mul(left, right):
+    return make_number(left.value * right.value), None
+
+
+def number_div(left, right):
+    if right.value == 0:
+        # 除法分母不可为0
+        return None, operand_error('Division by zero')
+    return make_number(left.value / right.value), None
+
+
+def number_pow(left, right):
+    return make_number(left.value ** right.value), None
+
+
+def number_eq(left, right):
+    return (Number.true if left.value == right.value else Number.false), None
+
+
+def number_ne(left, right):
+    return (Number.true if left.value != right.value else Number.false), None
+
+
+def number_lt(left, right):
+    return (Number.true if left.value < right.value else Number.false), None
+
+
+def number_gt(left, right):
+    return (Number.true if left.value > right.value else Number.false), None
+
+
+def number_lte(left, right):
+    return (Number.true if left.value <= right.value else Number.false), None
+
+
+def number_gte(left, right):
+    return (Number.true if left.value >= right.value else Number.false), None
+
+
+def number_and(left, right):
+    return make_number(int(left.value and right.value)), None
+
+
+def number_or(left, right):
+    return make_number(int(left.value or right.value)), None
+
+
+NUMBER_SPECIALIZATIONS = {
+    'added_by': number_add,
+    'subbed_by': number_sub,
+    'multed_by': number_mul,
+    'dived_by': number_div,
+    'powed_by': number_pow,
+    'get_comparison_eq': number_eq,
+    'get_comparison_ne': number_ne,
+    'get_comparison_lt': number_lt,
+    'get_comparison_gt': number_gt,
+    'get_comparison_lte': number_lte,
+    'get_comparison_gte': number_gte,
+    'anded_by': number_and,
+    'ored_by': number_or,
+}
+
+
+#########  运行时特化（quickening）  ###########
+# 节点多次观察到同样的操作数类型（int/float）后，改为直接对python值运算（见 Interpreter.quicken），
+# 不再查表、不再返回 (result, error) 元组；返回None时（如除数为0）由通用路径处理
+
+# 参与特化的Number.value类型
+QUICK_VALUE_TYPES = (int, float)
+
+
+def quick_div(left, right):
+    if right == 0: return None
+    return make_number(left / right)
+
+
+QUICK_OPERATIONS = {
+    'added_by': lambda left, right: make_number(left + right),
+    'subbed_by': lambda left, right: make_number(left - right),
+    'multed_by': lambda left, right: make_number(left * right),
+    'dived_by': quick_div,
+    'powed_by': lambda left, right: make_number(left ** right),
+    'get_comparison_eq': lambda left, right: Number.true if left == right else Number.false,
+    'get_comparison_ne': lambda left, right: Number.true if left != right else Number.false,
+    'get_comparison_lt': lambda left, right: Number.true if left < right else Number.false,
+    'get_comparison_gt': lambda left, right: Number.true if left > right else Number.false,
+    'get_comparison_lte': lambda left, right: Number.true if left <= right else Number.false,
+    'get_comparison_gte': lambda left, right: Number.true if left >= right else Number.false,
+    'anded_by': lambda left, right: make_number(int(left and right)),
+    'ored_by': lambda left, right: make_number(int(left or right)),
+}
+
+
+class BinaryOperator(object):
+    """
+    二元操作符
+    table: (type(left), type(right)) -> operate(left, right)，返回 (result, error)
+    """
+
+    def __init__(self, method_name):
+        """
+        :param method_name: Value上对应的方法名，如 added_by
+        """
+        self.method_name = method_name
+        self.table = {}
+
+        for left_type in VALUE_TYPES:
+            # 左值类型没有该方法时，任何右值都是非法操作
+            method = getattr(left_type, method_name, illegal)
+            for right_type in VALUE_TYPES:
+                self.table[(left_type, right_type)] = method
+
+        specialization = NUMBER_SPECIALIZATIONS.get(method_name)
+        if specialization:
+            self.table[(Number, Number)] = specialization
+        # 两个操作数的值都是int/float时的运算，见 QUICK_OPERATIONS
+        self.quick = QUICK_OPERATIONS.get(method_name)
+
+    def generic(self, left, right):
+        """
+        表中没有的类型组合（如函数参与运算），按方法名查找
+        :return: (result, error)
+        """
+        method = getattr(type(left), self.method_name, illegal)
+        return method(left, right)
+
+    def __reduce__(self):
+        """pickle（AST缓存）时只保存方法名，加载时取回共享的BinaryOperator"""
+        return binary_operator_named, (self.method_name,)
+
+    def __repr__(self):
+        return self.method_name
+
+
+#########  一元操作  ###########
+
+def number_neg(value):
+    return make_number(-value.value), None
+
+
+def unary_neg(value):
+    return illegal(value)
+
+
+def unary_not(value):
+    method = getattr(type(value), 'notted', illegal)
+    return method(value)
+
+
+def unary_pos(value):
+    return value, None
+
+
+class UnaryOperator(object):
+    """
+    一元操作符
+    table: type(value) -> operate(value)，返回 (result, error)
+    """
+
+    def __init__(self, name, default, specializations=None):
+        """
+        :param name: 操作符名，neg/not/pos
+        :param default: 表中没有的类型使用的实现
+        :param specializations: type -> 特化实现
+        """
+        self.name = name
+        self.generic = default
+        self.table = {value_type: default for value_type in VALUE_TYPES}
+        self.table.update(specializations or {})
+
+    def __reduce__(self):
+        return unary_operator_named, (self.name,)
+
+    def __repr__(self):
+        return self.name
+
+
+BINARY_OPERATORS = {key: BinaryOperator(method_name) for key, method_name in BIN_OP_METHODS.items()}
+
+UNARY_OPERATORS = {
+    TT_MINUS: UnaryOperator('neg', unary_neg, {Number: number_neg}),
+    TT_PLUS: UnaryOperator('pos', unary_pos),
+    (TT_KEYWORD, 'not'): UnaryOperator('not', unary_not),
+}
+
+
+def binary_operator(op_tok):
+    """
+    通过操作符token获得BinaryOperator
+    :return: 不支持的操作符返回None
+    """
+    return BINARY_OPERATORS.get(op_key(op_tok))
+
+
+def unary_operator(op_tok):
+    """通过操作符token获得UnaryOperator"""
+    return UNARY_OPERATORS.get(op_key(op_tok))
+
+
+def binary_operator_named(method_name):
+    """通过方法名获得BinaryOperator"""
+    for operator in BINARY_OPERATORS.values():
+        if operator.method_name == method_name:
+            return operator
+
+
+def unary_operator_named(name):
+    """通过操作符名获得UnaryOperator"""
+    for operator in UNARY_OPERATORS.values():
+        if operator.name == name:
+            return operator
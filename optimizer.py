@@ -0,0 +1,360 @@
+from tokens import *
+from ast_node import *
+from type_operate import Number, String
+
+
+####################
+# OPTIMIZER AST优化
+# 解析之后、执行之前遍历一次AST：
+# 1. 常量折叠：操作数都是字面量的运算，在解析后直接计算成一个 NumberNode/StringNode
+# 2. 代数化简：x * 1、x + 0 等，只在确定x是Number时化简
+# 3. 死代码消除：删除 return/break/continue 之后不可达的语句、条件为常量的if分支
+# 4. 结果使用分析：标记值没有被使用的循环，执行时不再收集每次循环的结果（见 ResultUsage）
+# 运算出错（除数为0、非法操作等）时不折叠，保留到运行时按原来的位置报错
+####################
+
+# 折叠结果的大小上限，避免 "a" * 100000000、2 ^ 100000000 之类的表达式在解析后占用大量内存与时间
+MAX_FOLD_STR_SIZE = 4096
+MAX_FOLD_INT_BITS = 128
+
+# 结果总是Number（0或1）的操作，String、List没有这些方法
+INT_RESULT_METHODS = frozenset((
+    'get_comparison_eq', 'get_comparison_ne', 'get_comparison_lt', 'get_comparison_gt',
+    'get_comparison_lte', 'get_comparison_gte', 'anded_by', 'ored_by',
+))
+
+# 两个int操作数的结果仍然是int
+INT_PRESERVING_METHODS = frozenset(('added_by', 'subbed_by', 'multed_by'))
+
+# 执行后一定跳出当前语句列表的节点
+JUMP_NODES = {ReturnNode: 'return', BreakNode: 'break', ContinueNode: 'continue'}
+
+
+class Optimizer(object):
+    """
+    优化后的节点保留原节点的位置，运行时报错的位置与优化前相同
+    Optimizer类方法名的规则: "optimize_" + ast_node.py中的类名，返回优化后的节点
+    """
+
+    def __init__(self):
+        self.folded = 0 # 折叠的运算个数
+        self.simplified = 0 # 化简的运算个数
+        self.removed = [] # 删除的代码 (位置, 说明)
+        self.unused_loops = 0 # 值没有被使用的循环个数
+
+    def optimize_program(self, node):
+        """
+        优化整个程序，main.run 的入口
+        :param node: Parser生成的AST根节点
+        :return: 优化后的根节点
+        """
+        node = self.optimize(node)
+        self.unused_loops += ResultUsage().mark_program(node)
+        return node
+
+    def optimize(self, node):
+        method_name = f'optimize_{type(node).__name__}'
+        method = getattr(self, method_name, self.optimize_leaf)
+        return method(node)
+
+    def optimize_leaf(self, node):
+        """没有子表达式的节点（NumberNode、StringNode、VarAccessNode等）"""
+        return node
+
+    def stats(self):
+        return (f'optimizer: {self.folded} folded, {self.simplified} simplified, {len(self.removed)} removed, '
+                f'{self.unused_loops} unused loop results')
+
+    def report(self):
+        """
+        删除的代码，按位置排序
+        :return: ['line 3: unreachable statement after return', ...]
+        """
+        removed = sorted(self.removed, key=lambda item: item[0].idx)
+        return [f'line {pos.ln + 1}: {description}' for pos, description in removed]
+
+    def remove(self, node, description):
+        self.removed.append((node.pos_start, description))
+
+    #########  遍历子节点  ###########
+
+    def optimize_ListNode(self, node):
+        """
+        语句列表中 return/break/continue 之后的语句不会执行，直接删除
+        （list字面量中不会出现这些语句）
+        """
+        element_nodes = []
+        for index, element_node in enumerate(node.element_nodes):
+            element_node = self.optimize(element_node)
+            element_nodes.append(element_node)
+            jump = JUMP_NODES.get(type(element_node))
+            if jump:
+                for unreachable in node.element_nodes[index + 1:]:
+                    self.remove(unreachable, f'unreachable statement after {jump}')
+                break
+        node.element_nodes = element_nodes
+        return node
+
+    def optimize_VarAssignNode(self, node):
+        node.value_node = self.optimize(node.value_node)
+        return node
+
+    def optimize_IfNode(self, node):
+        """
+        条件为常量的分支：
+        常量为假 => 删除该分支
+        常量为真 => 该分支作为else，之后的分支与原来的else都不会执行；
+                    之前没有其他分支时，整个if化简为该分支的表达式
+        """
+        cases = []
+        else_case = node.else_case
+        for index, (condition, expr, should_return_null) in enumerate(node.case):
+            condition = self.optimize(condition)
+            if not is_literal(condition):
+                cases.append((condition, self.optimize(expr), should_return_null))
+            elif not condition.value.is_true():
+                self.remove(condition, 'branch with constant false condition')
+            else:
+                for later_condition, _, _ in node.case[index + 1:]:
+                    self.remove(later_condition, 'branch after constant true condition')
+                if node.else_case:
+                    self.remove(node.else_case[0], 'else after constant true condition')
+                else_case = (expr, should_return_null)
+                break
+        node.case = cases
+        if else_case:
+            else_case = (self.optimize(else_case[0]), else_case[1])
+        node.else_case = else_case
+
+        if not cases and else_case and not else_case[1]:
+            # 只剩下一定执行的分支，并且if的值就是该分支的值
+            self.remove(node, 'if with constant condition collapsed')
+            return else_case[0]
+        return node
+
+    def optimize_ForNode(self, node):
+        node.start_value_node = self.optimize(node.start_value_node)
+        node.end_value_node = self.optimize(node.end_value_node)
+        if node.step_value_node:
+            node.step_value_node = self.optimize(node.step_value_node)
+        node.body_node = self.optimize(node.body_node)
+        return node
+
+    def optimize_WhileNode(self, node):
+        node.condition_node = self.optimize(node.condition_node)
+        node.body_node = self.optimize(node.body_node)
+        return node
+
+    def optimize_FuncNode(self, node):
+        node.body_node = self.optimize(node.body_node)
+        return node
+
+    def optimize_CallNode(self, node):
+        node.node_to_call = self.optimize(node.node_to_call)
+        node.arg_nodes = [self.optimize(arg_node) for arg_node in node.arg_nodes]
+        return node
+
+    def optimize_ReturnNode(self, node):
+        if node.node_to_return:
+            node.node_to_return = self.optimize(node.node_to_return)
+        return node
+
+    #########  常量折叠与代数化简  ###########
+
+    def optimize_BinOpNode(self, node):
+        node.left_node = left = self.optimize(node.left_node)
+        node.right_node = right = self.optimize(node.right_node)
+        operator = node.operator
+        if operator is None:
+            return node
+
+        if is_literal(left) and is_literal(right):
+            if not self.can_fold(operator.method_name, left.value.value, right.value.value):
+                return node
+            operate = operator.table.get((type(left.value), type(right.value)), operator.generic)
+            return self.fold(node, operate, left.value, right.value)
+
+        return self.simplify(node, operator.method_name, left, right)
+
+    def optimize_UnaryOpNode(self, node):
+        node.node = operand = self.optimize(node.node)
+        if node.operator is None or not is_literal(operand):
+            return node
+        operate = node.operator.table.get(type(operand.value), node.operator.generic)
+        return self.fold(node, operate, operand.value)
+
+    def fold(self, node, operate, *values):
+        """
+        在解析后执行运算，用结果替换node
+        :return: 出错或结果不适合保存为常量时，返回原节点
+        """
+        try:
+            result, error = operate(*values)
+        except ArithmeticError:
+            # 溢出等python异常，保留到运行时
+            return node
+        if error or not self.fits(result):
+            return node
+
+        self.folded += 1
+        if isinstance(result, String):
+            tok = Token(TT_STRING, result.value)
+            tok.pos_start, tok.pos_end = node.pos_start, node.pos_end
+            return StringNode(tok)
+        tok = Token(TT_INT if isinstance(result.value, int) else TT_FLOAT, result.value)
+        tok.pos_start, tok.pos_end = node.pos_start, node.pos_end
+        return NumberNode(tok)
+
+    def can_fold(self, method_name, left, right):
+        """计算本身代价过高的运算（大数的幂、长字符串的重复）不折叠"""
+        if method_name == 'powed_by' and type(left) is int and type(right) is int and right > 0:
+            return left.bit_length() * right <= MAX_FOLD_INT_BITS
+        if method_name == 'multed_by' and isinstance(left, str) and type(right) is int:
+            return len(left) * right <= MAX_FOLD_STR_SIZE
+        return True
+
+    def fits(self, result):
+        if isinstance(result, String):
+            return len(result.value) <= MAX_FOLD_STR_SIZE
+        if not isinstance(result, Number):
+            return False
+        value = result.value
+        if type(value) is int:
+            return value.bit_length() <= MAX_FOLD_INT_BITS
+        # complex等Lexer无法表示的值不折叠
+        return type(value) is float
+
+    def simplify(self, node, method_name, left, right):
+        """
+        x * 1、1 * x、x ^ 1、x - 0 => x，x为Number时结果与x完全相同
+        x + 0、0 + x => x，x为int时才成立（-0.0 + 0 的结果为 0.0）
+        只去掉运算本身，x中的函数调用等仍然会执行
+        """
+        if method_name == 'multed_by':
+            if is_int_literal(right, 1) and number_kind(left):
+                return self.simplified_to(left)
+            if is_int_literal(left, 1) and number_kind(right):
+                return self.simplified_to(right)
+        elif method_name == 'powed_by':
+            if is_int_literal(right, 1) and number_kind(left):
+                return self.simplified_to(left)
+        elif method_name == 'subbed_by':
+            if is_int_literal(right, 0) and number_kind(left):
+                return self.simplified_to(left)
+        elif method_name == 'added_by':
+            if is_int_literal(right, 0) and number_kind(left) is int:
+                return self.simplified_to(left)
+            if is_int_literal(left, 0) and number_kind(right) is int:
+                return self.simplified_to(right)
+        return node
+
+    def simplified_to(self, node):
+        self.simplified += 1
+        return node
+
+
+class ResultUsage(object):
+    """
+    自顶向下分析每个节点的值是否被使用，把值没有被使用的ForNode、WhileNode标记为 result_unused
+    值没有被使用的情况：
+        顶层不是最后一条的语句（程序的值只关心最后一条语句）
+        多行函数体（不自动返回）、多行if分支、多行循环体中的语句，return的值除外
+        值没有被使用的ListNode、循环中的元素或循环体
+    ResultUsage类方法名的规则: "mark_" + ast_node.py中的类名
+    """
+
+    def __init__(self):
+        self.unused_loops = 0
+
+    def mark_program(self, node):
+        """
+        :return: 标记的循环个数
+        """
+        if isinstance(node, ListNode):
+            for element_node in node.element_nodes[:-1]:
+                self.mark(element_node, False)
+            if node.element_nodes:
+                self.mark(node.element_nodes[-1], True)
+        else:
+            self.mark(node, True)
+        return self.unused_loops
+
+    def mark(self, node, used):
+        """
+        :param used: node的值是否被使用
+        """
+        method_name = f'mark_{type(node).__name__}'
+        method = getattr(self, method_name, self.mark_children)
+        method(node, used)
+
+    def mark_children(self, node, used):
+        """VarAssignNode、BinOpNode、CallNode等，子节点的值都被使用"""
+        for child in child_nodes(node):
+            self.mark(child, True)
+
+    def mark_ListNode(self, node, used):
+        for element_node in node.element_nodes:
+            self.mark(element_node, used)
+
+    def mark_IfNode(self, node, used):
+        for condition, expr, should_return_null in node.case:
+            self.mark(condition, True)
+            self.mark(expr, used and not should_return_null)
+        if node.else_case:
+            expr, should_return_null = node.else_case
+            self.mark(expr, used and not should_return_null)
+
+    def mark_ForNode(self, node, used):
+        self.mark(node.start_value_node, True)
+        self.mark(node.end_value_node, True)
+        if node.step_value_node:
+            self.mark(node.step_value_node, True)
+        self.mark_loop(node, used)
+
+    def mark_WhileNode(self, node, used):
+        self.mark(node.condition_node, True)
+        self.mark_loop(node, used)
+
+    def mark_loop(self, node, used):
+        node.result_unused = not used
+        if node.result_unused and not node.should_return_null:
+            self.unused_loops += 1
+        self.mark(node.body_node, used and not node.should_return_null)
+
+    def mark_FuncNode(self, node, used):
+        # 函数体的值与函数定义处是否被使用无关
+        self.mark(node.body_node, node.should_auto_return)
+
+
+def is_literal(node):
+    return isinstance(node, (NumberNode, StringNode))
+
+
+def is_int_literal(node, value):
+    """node是值为value的int字面量，1.0 不算（int * 1.0 的结果为float）"""
+    return isinstance(node, NumberNode) and type(node.value.value) is int and node.value.value == value
+
+
+def number_kind(node):
+    """
+    静态判断表达式的值是否一定是Number（运行时出错的情况除外）
+    :return: 一定是int返回int，一定是Number返回Number，否则返回None
+    """
+    if isinstance(node, NumberNode):
+        return int if type(node.value.value) is int else Number
+    if isinstance(node, BinOpNode) and node.operator is not None:
+        method_name = node.operator.method_name
+        if method_name in INT_RESULT_METHODS:
+            return int
+        left, right = number_kind(node.left_node), number_kind(node.right_node)
+        if not left or not right:
+            return None
+        if method_name in INT_PRESERVING_METHODS and left is int and right is int:
+            return int
+        return Number
+    if isinstance(node, UnaryOpNode) and node.operator is not None:
+        if node.operator.name == 'not':
+            return int
+        if node.operator.name == 'neg':
+            return number_kind(node.node)
+    return None
@@ -2,46 +2,89 @@ from tokens import *
 from ast_node import *
 from result import ParserResult
 from error import InvalidSyntaxError
+from lexer import TokenStream
+from operators import op_key
+
+####################
+# FIRST SETS FIRST集合
+# 产生式可能的第一个Token：token类型，关键字为 (TT_KEYWORD, 关键字)
+# Parser只看当前的一个Token，就能通过FIRST集合决定使用哪个产生式，不需要尝试解析后再回退
+####################
+
+# expr: var赋值、not、一元 +/-，以及atom可能的开头
+EXPR_FIRST = frozenset((
+    TT_INT, TT_FLOAT, TT_STRING, TT_IDENTIFIER, TT_LPAREN, TT_LSQUARE, TT_PLUS, TT_MINUS,
+    (TT_KEYWORD, 'var'), (TT_KEYWORD, 'not'),
+    (TT_KEYWORD, 'if'), (TT_KEYWORD, 'for'), (TT_KEYWORD, 'while'), (TT_KEYWORD, 'func'),
+))
+
+# statement: return/continue/break 或 expr
+STATEMENT_FIRST = EXPR_FIRST | frozenset((
+    (TT_KEYWORD, 'return'), (TT_KEYWORD, 'continue'), (TT_KEYWORD, 'break'),
+))
+
+
+####################
+# OPERATOR PRECEDENCE 操作符优先级
+# 数字越大结合越紧密，与文法中 expr -> comp-expr -> arith-expr -> term -> power 的层级对应
+####################
+
+PREC_LOGIC = 1 # and or
+PREC_COMPARISON = 2 # == != < > <= >=，not 的操作数从这一级开始
+PREC_ARITH = 3 # + -
+PREC_TERM = 4 # * /
+PREC_POWER = 5 # ^，一元 + - 的操作数从这一级开始
+
+# 二元操作符 -> 优先级，key与 operators.op_key 一致
+BINARY_PRECEDENCE = {
+    (TT_KEYWORD, 'and'): PREC_LOGIC, (TT_KEYWORD, 'or'): PREC_LOGIC,
+    TT_EE: PREC_COMPARISON, TT_NE: PREC_COMPARISON, TT_LT: PREC_COMPARISON,
+    TT_GT: PREC_COMPARISON, TT_LTE: PREC_COMPARISON, TT_GTE: PREC_COMPARISON,
+    TT_PLUS: PREC_ARITH, TT_MINUS: PREC_ARITH,
+    TT_MUL: PREC_TERM, TT_DIV: PREC_TERM,
+    TT_POW: PREC_POWER,
+}
+
+# 右结合：2 ^ 3 ^ 2 => 2 ^ (3 ^ 2)
+RIGHT_ASSOCIATIVE = frozenset((TT_POW,))
+
 
 ####################
 # PARSER 解析器
 ####################
 
 class Parser(object):
+    """
+    预测分析（LL(1)）：每个产生式都由当前Token决定，Token只会向前读取
+    """
+
     def __init__(self, tokens):
+        """
+        :param tokens: Token列表或TokenStream，列表会被包装成TokenStream
+        """
+        if not isinstance(tokens, TokenStream):
+            tokens = TokenStream(tokens, window=None)
         self.tokens = tokens
         self.tok_idx = -1
         self.advance()
 
     def advance(self):
         """
-        从tokens列表中获得下一个token
+        从tokens中获得下一个token
         :return:
         """
         self.tok_idx += 1
-        if self.tok_idx < len(self.tokens):
-            self.current_tok = self.tokens[self.tok_idx]
+        self.current_tok = self.tokens[self.tok_idx]
         return self.current_tok
 
-    def reverse(self, amount=1):
+    def at(self, first_set):
         """
-        从当前位置（self.tok_idx）往前移动amount个位置，获取该位置对应的tokens，与advance函数是相反的操作
-
-        :param amount: 往前amount步
+        当前token是否属于FIRST集合
+        :param first_set: EXPR_FIRST、STATEMENT_FIRST
         :return:
         """
-        self.tok_idx -= amount
-        self.update_current_tok()
-        return self.current_tok
-
-    def update_current_tok(self):
-        """
-        更新当前token
-        如果往前了几步，那么当前的token也需要更新成前几步对应的token
-        :return:
-        """
-        if self.tok_idx >= 0 and self.tok_idx < len(self.tokens):
-            self.current_tok = self.tokens[self.tok_idx]
+        tok = self.current_tok
+        return tok.type in first_set or (tok.type, tok.value) in first_set
 
     def parse(self):
         # 语法解析Tokens
@@ -57,7 +100,7 @@ class Parser(object):
 
     def statements(self):
         """
-        statements  : NEWLINE* expr (NEWLINE+ statement)* NEWLINE*
+        statements  : NEWLINE* statement (NEWLINE+ statement)* NEWLINE*
         :return:
         """
         res = ParserResult()
@@ -72,30 +115,16 @@ class Parser(object):
         if res.error: return res
         statements.append(statement)
 
-        more_statements = True
-        while True:
-            newline_count = 0
+        while self.current_tok.type == TT_NEWLINE:
             while self.current_tok.type == TT_NEWLINE:
                 res.register_advancement()
                 self.advance()
-                newline_count += 1
-            if newline_count == 0:
-                more_statements= False
-            # 没有下一行了，退出循环
-            if not more_statements: break
-            # ??? 为什么使用 try_register 而不是 register ?
-            # 仔细观察规则： statements  :NEWLINE* statement (NEWLINE+ statement)* NEWLINE*
-            # 其中 (NEWLINE+ statement)* NEWLINE* 表示：
-            # (NEWLINE+ statement)*  (NEWLINE+ statement)整体可能出现0次或多次，如果至少出现一次，那么其中的NEWLINE可以出现1次或多次而其中的statement则比如出现
-            # 规则的另外一部分，NEWLINE* 表示NEWLINE可能出现0次或多次
-            # 注意，(NEWLINE+ statement)* 与 NEWLINE*  都以 NEWLINE 开头，也就说，上一个token为NEWLINE，那么它下一个token是否为statement，无法判断
-            # 此时就需要做尝试，通过try_register方法尝试解析，如果解析失败了，则回退
-            statement = res.try_register(self.statement())
-            if not statement:
-                # 解析失败，回退
-                self.reverse(res.to_reverse_count)
-                more_statements = False
-                continue
+            # (NEWLINE+ statement)* 与 NEWLINE* 都以 NEWLINE 开头，换行之后是否还有statement，
+            # 由换行后的第一个token是否属于 FIRST(statement) 决定：
+            # 属于则一定是下一条statement，解析失败就是语法错误；不属于（end、else、EOF等）则statements结束
+            if not self.at(STATEMENT_FIRST): break
+            statement = res.register(self.statement())
+            if res.error: return res
             statements.append(statement)
 
         # 多行逻辑返回list
@@ -117,10 +146,11 @@ class Parser(object):
             self.advance()
 
             # KEYWORD:return expr? => expr? 表示expr出现0次或1次
-            # 语法上运行起返回为空，即只有return关键字
-            expr = res.try_register(self.expr())
-            if not expr:
-                self.reverse(res.to_reverse_count)
+            # 语法上运行起返回为空，即只有return关键字；return之后的token属于 FIRST(expr) 时才有返回值
+            expr = None
+            if self.at(EXPR_FIRST):
+                expr = res.register(self.expr())
+                if res.error: return res
             return res.success(ReturnNode(expr, pos_start, self.current_tok.pos_start.copy()))
 
         if self.current_tok.matches(TT_KEYWORD, 'continue'):
@@ -150,8 +180,9 @@ class Parser(object):
         """
         res = ParserResult()
         # 如果是if
-        cases, else_case = res.register(self.if_expr_cases('if'))
+        all_cases = res.register(self.if_expr_cases('if'))
         if res.error: return res
+        cases, else_case = all_cases
         return res.success(IfNode(cases, else_case))
 
     def if_expr_b(self):
@@ -274,8 +305,9 @@ class Parser(object):
                 # else;
                 #   <expr>;
                 # end
-                new_cases, else_case = res.register(self.if_expr_b_or_c())
+                all_cases = res.register(self.if_expr_b_or_c())
                 if res.error: return res
+                new_cases, else_case = all_cases
                 cases.extend(new_cases)
 
         else:
@@ -287,8 +319,9 @@ class Parser(object):
             if res.error: return res
             cases.append((condition, expr, False))
             # 调用if_expr_b_or_c方法，无论其他层是否换行，都可以通过递归调用来解决
-            new_cases, else_case = res.register(self.if_expr_b_or_c())
+            all_cases = res.register(self.if_expr_b_or_c())
             if res.error: return res
+            new_cases, else_case = all_cases
             cases.extend(new_cases)
         return res.success((cases, else_case))
 
@@ -531,7 +564,9 @@ class Parser(object):
             if res.error: return res
             # should_auto_return设置为True，表示自动返回，此时的函数为一行函数，不需要通过return关键字返回内容
             # func add(a,b) -> a + b  => add函数会返回 a+b 的结果
-            return res.success(FuncNode(var_name_tok, arg_name_toks, node_to_return, True))
+            func_node = FuncNode(var_name_tok, arg_name_toks, node_to_return, True)
+            mark_tail_calls(func_node)
+            return res.success(func_node)
 
         if self.current_tok.type != TT_NEWLINE:
             return res.failure(InvalidSyntaxError(
@@ -555,7 +590,9 @@ class Parser(object):
         self.advance()
         # 此时的函数为多行函数，需要通过return关键字才可返回
         #  func add(a,b); return a + b; end
-        return res.success(FuncNode(var_name_tok, arg_name_toks, body, False))
+        func_node = FuncNode(var_name_tok, arg_name_toks, body, False)
+        mark_tail_calls(func_node)
+        return res.success(func_node)
 
     def call(self):
         """
@@ -742,65 +779,6 @@ class Parser(object):
 
         return res.success(ListNode(element_nodes, pos_start, self.current_tok.pos_end.copy()))
 
-    def power(self):
-        """
-        power       : call (POW factor)*
-        :return:
-        """
-        return self.bin_op(self.call, (TT_POW,), self.factor)
-
-    def factor(self):
-        """
-        factor  : (PLUS|MINUS) factor
-                : power
-        :return:
-        """
-        res = ParserResult()
-        tok = self.current_tok
-
-        # factor  : (PLUS|MINUS) factor
-        if tok.type in (TT_PLUS, TT_MINUS):
-            res.register_advancement()
-            self.advance()
-            factor = res.register(self.factor())
-            if res.error: return res
-            # UnaryOpNode 一元操作 => (PLUS|MINUS) factor
-            return res.success(UnaryOpNode(tok, factor))
-        # factor    : power
-        return self.power()
-
-    def term(self):
-        """
-        term    : factor (MUL|DIV) factor)*
-        :return:
-        """
-        return self.bin_op(self.factor, (TT_MUL, TT_DIV))
-
-    def comp_expr(self):
-        res = ParserResult()
-
-        # comp-expr   : NOT comp-expr
-        if self.current_tok.matches(TT_KEYWORD, 'not'):
-            op_tok = self.current_tok
-            res.register_advancement()
-            self.advance()
-            node = res.register(self.comp_expr())
-            if res.error: return res
-            return res.success(UnaryOpNode(op_tok, node))
-        else:
-            # comp-expr    : arith-expr ((EE|LT|GT|LTE|GTE) arith-expr)*
-            node = res.register(self.bin_op(self.arith_expr, (TT_EE, TT_NE, TT_LT, TT_GT, TT_LTE, TT_GTE)))
-            if res.error:
-                return res.failure(InvalidSyntaxError(
-                    self.current_tok.pos_start, self.current_tok.pos_end,
-                    "Expected int, float, identifier, '+', '-', '(' or 'not'"
-                ))
-            return res.success(node)
-
-    def arith_expr(self):
-        # arith-expr  : term ((PLUS|MINUS) term)*
-        return self.bin_op(self.term, (TT_PLUS, TT_MINUS))
-
     def expr(self):
         """
         表达式
@@ -846,7 +824,7 @@ class Parser(object):
             # 赋值操作 var a = 1 + 4 => KEYWORD: var, Identifier: a, expr: 1 + 4
             return res.success(VarAssignNode(var_name, expr))
         else:
-            node = res.register(self.bin_op(self.comp_expr, ((TT_KEYWORD, 'and'), (TT_KEYWORD, 'or'))))
+            node = res.register(self.binary(PREC_LOGIC))
             if res.error:
                 return res.failure(InvalidSyntaxError(
                     self.current_tok.pos_end, self.current_tok.pos_end,
@@ -856,18 +834,55 @@ class Parser(object):
             return res.success(node)
 
 
-    def bin_op(self, func_a, ops, func_b=None):
-        if func_b == None:
-            func_b = func_a
+    def binary(self, min_prec):
+        """
+        优先级爬升，解析优先级不低于min_prec的二元操作，代替 comp-expr、arith-expr、term、power 逐层的递归
+        无论表达式中有没有操作符，解析一个atom都只需要固定的几层调用
+        :param min_prec: 最低优先级，PREC_LOGIC => expr中and/or之外的部分，PREC_COMPARISON => comp-expr ...
+        :return:
+        """
         res = ParserResult()
-        left = res.register((func_a()))  # 递归调用
-        if res.error: return res
+        left = res.register(self.unary(min_prec))
+        if res.error:
+            if min_prec <= PREC_COMPARISON:
+                # 没有读取任何token就失败时，给出comp-expr的报错
+                return res.failure(InvalidSyntaxError(
+                    self.current_tok.pos_start, self.current_tok.pos_end,
+                    "Expected int, float, identifier, '+', '-', '(' or 'not'"
+                ))
+            return res
 
-        while self.current_tok.type in ops or (self.current_tok.type, self.current_tok.value) in ops:
+        while True:
             op_tok = self.current_tok
+            prec = BINARY_PRECEDENCE.get(op_key(op_tok))
+            if prec is None or prec < min_prec:
+                break
             res.register_advancement()
             self.advance()
-            right = res.register(func_b())
+            # 左结合的右操作数只能包含优先级更高的操作，右结合的可以包含同级操作
+            right = res.register(self.binary(prec if op_tok.type in RIGHT_ASSOCIATIVE else prec + 1))
             if res.error: return res
             left = BinOpNode(left, op_tok, right)
         return res.success(left)
+
+    def unary(self, min_prec):
+        """
+        一元操作与call
+        factor    : (PLUS|MINUS) factor => 操作数为 power
+        comp-expr : NOT comp-expr => 只在min_prec不高于PREC_COMPARISON时允许
+        :return:
+        """
+        tok = self.current_tok
+        if tok.type in (TT_PLUS, TT_MINUS):
+            operand_prec = PREC_POWER
+        elif min_prec <= PREC_COMPARISON and tok.matches(TT_KEYWORD, 'not'):
+            operand_prec = PREC_COMPARISON
+        else:
+            return self.call()
+
+        res = ParserResult()
+        res.register_advancement()
+        self.advance()
+        node = res.register(self.binary(operand_prec))
+        if res.error: return res
+        return res.success(UnaryOpNode(tok, node))
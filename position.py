@@ -1,8 +1,13 @@
+from bisect import bisect_right
+
+
 ####################
 # POSITION 跟踪行号、列号、当前索引，便于定位报错
 ####################
 
 class Position(object):
+    __slots__ = ('idx', 'ln', 'col', 'fn', 'ftxt')
+
     def __init__(self, idx, ln, col, fn, ftxt):
         """
         用于记录位置信息，便于报错时给出具体报错的文件与位置
@@ -29,9 +34,117 @@ class Position(object):
 
         if current_char == '\n': # 换行符
             self.ln += 1 # 行号 + 1
-            self.col += 0 # 列号 归零
+            self.col = 0 # 列号 归零
+
+        return self
+
+    def copy(self):
+        return Position(self.idx, self.ln, self.col, self.fn, self.ftxt)
+
+    def __reduce__(self):
+        """pickle（AST缓存）时按构造参数保存，比默认保存__dict__更小，加载更快"""
+        return Position, (self.idx, self.ln, self.col, self.fn, self.ftxt)
+
+
+####################
+# OFFSET POSITION 只记录偏移量的位置（RegexLexer使用）
+####################
+
+class SourceText(object):
+    """
+    源码文本，同一份源码的所有OffsetPosition共享一个SourceText
+    每行的起始偏移量只在第一次计算行号、列号时（通常是报错时）建立
+    """
+    __slots__ = ('fn', 'ftxt', 'line_starts')
+
+    def __init__(self, fn, ftxt):
+        """
+        :param fn: 文件名
+        :param ftxt: 内容
+        """
+        self.fn = fn
+        self.ftxt = ftxt
+        self.line_starts = None
+
+    def line_col(self, idx):
+        """
+        偏移量对应的 (行号, 列号)，都从0开始
+        :param idx: 偏移量
+        :return:
+        """
+        if self.line_starts is None:
+            line_starts = [0]
+            text = self.ftxt
+            i = text.find('\n')
+            while i >= 0:
+                line_starts.append(i + 1)
+                i = text.find('\n', i + 1)
+            self.line_starts = line_starts
+        ln = bisect_right(self.line_starts, idx) - 1
+        return ln, idx - self.line_starts[ln]
+
+    def __reduce__(self):
+        return SourceText, (self.fn, self.ftxt)
+
+
+class OffsetPosition(object):
+    """
+    与Position接口相同，但只保存偏移量，ln、col 在访问时计算
+    """
+    __slots__ = ('idx', 'source')
+
+    def __init__(self, idx, source):
+        """
+        :param idx: 索引
+        :param source: SourceText
+        """
+        self.idx = idx
+        self.source = source
+
+    @property
+    def ln(self):
+        return self.source.line_col(self.idx)[0]
+
+    @property
+    def col(self):
+        return self.source.line_col(self.idx)[1]
 
+    @property
+    def fn(self):
+        return self.source.fn
+
+    @property
+    def ftxt(self):
+        return self.source.ftxt
+
+    def advance(self, current_char=None):
+        self.idx += 1
         return self
 
     def copy(self):
-        return Position(self.idx, self.ln, self.col, self.fn, self.ftxt)
\ No newline at end of file
+        return OffsetPosition(self.idx, self.source)
+
+    def __reduce__(self):
+        return OffsetPosition, (self.idx, self.source)
+
+
+class EndPosition(OffsetPosition):
+    """
+    Token的结束位置（不包含该位置的字符），与Position一样算作最后一个字符所在的行，
+    否则以换行符结尾的Token会被算到下一行
+    """
+    __slots__ = ()
+
+    @property
+    def ln(self):
+        return self.source.line_col(self.idx - 1)[0]
+
+    @property
+    def col(self):
+        return self.source.line_col(self.idx - 1)[1] + 1
+
+    def copy(self):
+        return EndPosition(self.idx, self.source)
+
+    def __reduce__(self):
+        return EndPosition, (self.idx, self.source)
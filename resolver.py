@@ -0,0 +1,140 @@
+from ast_node import *
+
+
+####################
+# RESOLVER 作用域解析
+####################
+
+# 在任意一个函数中作为局部变量绑定过的变量名（参数、赋值、for循环变量、内部函数名），所有程序共享
+# 作用域是动态的，只有这些名字可能在调用者的Frame中找到；其他名字在函数中直接查全局符号表（见 VM 的 LOAD_GLOBAL）
+LOCAL_NAMES = set()
+
+
+class Scope(object):
+    """
+    函数作用域，每个变量对应Frame中的一个槽位
+    """
+    def __init__(self, local_names):
+        self.local_names = local_names
+        self.slots = {name: slot for slot, name in enumerate(local_names)}
+
+
+class Resolver(object):
+    """
+    在执行前遍历一次AST，把函数的局部变量绑定到该函数Frame中的槽位（slot）
+    与Interpreter的规则一致，var 总是在当前作用域中定义变量，
+    所以函数中被赋值过的变量名（包括参数、for循环变量、内部定义的函数名）都是该函数的局部变量
+    其他变量（slot为None）与Interpreter一样是动态作用域：执行时沿调用者链按名字查找，最后是全局符号表（见 VM.lookup）；
+    没有在任何函数中绑定过的名字（不在 LOCAL_NAMES 中）不会出现在调用者的Frame里，编译成 LOAD_GLOBAL
+    Resolver类方法名的规则: "resolve_" + ast_node.py中的类名
+    """
+
+    def __init__(self):
+        self.scopes = [] # 函数作用域栈，为空表示处于全局
+
+    def resolve(self, node):
+        method_name = f'resolve_{type(node).__name__}'
+        method = getattr(self, method_name, self.resolve_leaf)
+        method(node)
+        return node
+
+    def resolve_leaf(self, node):
+        """没有变量的节点（NumberNode、StringNode、ContinueNode等）"""
+        pass
+
+    def local_slot(self, name):
+        """当前作用域中变量的槽位，全局返回None"""
+        if not self.scopes:
+            return None
+        return self.scopes[-1].slots[name]
+
+    def resolve_ListNode(self, node):
+        for element_node in node.element_nodes:
+            self.resolve(element_node)
+
+    def resolve_VarAccessNode(self, node):
+        # 外层函数的局部变量不绑定：函数被调用时外层函数不一定是调用者
+        node.slot = self.scopes[-1].slots.get(node.var_name_tok.value) if self.scopes else None
+
+    def resolve_VarAssignNode(self, node):
+        self.resolve(node.value_node)
+        node.slot = self.local_slot(node.var_name_tok.value)
+
+    def resolve_BinOpNode(self, node):
+        self.resolve(node.left_node)
+        self.resolve(node.right_node)
+
+    def resolve_UnaryOpNode(self, node):
+        self.resolve(node.node)
+
+    def resolve_IfNode(self, node):
+        for condition, expr, _ in node.case:
+            self.resolve(condition)
+            self.resolve(expr)
+        if node.else_case:
+            self.resolve(node.else_case[0])
+
+    def resolve_ForNode(self, node):
+        self.resolve(node.start_value_node)
+        self.resolve(node.end_value_node)
+        if node.step_value_node:
+            self.resolve(node.step_value_node)
+        node.var_slot = self.local_slot(node.var_name_tok.value)
+        self.resolve(node.body_node)
+
+    def resolve_WhileNode(self, node):
+        self.resolve(node.condition_node)
+        self.resolve(node.body_node)
+
+    def resolve_FuncNode(self, node):
+        if node.var_name_tok:
+            node.var_slot = self.local_slot(node.var_name_tok.value)
+
+        # 参数在前，然后是函数体中赋值过的变量
+        local_names = [arg_name.value for arg_name in node.arg_name_toks]
+        for name in AssignedNames().collect(node.body_node):
+            if name not in local_names:
+                local_names.append(name)
+        node.local_names = local_names
+        LOCAL_NAMES.update(local_names)
+
+        self.scopes.append(Scope(local_names))
+        self.resolve(node.body_node)
+        self.scopes.pop()
+
+    def resolve_CallNode(self, node):
+        self.resolve(node.node_to_call)
+        for arg_node in node.arg_nodes:
+            self.resolve(arg_node)
+
+    def resolve_ReturnNode(self, node):
+        if node.node_to_return:
+            self.resolve(node.node_to_return)
+
+
+class AssignedNames(object):
+    """
+    收集函数体中被赋值的变量名，不进入内部函数的函数体
+    """
+
+    def collect(self, node):
+        self.names = []
+        self.visit(node)
+        return self.names
+
+    def add(self, name):
+        if name not in self.names:
+            self.names.append(name)
+
+    def visit(self, node):
+        if isinstance(node, (VarAssignNode, ForNode)):
+            self.add(node.var_name_tok.value)
+        elif isinstance(node, FuncNode):
+            # 内部函数的函数名属于当前作用域，函数体属于内部函数自己的作用域
+            if node.var_name_tok:
+                self.add(node.var_name_tok.value)
+            return
+
+        for child in child_nodes(node):
+            self.visit(child)
+
@@ -8,7 +8,6 @@ class ParserResult(object):
         self.node = None
         self.advance_count = 0 # 便于选择不同的报错，具体看failure方法
         self.last_registered_advance_count = 0
-        self.to_reverse_count = 0 # 反向操作个数
 
     def register_advancement(self):
         self.advance_count += 1
@@ -21,13 +20,6 @@ class ParserResult(object):
             self.error = parser_result.error
         return parser_result.node
 
-    def try_register(self, parser_result):
-        if parser_result.error:
-            # 失败，则记录要回退的步数，用于回到执行前，所在的tokens列表中的位置
-            self.to_reverse_count = parser_result.advance_count
-            return None
-        return self.register(parser_result)
-
     def success(self, node):
         self.node = node
         return self
@@ -53,6 +45,8 @@ class RTResult(object):
         self.func_return_value = None
         self.loop_should_continue = False
         self.loop_should_break = False
+        # 尾调用：(要调用的函数, 参数)，由外层函数的execute循环执行
+        self.tail_call = None
 
     def register(self, res):
         if res.error:
@@ -60,6 +54,7 @@ class RTResult(object):
         self.func_return_value = res.func_return_value
         self.loop_should_continue = res.loop_should_continue
         self.loop_should_break = res.loop_should_break
+        self.tail_call = res.tail_call
         return res.value
 
     def success(self, value):
@@ -82,17 +77,24 @@ class RTResult(object):
         self.loop_should_break = True
         return self
 
+    def success_tail_call(self, func, args):
+        self.reset()
+        self.tail_call = (func, args)
+        return self
+
     def should_return(self):
         # 其中一个为True，则返回True
         # 即：self.error 存错误，返回True；
         # self.func_return_value函数有返回值返回True；
         # self.loop_should_continue跳过此次循环返回True
         # self.loop_should_break 跳出此次循环返回True
+        # self.tail_call 尾调用，交给外层函数执行返回True
         return (
             self.error or
             self.func_return_value or
             self.loop_should_continue or
-            self.loop_should_break
+            self.loop_should_break or
+            self.tail_call
         )
 
     def failure(self, error):
@@ -1,20 +1,27 @@
 import sys
+import argparse
 
-from main import run
+from main import run, parse, MODES, MAX_CALL_DEPTH
+from cache import ASTCache
+from optimizer import Optimizer
+from transpiler import Transpiler
+from tiered import TieredInterpreter
+from interpreter import Interpreter
 
-def shell():
+def shell(mode, max_call_depth):
     while True:
         text = input("toypl > ")
         if text == 'exit':
             print('bye')
             break
-        result, error = run('<stdin>', text)
+        result, error = run('<stdin>', text, mode, max_call_depth)
         if error:
             print(error.as_string())
         elif result:
             print(result.elements[-1])
 
-def exec_fn(fn_path):
+def exec_fn(fn_path, mode, max_call_depth, use_cache=True, cache_stats=False, optimizer_report=False, tier_trace=False,
+            quicken_stats=False):
     try:
         with open(fn_path, 'r') as f:
             script = f.read()
@@ -22,14 +29,56 @@ def exec_fn(fn_path):
         print(f'Faild to load script {fn_path}, error: {e}')
         raise
 
-    result, error = run(fn_path, script)
+    cache = ASTCache.for_script(fn_path) if use_cache else None
+    optimizer = Optimizer()
+    tiered = TieredInterpreter(fn_path)
+    interpreter = Interpreter()
+    result, error = run(fn_path, script, mode, max_call_depth, cache, optimizer=optimizer, tiered=tiered,
+                        interpreter=interpreter)
+    if cache and cache_stats:
+        print(cache.stats(), file=sys.stderr)
+    if optimizer_report:
+        print(optimizer.stats(), file=sys.stderr)
+        for line in optimizer.report():
+            print(f'  {line}', file=sys.stderr)
+    if tier_trace and mode == 'tiered':
+        print(tiered.stats(), file=sys.stderr)
+        for line in tiered.report():
+            print(f'  {line}', file=sys.stderr)
+    if quicken_stats and mode in ('interpreter', 'tiered'):
+        print((tiered if mode == 'tiered' else interpreter).quicken_stats(), file=sys.stderr)
     if error:
         print(error.as_string())
     elif result:
         print(result.elements[-1])
 
-if len(sys.argv) > 1:
-    fn_path = sys.argv[1]
-    exec_fn(fn_path)
+def emit_python(fn_path):
+    """输出 --mode python 执行时生成的python源码"""
+    with open(fn_path, 'r') as f:
+        script = f.read()
+    node, error = parse(fn_path, script)
+    if error:
+        print(error.as_string())
+        return
+    program = Transpiler(fn_path).transpile(Optimizer().optimize_program(node))
+    print(program.source if program.source else f'# fallback to closure mode: {program.fallback_reason}')
+
+arg_parser = argparse.ArgumentParser(description='Toy Programming language')
+arg_parser.add_argument('script', nargs='?', help='toypl脚本路径，不传则进入交互模式')
+arg_parser.add_argument('--mode', choices=MODES, default='interpreter', help='执行模式')
+arg_parser.add_argument('--max-call-depth', type=int, default=MAX_CALL_DEPTH, help='vm模式下函数调用的最大深度')
+arg_parser.add_argument('--no-cache', action='store_true', help='不使用 __toyplcache__ 中缓存的AST')
+arg_parser.add_argument('--cache-stats', action='store_true', help='执行结束后输出缓存命中统计')
+arg_parser.add_argument('--emit-python', action='store_true', help='不执行，输出脚本转译成的python源码（见 transpiler.py）')
+arg_parser.add_argument('--tier-trace', action='store_true', help='tiered模式执行结束后输出函数的升级与退回记录')
+arg_parser.add_argument('--quicken-stats', action='store_true', help='interpreter/tiered模式执行结束后输出运行时特化的节点数')
+arg_parser.add_argument('--optimizer-report', action='store_true', help='执行结束后输出AST优化统计与删除的代码')
+options = arg_parser.parse_args(sys.argv[1:])
+
+if options.script and options.emit_python:
+    emit_python(options.script)
+elif options.script:
+    exec_fn(options.script, options.mode, options.max_call_depth, not options.no_cache, options.cache_stats,
+            options.optimizer_report, options.tier_trace, options.quicken_stats)
 else:
-    shell()
+    shell(options.mode, options.max_call_depth)
@@ -15,12 +15,14 @@ class SymbolTable(object):
         :param name: 变量名
         :return:
         """
-        value = self.symbols.get(name, None)
-        if value == None and self.parent:
+        table = self
+        value = table.symbols.get(name, None)
+        while value == None and table.parent:
             # 存在parent父对象，则说明此时可能在函数或类中寻找某变量
             # 如果变量不存在，则尝试搜索全局变量，即它的parent对应的symbols
-            # 疑惑：函数嵌套，此时可能会有多级parent，不应该使用while吗？
-            return self.parent.get(name)
+            # 函数嵌套（包括尾调用）时会有多级parent，使用while逐级查找，不占用python调用栈
+            table = table.parent
+            value = table.symbols.get(name, None)
         return value
 
     def set(self, name, value):
@@ -39,3 +41,24 @@ class SymbolTable(object):
         :return:
         """
         del self.symbols[name]
+
+
+class Frame(object):
+    """
+    函数的局部变量帧，局部变量通过Resolver计算出的槽位访问，取值不随调用深度变慢
+    """
+    def __init__(self, local_names, slot_map):
+        """
+        :param local_names: 局部变量名，下标即槽位
+        :param slot_map: 变量名 -> 槽位，其他函数按名字查找调用者的变量时使用
+        """
+        self.slots = [None] * len(local_names)
+        self.slot_map = slot_map
+
+    def get(self, name):
+        """
+        按变量名取值
+        :return: 不是该函数的局部变量，或者还没有赋值时返回None
+        """
+        slot = self.slot_map.get(name)
+        return None if slot is None else self.slots[slot]
@@ -1,8 +1,14 @@
+import sys
+
 from main import run
 
 
+# 执行模式，python test.py vm 则使用虚拟机执行全部测试
+MODE = sys.argv[1] if len(sys.argv) > 1 else 'interpreter'
+
+
 def func(text):
-    result, error = run('<stdin>', text)
+    result, error = run('<stdin>', text, MODE)
     if error:
         print(error.as_string())
     elif result:
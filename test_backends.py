@@ -0,0 +1,171 @@
+import os
+import sys
+import subprocess
+
+import pytest
+
+from test_modes import reset_globals, run_all_modes
+from main import parse
+from context import Context
+from result import RTResult
+from built_variable import global_symbol_table
+from ast_node import FuncNode, child_nodes
+from transpiler import Transpiler
+from optimizer import Optimizer
+from closure_compiler import ClosureCompiler, raise_for, ReturnSignal, ContinueSignal, BreakSignal, ErrorSignal, \
+    TailCallSignal
+
+
+####################
+# 闭包编译（closure_compiler.py）与python转译（transpiler.py）
+# python -m pytest test_backends.py
+####################
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def program_context():
+    reset_globals()
+    context = Context('<program>')
+    context.symbol_table = global_symbol_table
+    return context
+
+
+def all_nodes(node):
+    found = []
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        found.append(node)
+        stack.extend(child_nodes(node))
+    return found
+
+
+def load_script():
+    with open(os.path.join(HERE, 'test_toypl.pl'), encoding='utf-8') as f:
+        return f.read()
+
+
+def test_closures_compiled_once():
+    node, error = parse('test_toypl.pl', load_script())
+    compiler = ClosureCompiler()
+    compiler.compile(node)
+    # 编译时每个节点（包括函数体）都生成了闭包
+    assert set(compiler.closures) == set(all_nodes(node))
+    assert any(isinstance(child, FuncNode) for child in compiler.closures)
+
+    closures = dict(compiler.closures)
+    for _ in range(2):
+        res = compiler.visit(node, program_context())
+        assert res.error is None
+        assert repr(res.value.elements[-1]) == '[1, 1, 2, 3, 5, 8, 13, 21, 34, 55]'
+    # 执行（包括调用函数）时不再编译
+    assert compiler.closures == closures
+
+
+@pytest.mark.parametrize('res, signal', [
+    (RTResult().success_return('value'), ReturnSignal),
+    (RTResult().success_continue(), ContinueSignal),
+    (RTResult().success_break(), BreakSignal),
+    (RTResult().failure('error'), ErrorSignal),
+    (RTResult().success_tail_call('func', ('arg',)), TailCallSignal),
+])
+def test_signals_round_trip(res, signal):
+    with pytest.raises(signal) as info:
+        raise_for(res)
+    back = info.value.to_result()
+    assert (back.error, back.func_return_value, back.loop_should_continue, back.loop_should_break, back.tail_call) == \
+        (res.error, res.func_return_value, res.loop_should_continue, res.loop_should_break, res.tail_call)
+
+
+def test_signals_in_nested_closures():
+    # return/break/continue 穿过多层闭包，与解释器的结果相同
+    text = ('func first_even(limit)\n'
+            '    var i = 0\n'
+            '    while 1 then\n'
+            '        var i = i + 1\n'
+            '        if i > limit then break\n'
+            '        if i == 1 or i == 3 then continue\n'
+            '        for j = 0 to 3 then\n'
+            '            if j == 1 then return [i, j]\n'
+            '        end\n'
+            '    end\n'
+            '    return -1\n'
+            'end\n'
+            '[first_even(5), first_even(1)]')
+    assert run_all_modes(text) == '[2, 1, -1]'
+
+
+@pytest.mark.parametrize('mode', ['closure', 'python'])
+def test_suite_output_matches_interpreter(mode):
+    # test.py 的输出与解释器相同
+    def output(mode):
+        return subprocess.run([sys.executable, 'test.py', mode], cwd=HERE, capture_output=True, text=True,
+                              timeout=300).stdout
+    assert output(mode) == output('interpreter')
+
+
+def transpile(text):
+    node, error = parse('<test>', text)
+    assert error is None
+    return node, Transpiler('<test>').transpile(node)
+
+
+def nested_loops(depth):
+    lines = ['    ' * level + f'for i{level} = 0 to 1 then' for level in range(depth)]
+    lines.append('    ' * depth + 'var x = 7')
+    lines.extend('    ' * level + 'end' for level in reversed(range(depth)))
+    return '\n'.join(lines) + '\nx'
+
+
+def test_generated_source():
+    node, program = transpile('func double(n) -> n * 2\ndouble(21)')
+    assert program.fallback_reason is None
+    # 程序最先开始生成，函数体依次编号
+    assert 'def _body_0(context):  # <program>' in program.source
+    assert 'def _body_1(context):  # func double, line 1' in program.source
+    # 生成的源码可以编译执行
+    compile(program.source, program.filename, 'exec')
+    res = program.visit(node, program_context())
+    assert repr(res.value.elements[-1]) == '42'
+
+
+def test_fallback_to_closures():
+    # python最多20层嵌套的代码块（每层循环占用for与try两层），超过时整个程序交给ClosureCompiler执行
+    node, program = transpile(nested_loops(10))
+    assert program.fallback_reason.startswith('SyntaxError: too many statically nested blocks')
+    assert program.source is None
+    res = program.visit(node, program_context())
+    assert repr(res.value.elements[-1]) == '7'
+    node, program = transpile(nested_loops(9))
+    assert program.fallback_reason is None
+
+
+def test_python_exception_has_toypl_position():
+    # append 的参数不是List时，内建函数中抛出python异常（解释器中同样会抛出）
+    node, program = transpile('var a = 1\nappend(a, 2)')
+    with pytest.raises(TypeError) as info:
+        program.visit(node, program_context())
+    assert info.value.__notes__ == ['  ToyPL File <test>, line 2, in _body_0']
+    assert program.position_of(1) is None
+
+
+def test_python_semantics_preserved():
+    # List是值语义、没有返回值时返回null、var在当前符号表中重新绑定
+    text = ('var a = [1, 2]\n'
+            'var b = a\n'
+            'var b = b + 3\n'
+            'func nothing()\n'
+            '    var a = 5\n'
+            'end\n'
+            '[a, b, nothing(), a]')
+    assert run_all_modes(text) == '[1, 2, 1, 2, 3, 0, 1, 2]'
+
+
+def test_constant_loop_body():
+    # 值没有被使用、循环体为常量时，try块中没有语句
+    for text in ('for i = 0 to 3 then 1\n5', 'while 0 then "s"\n5', 'func f(n)\n    for i = 0 to n then 1\nend\nf(3)\n5'):
+        node, error = parse('<test>', text)
+        program = Transpiler('<test>').transpile(Optimizer().optimize_program(node))
+        assert program.fallback_reason is None, text
+    assert run_all_modes('var n = 0\nfor i = 0 to 3 then 1\nwhile n < 2 then var n = n + 1\nn') == '2'
@@ -0,0 +1,85 @@
+import os
+
+import cache
+from test_modes import reset_globals
+from main import run
+from cache import ASTCache
+
+
+####################
+# AST缓存（cache.py）
+# python -m pytest test_cache.py
+####################
+
+SCRIPT = ('func sum(n, acc)\n'
+          '    if n == 0 then return acc\n'
+          '    return sum(n - 1, acc + n)\n'
+          'end\n'
+          'sum(%d, 0)')
+
+
+def run_cached(ast_cache, text, mode='interpreter'):
+    reset_globals()
+    result, error = run('script.pl', text, mode, cache=ast_cache)
+    assert error is None
+    return repr(result.elements[-1])
+
+
+def counts(ast_cache):
+    return ast_cache.hits, ast_cache.misses, ast_cache.invalid, ast_cache.stores
+
+
+def test_hit_after_store(tmp_path):
+    ast_cache = ASTCache(str(tmp_path))
+    assert run_cached(ast_cache, SCRIPT % 10) == '55'
+    assert os.path.exists(ast_cache.path('script.pl'))
+    assert run_cached(ast_cache, SCRIPT % 10) == '55'
+    assert counts(ast_cache) == (1, 1, 0, 1)
+
+
+def test_modified_script_is_reparsed(tmp_path):
+    ast_cache = ASTCache(str(tmp_path))
+    run_cached(ast_cache, SCRIPT % 10)
+    assert run_cached(ast_cache, SCRIPT % 20) == '210'
+    assert counts(ast_cache) == (0, 2, 0, 2)
+    # 覆盖后的缓存对应新的脚本
+    assert run_cached(ast_cache, SCRIPT % 20) == '210'
+    assert ast_cache.hits == 1
+
+
+def test_version_change_is_a_miss(tmp_path, monkeypatch):
+    ast_cache = ASTCache(str(tmp_path))
+    run_cached(ast_cache, SCRIPT % 10)
+    monkeypatch.setattr(cache, 'CACHE_VERSION', cache.CACHE_VERSION + 1)
+    assert run_cached(ast_cache, SCRIPT % 10) == '55'
+    assert counts(ast_cache) == (0, 2, 0, 2)
+
+
+def test_corrupt_entry_is_rebuilt(tmp_path):
+    ast_cache = ASTCache(str(tmp_path))
+    run_cached(ast_cache, SCRIPT % 10)
+    path = ast_cache.path('script.pl')
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) // 2)
+    assert run_cached(ast_cache, SCRIPT % 10) == '55'
+    assert counts(ast_cache) == (0, 2, 1, 2)
+    assert run_cached(ast_cache, SCRIPT % 10) == '55'
+    assert ast_cache.hits == 1
+
+
+def test_unwritable_cache_is_ignored(tmp_path):
+    # 缓存目录的位置是一个文件，无法创建目录
+    blocker = tmp_path / 'blocker'
+    blocker.write_text('')
+    ast_cache = ASTCache(str(blocker))
+    assert run_cached(ast_cache, SCRIPT % 10) == '55'
+    assert counts(ast_cache) == (0, 1, 0, 0)
+    assert os.listdir(str(tmp_path)) == ['blocker']
+
+
+def test_tail_calls_survive_cache(tmp_path):
+    # 从缓存加载的AST保留尾调用标记，递归深度超过python的递归上限
+    ast_cache = ASTCache(str(tmp_path))
+    for mode in ('interpreter', 'vm'):
+        assert run_cached(ast_cache, SCRIPT % 2000, mode) == '2001000'
+    assert ast_cache.hits == 1
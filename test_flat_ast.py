@@ -0,0 +1,92 @@
+import os
+
+import pytest
+
+from test_modes import reset_globals
+from main import parse
+from lexer import Lexer
+from parser import Parser
+from interpreter import Interpreter
+from context import Context
+from built_variable import global_symbol_table
+from position import SourceText
+from ast_node import BinOpNode, child_nodes
+from flat_ast import FlatAST, BIN_OP
+
+
+####################
+# 扁平化的AST（flat_ast.py）
+# python -m pytest test_flat_ast.py
+####################
+
+def load_script():
+    with open(os.path.join(os.path.dirname(__file__), 'test_toypl.pl'), encoding='utf-8') as f:
+        return f.read()
+
+
+def execute(node):
+    reset_globals()
+    context = Context('<program>')
+    context.symbol_table = global_symbol_table
+    result = Interpreter().visit(node, context)
+    assert result.error is None
+    return repr(result.value.elements[-1])
+
+
+def count_nodes(node, node_class):
+    count = 0
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, node_class): count += 1
+        stack.extend(child_nodes(node))
+    return count
+
+
+def round_trip(fn, text):
+    node, error = parse(fn, text)
+    assert error is None
+    data = FlatAST.from_node(node).to_bytes()
+    return node, FlatAST.from_bytes(data).to_node(SourceText(fn, text)), data
+
+
+def test_round_trip():
+    text = load_script()
+    node, decoded, data = round_trip('test_toypl.pl', text)
+    # 还原出的AST再次编码，得到相同的bytes
+    assert FlatAST.from_node(decoded).to_bytes() == data
+    assert execute(decoded) == execute(node) == '[1, 1, 2, 3, 5, 8, 13, 21, 34, 55]'
+
+
+def test_decoded_positions():
+    text = 'var a = 1\nvar b = a + 2 * (3 - 3)\na / (b - 1)'
+    node, decoded, _ = round_trip('<test>', text)
+    reset_globals()
+    context = Context('<program>')
+    context.symbol_table = global_symbol_table
+    error = Interpreter().visit(decoded, context).error
+    assert (error.pos_start.ln, error.pos_start.col, error.pos_end.col) == (2, 5, 10)
+
+
+def test_kinds_scan():
+    node, error = parse('<test>', load_script())
+    flat = FlatAST.from_node(node)
+    assert len(flat) == count_nodes(node, object)
+    assert flat.kinds.count(BIN_OP) == count_nodes(node, BinOpNode)
+
+
+def test_deep_chain_without_recursion():
+    # 5000层左结合的加法，编码与还原都不递归（解释执行需要递归，这里只比较结构）
+    text = '1' + ' + 1' * 5000
+    node, decoded, data = round_trip('<test>', text)
+    assert FlatAST.from_node(decoded).to_bytes() == data
+    assert FlatAST.from_bytes(data).kinds.count(BIN_OP) == 5000
+
+
+def test_lexer_positions_rejected():
+    # Lexer生成的Position带有行号、列号，不能编码
+    tokens, error = Lexer('<test>', 'var a = 1 + 2').make_tokens()
+    assert error is None
+    node = Parser(tokens).parse().node
+    with pytest.raises(ValueError):
+        FlatAST.from_node(node)
@@ -0,0 +1,100 @@
+import os
+
+import pytest
+
+from main import parse
+from lexer import Lexer, RegexLexer, TokenStream, BacktrackError
+from parser import Parser
+from flat_ast import FlatAST
+
+
+####################
+# 词法分析
+# python -m pytest test_lexer.py
+####################
+
+SNIPPETS = [
+    'var a = 1 + 2.5 * (3 - 4) / 5 ^ 6',
+    'if a >= 1 and b <= 2 or not c != 3 then "yes" elif a == b then "no" else d < e',
+    'func add(a, b) -> a + b\n\nadd(1, 2)',
+    '"tab\\tnew\\nline \\"quote\\"" # comment\n[1, 2, 3]',
+    'for i = 0 to 10 step -1 then\n    continue\nend\nwhile 1 then break',
+    '"unterminated',
+]
+
+
+def token_layout(tokens):
+    return [(token.type, token.value, token.pos_start.ln, token.pos_start.col, token.pos_end.ln, token.pos_end.col)
+            for token in tokens]
+
+
+@pytest.mark.parametrize('text', SNIPPETS)
+def test_regex_lexer_matches_lexer(text):
+    tokens, error = Lexer('<test>', text).make_tokens()
+    regex_tokens, regex_error = RegexLexer('<test>', text).make_tokens()
+    assert error is None and regex_error is None
+    assert token_layout(regex_tokens) == token_layout(tokens)
+
+
+def test_regex_lexer_matches_lexer_on_script():
+    with open(os.path.join(os.path.dirname(__file__), 'test_toypl.pl'), encoding='utf-8') as f:
+        text = f.read()
+    assert token_layout(RegexLexer('<test>', text).make_tokens()[0]) == token_layout(Lexer('<test>', text).make_tokens()[0])
+
+
+@pytest.mark.parametrize('text', ['var a = 1 @ 2', 'a !b', 'var s = "ok"\n  $'])
+def test_regex_lexer_errors_match_lexer(text):
+    _, error = Lexer('<test>', text).make_tokens()
+    _, regex_error = RegexLexer('<test>', text).make_tokens()
+    assert regex_error.as_string() == error.as_string()
+
+
+def test_line_column_computed_lazily():
+    lexer = RegexLexer('<test>', 'var a = 1\nvar b = 2')
+    tokens, _ = lexer.make_tokens()
+    assert lexer.source.line_starts is None
+    assert all(token.pos_start.source is lexer.source for token in tokens)
+    token = tokens[-2]
+    assert (token.value, token.pos_start.ln, token.pos_start.col) == (2, 1, 8)
+    assert lexer.source.line_starts == [0, 10]
+
+
+def test_trailing_comment_without_newline():
+    tokens, error = RegexLexer('<test>', 'var x = 1 # comment').make_tokens()
+    assert error is None
+    assert [token.type for token in tokens][-2:] == ['INT', 'EOF']
+
+
+def test_token_stream_keeps_a_bounded_window():
+    text = ' + '.join(['1'] * 500)
+    stream = TokenStream(RegexLexer('<test>', text).generate_tokens(), window=8)
+    types = []
+    idx = 0
+    while True:
+        token = stream[idx]
+        types.append(token.type)
+        assert len(stream.buffer) <= 16
+        if token.type == 'EOF':
+            break
+        idx += 1
+    assert types == [token.type for token in RegexLexer('<test>', text).make_tokens()[0]]
+    # 超出EOF的下标都返回EOF
+    assert stream[idx + 10] is stream.eof
+    with pytest.raises(BacktrackError):
+        stream[idx - 20]
+
+
+def test_stream_and_list_parse_the_same():
+    with open(os.path.join(os.path.dirname(__file__), 'test_toypl.pl'), encoding='utf-8') as f:
+        text = f.read()
+    tokens, _ = RegexLexer('<test>', text).make_tokens()
+    from_list = Parser(tokens).parse().node
+    from_stream = Parser(TokenStream(RegexLexer('<test>', text).generate_tokens())).parse().node
+    assert FlatAST.from_node(from_stream).to_bytes() == FlatAST.from_node(from_list).to_bytes()
+
+
+def test_lex_error_reported_before_syntax_error():
+    # 解析在第一行就失败，但与先完成词法分析一样，报告后面的词法错误
+    _, error = parse('<test>', 'var = 1\nvar b = 2 @ 3')
+    assert error.error_name == 'Illegal Character'
+    assert error.pos_start.ln == 1
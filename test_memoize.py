@@ -0,0 +1,104 @@
+import pytest
+
+from test_modes import run_program, run_all_modes
+from function import Function, MemoizedFunction, MemoCache, memo_key, MEMOIZE_MAX_SIZE
+from type_operate import List, String, make_number
+
+
+####################
+# memoize / memo_stats
+# python -m pytest test_memoize.py
+####################
+
+def test_vm_memoized_recursion():
+    # VM中记忆化的字节码函数压栈执行，不嵌套调用run，不受python递归上限影响
+    text = ('func count(n) -> if n == 0 then 0 else count(n - 1) + 1\n'
+            'var count = memoize(count, 100000)\n'
+            '[count(3000), memo_stats(count)]')
+    assert run_program(text, 'vm') == '[3000, 0, 3001, 3001]'
+
+
+def test_vm_memoized_call_depth():
+    # 超过 max_call_depth 时报错，而不是python的RecursionError
+    text = ('func count(n) -> if n == 0 then 0 else count(n - 1) + 1\n'
+            'var count = memoize(count, 100000)\n'
+            'count(20000)')
+    assert run_program(text, 'vm') == 'Runtime Error: Maximum call depth exceeded (10000)'
+
+
+def test_memoized_tail_call():
+    # 尾调用记忆化的函数，每一层的结果都写入缓存
+    text = ('func down(n, acc) -> if n == 0 then acc else down(n - 1, acc + 1)\n'
+            'var down = memoize(down, 3)\n'
+            '[down(50, 0), memo_stats(down), down(50, 0), memo_stats(down)]')
+    assert run_all_modes(text) == '[50, 0, 51, 3, 50, 1, 51, 3]'
+
+
+@pytest.mark.parametrize('text, expected', [
+    # 函数体直接调用有副作用的内建函数
+    ('func loud(n)\n'
+     '    print(n)\n'
+     '    return n\n'
+     'end\n'
+     'memoize(loud)', "Runtime Error: Cannot memoize 'loud', it calls 'print'"),
+    # 通过其他函数间接调用
+    ('func helper(x) -> append([], x)\n'
+     'func outer(n) -> helper(n) + 1\n'
+     'memoize(outer)', "Runtime Error: Cannot memoize 'outer', it calls 'append'"),
+    ('memoize(1)', 'Runtime Error: First argument must be function'),
+    ('func f(n) -> n\nmemoize(f, 0)', 'Runtime Error: Secord argument must be positive integer'),
+    ('func f(n) -> n\nmemoize(f, 1.5)', 'Runtime Error: Secord argument must be positive integer'),
+    ('memo_stats(len)', 'Runtime Error: Argment must be memoized function'),
+])
+def test_memoize_refused(text, expected):
+    assert run_all_modes(text) == expected
+
+
+def test_lru_eviction():
+    # sq(1) 命中后成为最近使用的结果，sq(3) 淘汰的是 sq(2)
+    text = ('func sq(n) -> n * n\n'
+            'var sq = memoize(sq, 2)\n'
+            '[sq(1), sq(2), sq(1), sq(3), sq(2), memo_stats(sq)]')
+    assert run_all_modes(text) == '[1, 4, 1, 9, 4, 1, 4, 2]'
+
+
+def test_default_max_size():
+    text = ('func sq(n) -> n * n\n'
+            'var sq = memoize(sq)\n'
+            'for i = 0 to 200 then sq(i)\n'
+            'memo_stats(sq)')
+    assert run_all_modes(text) == f'[0, 200, {MEMOIZE_MAX_SIZE}]'
+
+
+def test_keys_distinguish_int_and_float():
+    text = ('func half(n) -> n / 2\n'
+            'var half = memoize(half)\n'
+            '[half(1), half(1.0), half(1), memo_stats(half)]')
+    assert run_all_modes(text) == '[0.5, 0.5, 0.5, 1, 2, 2]'
+    assert memo_key(make_number(1)) != memo_key(make_number(1.0))
+    assert memo_key(List([make_number(1), String('a')])) == memo_key(List([make_number(1), String('a')]))
+    # 函数不能作为key：每次都执行，不缓存
+    text = ('func one(x) -> 1\n'
+            'var one = memoize(one)\n'
+            '[one(len), one(len), memo_stats(one)]')
+    assert run_all_modes(text) == '[1, 1, 0, 2, 0]'
+
+
+def test_cached_lists_are_copied():
+    cache = MemoCache(4)
+    memoized = MemoizedFunction(Function('pair', None, [], True), cache)
+    key, value = memoized.lookup([make_number(1)])
+    assert value is None
+    result = List([make_number(1)])
+    memoized.store(key, result)
+    _, first = memoized.lookup([make_number(1)])
+    _, second = memoized.lookup([make_number(1)])
+    assert first is not second and first is not cache.values[key] and cache.values[key] is not result
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_memoized_fib():
+    text = ('func Fib(n) -> if n < 2 then n else Fib(n - 1) + Fib(n - 2)\n'
+            'var Fib = memoize(Fib)\n'
+            '[Fib(60), memo_stats(Fib)]')
+    assert run_all_modes(text) == '[1548008755920, 58, 61, 61]'
@@ -0,0 +1,175 @@
+import os
+
+import pytest
+
+from main import run, MODES
+from built_variable import global_symbol_table
+
+
+####################
+# 各执行模式的对比测试：同一段程序在所有模式（见 main.MODES）下的结果与报错必须相同
+# python -m pytest test_modes.py
+####################
+
+# 全局符号表在多次run之间共享，每次执行前恢复成只有内建变量
+BUILTIN_SYMBOLS = dict(global_symbol_table.symbols)
+
+
+def reset_globals():
+    global_symbol_table.symbols.clear()
+    global_symbol_table.symbols.update(BUILTIN_SYMBOLS)
+
+
+def run_program(text, mode):
+    """
+    :return: 最后一条语句的值（repr）或报错信息
+    """
+    reset_globals()
+    result, error = run('<test>', text, mode)
+    if error:
+        return f'{error.error_name}: {error.details}'
+    return repr(result.elements[-1])
+
+
+def run_all_modes(text):
+    """
+    :return: 所有模式相同的结果
+    """
+    results = {mode: run_program(text, mode) for mode in MODES}
+    assert len(set(results.values())) == 1, results
+    return results['interpreter']
+
+
+# 作用域是动态的：函数中不是局部变量的名字，沿调用者链查找
+SCOPE_PROGRAMS = [
+    # 被调用的函数读取调用者的局部变量
+    ('func callee() -> y\n'
+     'func caller()\n'
+     '    var y = 5\n'
+     '    return callee()\n'
+     'end\n'
+     'caller()', '5'),
+    # 调用者的局部变量遮蔽全局变量
+    ('var x = 1\n'
+     'func show() -> x\n'
+     'func wrap()\n'
+     '    var x = 2\n'
+     '    return show()\n'
+     'end\n'
+     '[wrap(), show()]', '[2, 1]'),
+    # 没有闭包：外层函数返回后，内部函数读不到外层函数的变量
+    ('func make()\n'
+     '    var c = 7\n'
+     '    return func () -> c\n'
+     'end\n'
+     'var g = make()\n'
+     'g()', 'Runtime Error: c is not defined'),
+    # 内部函数在外层函数中调用时可以读到外层函数的变量
+    ('func outer()\n'
+     '    var a = 3\n'
+     '    func inner() -> a * 2\n'
+     '    return inner()\n'
+     'end\n'
+     'outer()', '6'),
+    # 赋值之前读取局部变量，读到的是调用者的变量；每层递归各自加1
+    ('var depth = 0\n'
+     'func guard()\n'
+     '    var depth = depth + 1\n'
+     '    if depth > 3 then return depth\n'
+     '    return guard()\n'
+     'end\n'
+     '[guard(), depth]', '[4, 0]'),
+    ('var n = 10\n'
+     'func bump()\n'
+     '    var n = n + 1\n'
+     '    return n\n'
+     'end\n'
+     '[bump(), n]', '[11, 10]'),
+    # 非尾调用的递归，变量从调用者的Frame中读取
+    ('var level = 0\n'
+     'func down()\n'
+     '    var level = level + 1\n'
+     '    if level == 5 then return level\n'
+     '    return down() + 0\n'
+     'end\n'
+     'down()', '5'),
+    # for循环变量是局部变量，被调用的函数可以读到
+    ('func peek() -> i * 10\n'
+     'func loop()\n'
+     '    var total = 0\n'
+     '    for i = 0 to 4 then var total = total + peek()\n'
+     '    return total\n'
+     'end\n'
+     'loop()', '60'),
+]
+
+
+@pytest.mark.parametrize('text, expected', SCOPE_PROGRAMS)
+def test_dynamic_scope(text, expected):
+    assert run_all_modes(text) == expected
+
+
+# 覆盖运算、变量、循环、函数与运行时错误的程序 => 期望结果
+PROGRAMS = [
+    ('-10 * 3 + (2 + 1.0) / 4 - 3', '-32.25'),
+    ('[2 ^ 10, 7 / 2, 8 / 4, 1 == 1.0, "ab" * 3, "a" + "b", [1, 2] + 3, [10, 20, 30] / 1]',
+     '[1024, 3.5, 2.0, 1, ababab, ab, 1, 2, 3, 20]'),
+    ('var total = 0\n'
+     'var i = 0\n'
+     'while i < 10 then\n'
+     '    var i = i + 1\n'
+     '    if i == 3 then continue\n'
+     '    if i == 8 then break\n'
+     '    var total = total + i\n'
+     'end\n'
+     'total', '25'),
+    ('for i = 10 to 0 step -3 then i', '[10, 7, 4, 1]'),
+    ('var s = ""\n'
+     'for i = 0 to 5 then\n'
+     '    if i == 2 then continue\n'
+     '    var s = s + "x"\n'
+     'end\n'
+     's', '"xxxx"'),
+    ('if 0 then 1 elif 0 then 2 else 3', '3'),
+    ('func add(a, b) -> a + b\n'
+     '[add(1, 2), add("x", "y"), is_list([1]), is_number("1"), len([1, 2, 3])]', '[3, xy, 1, 0, 3]'),
+    ('func outer(n)\n'
+     '    func inner(m) -> m * n\n'
+     '    var acc = []\n'
+     '    for i = 0 to n then var acc = acc + inner(i)\n'
+     '    return acc\n'
+     'end\n'
+     'outer(4)', '[0, 4, 8, 12]'),
+    ('func fact(n)\n'
+     '    if n <= 1 then return 1\n'
+     '    return n * fact(n - 1)\n'
+     'end\n'
+     'fact(20)', '2432902008176640000'),
+    ('1 / 0', 'Runtime Error: Division by zero'),
+    ('undefined_name + 1', 'Runtime Error: undefined_name is not defined'),
+    ('"a" - 1', 'Runtime Error: Illegal operation'),
+    ('func two(a, b) -> a\ntwo(1, 2, 3)', "Runtime Error: 1 too many args passed into 'two'"),
+    ('[1, 2, 3] / 5',
+     'Runtime Error: Element as this index could not be removed from list because index is out of bounds'),
+]
+
+
+@pytest.mark.parametrize('text, expected', PROGRAMS)
+def test_programs(text, expected):
+    assert run_all_modes(text) == expected
+
+
+def test_toypl_script():
+    with open(os.path.join(os.path.dirname(__file__), 'test_toypl.pl'), encoding='utf-8') as f:
+        text = f.read()
+    assert run_all_modes(text) == '[1, 1, 2, 3, 5, 8, 13, 21, 34, 55]'
+
+
+def test_error_position():
+    # 各模式的报错都定位到同一个节点
+    positions = set()
+    for mode in MODES:
+        reset_globals()
+        _, error = run('<test>', 'var a = 1\nvar b = a + 2 * (3 - 3)\na / (b - 1)', mode)
+        positions.add((error.pos_start.ln, error.pos_start.col, error.pos_end.col))
+    assert positions == {(2, 5, 10)}
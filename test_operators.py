@@ -0,0 +1,52 @@
+import pickle
+
+import pytest
+
+from test_modes import run_all_modes
+from main import parse
+from operators import *
+
+
+####################
+# 操作符分派表（operators.py）
+# python -m pytest test_operators.py
+####################
+
+OPERANDS = [(7, 2), (7, 0), (0, 3), (2.5, 2), (-3, 1.0), (1, 1)]
+
+
+def test_parser_resolves_operators():
+    node, _ = parse('<test>', '1 + 2 and not 3')
+    bin_op = node.element_nodes[0]
+    assert bin_op.operator is BINARY_OPERATORS[(TT_KEYWORD, 'and')]
+    assert bin_op.left_node.operator is BINARY_OPERATORS[TT_PLUS]
+    assert bin_op.right_node.operator is UNARY_OPERATORS[(TT_KEYWORD, 'not')]
+
+
+@pytest.mark.parametrize('operator', list(BINARY_OPERATORS.values()), ids=repr)
+def test_number_specialization_matches_methods(operator):
+    # Number与Number的特化实现与Value上的方法结果相同（包括报错）
+    for left, right in OPERANDS:
+        left, right = make_number(left), make_number(right)
+        expected, expected_error = getattr(Number, operator.method_name)(left, right)
+        result, error = operator.table[(Number, Number)](left, right)
+        assert repr(result) == repr(expected)
+        assert type(getattr(result, 'value', None)) is type(getattr(expected, 'value', None))
+        assert (error and error.details) == (expected_error and expected_error.details)
+
+
+def test_operators_pickle_by_name():
+    for operator in list(BINARY_OPERATORS.values()) + list(UNARY_OPERATORS.values()):
+        assert pickle.loads(pickle.dumps(operator)) is operator
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('[not 0, -(2), +3, 0 and 1, 2 or 0, "ab" * 3, "a" + "b"]', '[1, -2, 3, 0, 2, ababab, ab]'),
+    # 表中没有的类型组合（函数）报非法操作，而不是python异常
+    ('func f() -> 1\nf + 1', 'Runtime Error: Illegal operation'),
+    ('func f() -> 1\n1 - f', 'Runtime Error: Illegal operation'),
+    ('func f() -> 1\n-f', 'Runtime Error: Illegal operation'),
+    ('not ""', 'Runtime Error: Illegal operation'),
+])
+def test_operations(text, expected):
+    assert run_all_modes(text) == expected
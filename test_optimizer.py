@@ -0,0 +1,177 @@
+from test_modes import reset_globals, run_all_modes
+from main import parse, run, MODES
+from optimizer import Optimizer
+from ast_node import NumberNode, StringNode, BinOpNode, UnaryOpNode, IfNode, ForNode, WhileNode, child_nodes
+
+
+####################
+# AST优化（optimizer.py）
+# python -m pytest test_optimizer.py
+####################
+
+def optimize(text):
+    """
+    :return: (优化后的最后一条语句, Optimizer)
+    """
+    node, error = parse('<test>', text)
+    assert error is None
+    optimizer = Optimizer()
+    node = optimizer.optimize_program(node)
+    return node.element_nodes[-1], optimizer
+
+
+def test_fold_literals():
+    node, optimizer = optimize('-10 * 3 + (2 + 1.0) / 4 - 3')
+    assert isinstance(node, NumberNode) and node.value.value == -32.25
+    assert optimizer.folded == 6
+    # 折叠结果保留整个表达式的位置
+    assert (node.pos_start.idx, node.pos_end.idx) == (0, 27)
+
+    node, _ = optimize('"ab" * 3')
+    assert isinstance(node, StringNode) and node.value.value == 'ababab'
+    node, _ = optimize('not 0')
+    assert isinstance(node, NumberNode) and node.value.value == 1
+
+
+def test_oversized_results_not_folded():
+    node, optimizer = optimize('2 ^ 1000')
+    assert isinstance(node, BinOpNode) and optimizer.folded == 0
+    node, optimizer = optimize('"ab" * 100000')
+    assert isinstance(node, BinOpNode) and optimizer.folded == 0
+
+
+def test_runtime_errors_not_folded():
+    node, optimizer = optimize('1 / 0')
+    assert isinstance(node, BinOpNode) and optimizer.folded == 0
+    assert run_all_modes('1 / 0') == 'Runtime Error: Division by zero'
+    # 报错位置与不优化时相同
+    spans = set()
+    for optimize_ast in (True, False):
+        reset_globals()
+        _, error = run('<test>', 'var a = 1\n2 * 3 / (1 - 1)', optimize=optimize_ast)
+        spans.add((error.pos_start.ln, error.pos_start.col, error.pos_end.col))
+    assert spans == {(1, 9, 14)}
+
+
+def test_simplify_known_numbers():
+    node, optimizer = optimize('var x = 2\n(x > 1) * 1')
+    assert isinstance(node, BinOpNode) and node.operator.method_name == 'get_comparison_gt'
+    node, _ = optimize('var x = 2\n1 * -(x == 2)')
+    assert isinstance(node, UnaryOpNode)
+    node, optimizer = optimize('var x = 2\n(x > 1) + 0')
+    assert optimizer.simplified == 1
+
+
+def test_no_simplify_unknown_types():
+    # x的类型未知（"a" * 1 等），x + 0 对float不成立（-0.0 + 0），* 1.0 会把int变成float
+    for text in ('var x = "a"\nx * 1', 'var x = 2.5\nx + 0', 'var x = 2\n(x > 1) * 1.0', 'var x = 2\n(x > 1) + 0.0'):
+        node, optimizer = optimize(text)
+        assert isinstance(node, BinOpNode) and optimizer.simplified == 0, text
+    assert run_all_modes('var x = 2\n[(x > 1) * 1.0, -0.0 + 0, "a" * 1]') == '[1.0, 0.0, a]'
+
+
+def test_optimize_disabled():
+    reset_globals()
+    optimizer = Optimizer()
+    result, error = run('<test>', '2 ^ 8 * 1', optimizer=optimizer, optimize=False)
+    assert repr(result.elements[-1]) == '256'
+    assert optimizer.folded == optimizer.simplified == 0
+
+
+def test_unreachable_after_jumps():
+    _, optimizer = optimize('func f()\n    return 1\n    print(2)\n    print(3)\nend\nf()')
+    text = ('var s = 0\n'
+            'for i = 0 to 5 then\n'
+            '    if i == 2 then\n'
+            '        continue\n'
+            '        var s = s + 100\n'
+            '    end\n'
+            '    var s = s + i\n'
+            '    if i == 3 then\n'
+            '        break\n'
+            '        var s = -1\n'
+            '    end\n'
+            'end\n'
+            's')
+    _, loop_optimizer = optimize(text)
+    assert optimizer.report() == ['line 3: unreachable statement after return', 'line 4: unreachable statement after return']
+    assert loop_optimizer.report() == ['line 5: unreachable statement after continue', 'line 10: unreachable statement after break']
+    assert run_all_modes(text) == '4'
+
+
+def test_removed_statements_not_kept():
+    node, error = parse('<test>', 'func f()\n    return 1\n    print(2)\n    print(3)\nend\nf()')
+    node = Optimizer().optimize_program(node)
+    assert len(node.element_nodes[0].body_node.element_nodes) == 1
+
+
+def test_constant_if_branches():
+    # 常量为假的分支删除，第一个常量为真的分支成为else
+    text = 'var x = 3\nif x then 1 elif 0 then 2 elif 1 then 3 elif x then 4 else 5'
+    node, optimizer = optimize(text)
+    assert isinstance(node, IfNode) and len(node.case) == 1 and node.else_case[0].value.value == 3
+    assert optimizer.report() == ['line 2: branch with constant false condition',
+                                  'line 2: branch after constant true condition',
+                                  'line 2: else after constant true condition']
+    assert run_all_modes(text) == '1'
+    assert run_all_modes('var x = 0\n' + text[10:]) == '3'
+
+    # 只剩下一定执行的分支，整个if化简为该分支
+    node, optimizer = optimize('if 0 then 1 elif 1 then 2 else 3')
+    assert isinstance(node, NumberNode) and node.value.value == 2
+    assert 'line 1: if with constant condition collapsed' in optimizer.report()
+    # 所有分支都被删除时保留if，值与原来相同
+    node, _ = optimize('if 0 then 1')
+    assert isinstance(node, IfNode) and not node.case and node.else_case is None
+    assert run_all_modes('if 0 then 1') == '0'
+
+
+def test_multiline_if_not_collapsed():
+    # 多行分支的值为null，不能化简为分支中的语句
+    text = 'if 1 then\n    5\nend'
+    node, _ = optimize(text)
+    assert isinstance(node, IfNode)
+    assert run_all_modes(text) == run_all_modes('if 1 == 1 then\n    5\nend')
+
+
+def loops(node):
+    """按位置排列的ForNode、WhileNode"""
+    found = []
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, (ForNode, WhileNode)): found.append(node)
+        stack.extend(child_nodes(node))
+    return sorted(found, key=lambda loop: loop.pos_start.idx)
+
+
+def test_result_usage_flags():
+    text = ('var res = 0\n'
+            'for i = 0 to 4 then var res = res + i\n'  # 不是最后一条语句
+            'var copy = for i = 0 to 2 then i\n'  # 值赋给变量
+            'func f()\n'
+            '    for i = 0 to 2 then i\n'  # 多行函数体中没有返回的语句
+            '    return while 0 then 1\n'  # 返回值
+            'end\n'
+            'func g() -> for i = 0 to 2 then i\n'  # 自动返回
+            'while res < 10 then var res = res + 1')  # 最后一条语句
+    node, error = parse('<test>', text)
+    optimizer = Optimizer()
+    node = optimizer.optimize_program(node)
+    assert [loop.result_unused for loop in loops(node)] == [True, False, True, False, False, False]
+    assert optimizer.unused_loops == 2
+
+
+def test_unused_loop_values():
+    # 不是最后一条的顶层语句的值仍然保存在程序结果中，不再收集的循环的值为null
+    text = ('var res = 0\n'
+            'for i = 0 to 4 then var res = res + i\n'
+            'while res < 10 then var res = res + 1\n'
+            'res')
+    for mode in MODES:
+        values = []
+        for optimize_ast in (True, False):
+            reset_globals()
+            result, error = run('<test>', text, mode, optimize=optimize_ast)
+            values.append(repr(result.elements))
+        assert values == ['[0, 0, 0, 10]', '[0, [0, 1, 3, 6], [7, 8, 9, 10], 10]'], mode
@@ -0,0 +1,142 @@
+import os
+
+import pytest
+
+from test_modes import run_all_modes
+import ast_node
+from main import parse
+from ast_node import child_nodes
+from lexer import RegexLexer
+from parser import Parser, EXPR_FIRST, STATEMENT_FIRST
+from result import ParserResult
+from flat_ast import FlatAST
+from benchmark import TowerParser, expression_list, statement_list
+
+
+####################
+# 语法分析
+# python -m pytest test_parser.py
+####################
+
+def statement_types(text):
+    node, error = parse('<test>', text)
+    assert error is None
+    return [type(statement).__name__ for statement in node.element_nodes]
+
+
+def syntax_error(text):
+    """
+    :return: (报错信息, 行, 列)
+    """
+    node, error = parse('<test>', text)
+    assert node is None and error.error_name == 'Invalid Syntax'
+    return error.details, error.pos_start.ln, error.pos_start.col
+
+
+def test_parser_does_not_backtrack():
+    assert not hasattr(ParserResult, 'try_register')
+    assert not hasattr(Parser, 'reverse')
+    assert EXPR_FIRST < STATEMENT_FIRST
+
+
+def test_statements_and_blank_lines():
+    assert statement_types('var a = 1\n\n\nvar b = 2\n') == ['VarAssignNode', 'VarAssignNode']
+    assert statement_types('func f()\n    return\nend\nf()') == ['FuncNode', 'CallNode']
+    assert statement_types('func f()\n    return\n\n    1\nend') == ['FuncNode']
+
+
+@pytest.mark.parametrize('text, expected', [
+    # return 之后的 ( 不再被丢弃
+    ('func f()\n    return (\nend', ("Expected 'var', int, float, identifier, '+', '-', '(' or 'not'", 1, 13)),
+    # if 分支中的错误报告出来，而不是抛出TypeError
+    ('if 1 then\n    var = 2\nend', ('Expected identifier', 1, 8)),
+    ('if 1 then 2 elif var then 3', ('Expected identifier', 0, 21)),
+    # 第一条之后的语句中的错误，定位到解析失败的位置
+    ('var a = 1\nvar b = (1 +', ("Expected int, float, identifier, '+', '-', '(', 'IF', 'FOR', 'WHILE', 'FUN'", 1, 12)),
+    ('for i = 0 to 3 then\n    i\nend end',
+     ("Expected '+', '-', '*', '/', '^', '==', '!=', '<', '>', <=', '>=', 'AND' or 'OR'", 2, 4)),
+])
+def test_syntax_errors(text, expected):
+    assert syntax_error(text) == expected
+
+
+def test_operator_precedence():
+    text = '[2 ^ 3 ^ 2, -2 ^ 2, 1 - 2 - 3, 8 / 4 / 2, 1 + 2 * 3, (1 + 2) * 3, not 1 == 2, 1 < 2 == 1, 1 and 0 or 1, 2 * -3]'
+    assert run_all_modes(text) == '[512, -4, -4, 1.0, 7, 9, 1, 1, 1, -6]'
+
+
+def test_not_only_at_comparison_level():
+    assert syntax_error('1 + not 2') == ("Expected int, float, identifier, '+', '-', '(', 'IF', 'FOR', 'WHILE', 'FUN'", 0, 4)
+
+
+@pytest.mark.parametrize('text', [expression_list(200), statement_list(200), 'not -1 ^ 2 * 3 < 4 and 5 or 6 ^ 7 ^ 8'])
+def test_matches_per_level_descent(text):
+    # 与逐层递归下降（见 benchmark.TowerParser）得到的AST相同
+    tokens, _ = RegexLexer('<test>', text).make_tokens()
+    climbing = FlatAST.from_node(Parser(tokens).parse().node).to_bytes()
+    descent = FlatAST.from_node(TowerParser(tokens).parse().node).to_bytes()
+    assert climbing == descent
+
+
+PRODUCTIONS = ('statements', 'statement', 'if_expr', 'if_expr_b', 'if_expr_c', 'if_expr_b_or_c', 'if_expr_cases',
+               'for_expr', 'while_expr', 'func_expr', 'call', 'atom', 'list_expr', 'expr', 'binary', 'unary')
+
+
+class RecordingParser(Parser):
+    """记录每次进入产生式时的 (产生式, 参数, tok_idx)"""
+
+    def __init__(self, tokens):
+        self.entries = []
+        for name in PRODUCTIONS:
+            setattr(self, name, self.recorded(name, getattr(self, name)))
+        super().__init__(tokens)
+
+    def recorded(self, name, production):
+        def enter(*args):
+            self.entries.append((name, args, self.tok_idx))
+            return production(*args)
+        return enter
+
+
+def test_productions_entered_once_per_position():
+    # 预测分析不回退，同一个产生式在同一位置只解析一次，记忆化（packrat）不会命中
+    with open(os.path.join(os.path.dirname(__file__), 'test_toypl.pl'), encoding='utf-8') as f:
+        script = f.read()
+    for text in (script, expression_list(200), statement_list(200)):
+        tokens, _ = RegexLexer('<test>', text).make_tokens()
+        parser = RecordingParser(tokens)
+        assert parser.parse().error is None
+        assert parser.entries and len(set(parser.entries)) == len(parser.entries)
+    assert not hasattr(Parser, 'memoize')
+
+
+def all_nodes(node):
+    nodes = [node]
+    while nodes:
+        node = nodes.pop()
+        yield node
+        nodes.extend(child_nodes(node))
+
+
+def test_tokens_positions_and_nodes_have_no_dict():
+    text = ('func f(a, b)\n'
+            '    for i = 0 to a then if i > b then continue else break\n'
+            '    while a then return [f(-a, "s"), a ^ 2]\n'
+            'end')
+    tokens, _ = RegexLexer('<test>', text).make_tokens()
+    node = Parser(tokens).parse().node
+    objects = tokens + [tokens[0].pos_start, tokens[0].pos_end, tokens[0].pos_start.source] + list(all_nodes(node))
+    for obj in objects:
+        assert not hasattr(obj, '__dict__'), type(obj).__name__
+    assert {type(obj).__name__ for obj in objects} >= {
+        'Token', 'OffsetPosition', 'EndPosition', 'SourceText', 'ListNode', 'FuncNode', 'ForNode', 'IfNode',
+        'WhileNode', 'ReturnNode', 'ContinueNode', 'BreakNode', 'CallNode', 'BinOpNode', 'UnaryOpNode',
+        'VarAccessNode', 'NumberNode', 'StringNode'}
+
+
+def test_every_node_class_declares_slots():
+    node_classes = [value for value in vars(ast_node).values()
+                    if isinstance(value, type) and issubclass(value, ast_node.Node)]
+    assert len(node_classes) > 15
+    for node_class in node_classes:
+        assert '__slots__' in vars(node_class), node_class.__name__
@@ -0,0 +1,102 @@
+from test_modes import reset_globals
+from main import run
+from interpreter import Interpreter
+from built_variable import global_symbol_table
+from ast_node import BinOpNode, QuickBinOpNode
+
+
+####################
+# 运行时特化（Interpreter.quicken）
+# python -m pytest test_quicken.py
+####################
+
+THRESHOLD = Interpreter.QUICKEN_THRESHOLD
+
+
+def run_with(interpreter, text, define=None):
+    """
+    :param define: 为True时先清空全局符号表（定义函数的脚本）
+    :return: 最后一条语句的值（repr）或报错信息
+    """
+    if define: reset_globals()
+    result, error = run('<test>', text, interpreter=interpreter)
+    if error:
+        return f'{error.error_name}: {error.details}'
+    return repr(result.elements[-1])
+
+
+def body_of(name):
+    """函数体（单行函数即BinOpNode）"""
+    return global_symbol_table.get(name).body_node
+
+
+def calls(name, args, times):
+    return '\n'.join(f'{name}({args})' for _ in range(times))
+
+
+def test_quicken_after_threshold():
+    interpreter = Interpreter()
+    run_with(interpreter, 'func add(a, b) -> a + b', define=True)
+    run_with(interpreter, calls('add', '1, 2', THRESHOLD - 1))
+    assert type(body_of('add')) is BinOpNode
+    assert run_with(interpreter, 'add(1, 2)') == '3'
+    node = body_of('add')
+    assert type(node) is QuickBinOpNode and node.quick_types == (int, int)
+    assert run_with(interpreter, 'add(20, 22)') == '42'
+    assert interpreter.quicken_stats() == 'quickening: 1 specialized, 0 despecialized'
+
+
+def test_type_change_restarts_count():
+    interpreter = Interpreter()
+    run_with(interpreter, 'func mul(a, b) -> a * b', define=True)
+    run_with(interpreter, calls('mul', '2, 3', THRESHOLD - 1))
+    run_with(interpreter, 'mul(2.5, 3)')
+    assert type(body_of('mul')) is BinOpNode and body_of('mul').quick_count == 1
+    run_with(interpreter, calls('mul', '2.5, 3', THRESHOLD - 1))
+    assert type(body_of('mul')) is QuickBinOpNode and body_of('mul').quick_types == (float, int)
+
+
+def test_non_numbers_never_quicken():
+    interpreter = Interpreter()
+    run_with(interpreter, 'func add(a, b) -> a + b', define=True)
+    run_with(interpreter, calls('add', '"a", "b"', THRESHOLD * 2))
+    assert type(body_of('add')) is BinOpNode and body_of('add').quick_count == -1
+    assert interpreter.specialized == 0
+
+
+def test_guard_failure_despecializes():
+    interpreter = Interpreter()
+    run_with(interpreter, 'func add(a, b) -> a + b', define=True)
+    run_with(interpreter, calls('add', '1, 2', THRESHOLD))
+    assert type(body_of('add')) is QuickBinOpNode
+    # 类型与特化时不同，结果仍然由通用路径计算
+    assert run_with(interpreter, 'add(1.5, 2)') == '3.5'
+    assert type(body_of('add')) is BinOpNode
+    assert run_with(interpreter, '[add("a", "b"), add([1], 2), add(1, 2)]') == '[ab, 1, 2, 3]'
+    assert interpreter.quicken_stats() == 'quickening: 1 specialized, 1 despecialized'
+    # 退回后不再特化
+    run_with(interpreter, calls('add', '1, 2', THRESHOLD * 2))
+    assert type(body_of('add')) is BinOpNode
+
+
+def test_quickened_division_by_zero():
+    interpreter = Interpreter()
+    run_with(interpreter, 'func div(a, b) -> a / b', define=True)
+    run_with(interpreter, calls('div', '6, 3', THRESHOLD))
+    assert type(body_of('div')) is QuickBinOpNode
+    assert run_with(interpreter, 'div(6, 4)') == '1.5'
+    assert run_with(interpreter, 'div(1, 0)') == 'Runtime Error: Division by zero'
+    # 除数为0不是类型不同，节点仍然是特化的
+    assert type(body_of('div')) is QuickBinOpNode
+
+
+def test_quickened_loop_results():
+    interpreter = Interpreter()
+    text = ('var total = 0\n'
+            'for i = 0 to 100 then\n'
+            '    var total = total + i * 2 - 1\n'
+            '    if i == 50 then var total = total + 0.5\n'
+            'end\n'
+            '[total, total < 10000, 2 ^ 10]')
+    assert run_with(interpreter, text, define=True) == '[9800.5, 1, 1024]'
+    assert interpreter.specialized > 0 and interpreter.despecialized > 0
@@ -0,0 +1,164 @@
+import linecache
+
+import pytest
+
+from test_modes import run_program, reset_globals
+from main import run
+from tiered import TieredInterpreter, Deoptimize
+from closure_compiler import ClosureCompiler
+
+
+####################
+# 分层执行
+# python -m pytest test_tiered.py
+####################
+
+class GuardedTier(TieredInterpreter):
+    """升级后的编译结果只接受int参数n，其他参数在执行函数体之前守卫失败，模拟编译层的类型假设"""
+
+    def promote(self, profile):
+        closure = ClosureCompiler(self)
+        closure.compile(profile.body_node)
+
+        def compiled(node, context):
+            if type(context.symbol_table.get('n').value) is not int:
+                raise Deoptimize('n is not int')
+            return closure.visit(node, context)
+        profile.tier = 'guarded'
+        profile.compiled = compiled
+        self.log('promote => guarded', profile, '')
+
+
+def test_guard_failure_reruns_call_in_interpreter():
+    tiered = GuardedTier('<test>', threshold=5)
+    text = ('func twice(n) -> n * 2\n'
+            'var values = []\n'
+            'for round = 0 to 3 then\n'
+            '    for i = 0 to 10 then var values = values + twice(i)\n'
+            '    var values = values + twice(0.5)\n'
+            'end\n'
+            'values')
+    result, error = run('<test>', text, 'tiered', tiered=tiered)
+    assert error is None
+    # 守卫失败的调用由解释器执行，结果不受影响
+    assert [str(value) for value in result.elements[-1].elements] == ([str(i * 2) for i in range(10)] + ['1.0']) * 3
+    profile, = tiered.profiles.values()
+    assert profile.deopts == TieredInterpreter.MAX_DEOPTS
+    assert profile.compiled is None
+    assert [event for _, event, _, _ in tiered.trace] == ['promote => guarded', 'deopt <= guarded'] * 2
+    assert tiered.trace[1][3] == 'guard failed in guarded code: n is not int'
+
+
+class CountingTier(TieredInterpreter):
+    """记录由解释器执行函数体的次数"""
+    interpreted = 0
+
+    def interpret(self, profile, context):
+        self.interpreted += 1
+        return super().interpret(profile, context)
+
+
+def test_python_errors_not_deoptimized():
+    # 解释器中同样会抛出的异常直接抛出：函数体不由解释器重新执行，也不退回
+    tiered = CountingTier('<test>', threshold=3)
+    reset_globals()
+    text = ('func loop(n)\n'
+            '    for i = 0 to n then 1\n'
+            'end\n'
+            'for k = 0 to 5 then loop(1)')
+    result, error = run('<test>', text, 'tiered', tiered=tiered)
+    assert error is None
+    interpreted = tiered.interpreted
+    with pytest.raises(TypeError):
+        run('<test>', 'loop("a")', 'tiered', tiered=tiered)
+    assert tiered.interpreted == interpreted
+    profile, = tiered.profiles.values()
+    assert profile.tier == 'python' and profile.deopts == 0
+    assert [event for _, event, _, _ in tiered.trace] == ['promote => python']
+
+
+def test_promoted_functions_match_interpreter():
+    text = ('func fib(n) -> if n < 2 then n else fib(n - 1) + fib(n - 2)\n'
+            'func total(n)\n'
+            '    var s = 0\n'
+            '    for i = 0 to n then var s = s + fib(i / 20)\n'
+            '    return s\n'
+            'end\n'
+            '[total(200), fib(15)]')
+    assert run_program(text, 'tiered') == run_program(text, 'interpreter') == '[3118.5, 610]'
+
+
+HOT_PROGRAM = ('func fib(n) -> if n < 2 then n else fib(n - 1) + fib(n - 2)\n'
+               'func loop(n)\n'
+               '    var s = 0\n'
+               '    for i = 0 to n then var s = s + i\n'
+               '    return s\n'
+               'end\n'
+               '[fib(15), loop(150), loop(10)]')
+
+
+def run_tiered(text, **kwargs):
+    reset_globals()
+    tiered = TieredInterpreter('<test>', **kwargs)
+    result, error = run('<test>', text, 'tiered', tiered=tiered)
+    assert error is None
+    return repr(result.elements[-1]), tiered
+
+
+@pytest.mark.parametrize('tier', ['python', 'closure'])
+def test_promotion_after_threshold(tier):
+    value, tiered = run_tiered(HOT_PROGRAM, tier=tier)
+    assert value == '[610, 11175, 45]'
+    profiles = {profile.name: profile for profile in tiered.profiles.values()}
+    # 调用次数达到阈值，或者只调用一次、循环回边数达到阈值
+    assert profiles['fib'].tier == profiles['loop'].tier == tier
+    assert (profiles['loop'].calls, profiles['loop'].back_edges) == (2, 150)
+    assert [(event, name, reason) for _, event, name, reason in tiered.trace] == [
+        (f'promote => {tier}', 'fib (line 1)', '100 calls, 0 back-edges'),
+        (f'promote => {tier}', 'loop (line 2)', '1 calls, 150 back-edges'),
+    ]
+    assert tiered.report()[0].endswith(f'promote => {tier}'.ljust(18) + ' fib (line 1): 100 calls, 0 back-edges')
+    assert tiered.stats() == 'tiered: 2 functions, 2 promoted, 0 deoptimized'
+
+
+def test_trace_line_matches_generated_header():
+    # 升级记录中的行号是函数定义（func）所在的行，与生成代码中的注释相同，而不是函数体的第一行
+    _, tiered = run_tiered(HOT_PROGRAM)
+    loop = next(profile for profile in tiered.profiles.values() if profile.name == 'loop')
+    assert loop.line == 2 and loop.body_node.pos_start.ln + 1 == 3
+    assert 'def _loop_line2_2_0(context):  # func loop, line 2' in loop.compiled.__self__.source
+    assert [name for _, _, name, _ in tiered.trace][-1] == 'loop (line 2)'
+
+
+def test_below_threshold_stays_interpreted():
+    value, tiered = run_tiered(HOT_PROGRAM, threshold=100000)
+    assert value == '[610, 11175, 45]'
+    assert tiered.trace == []
+    assert all(profile.tier is None for profile in tiered.profiles.values())
+
+
+def test_python_tier_falls_back_to_closure():
+    # 每层循环在生成的python代码中占两层代码块，10层嵌套超过python的限制
+    lines = ['func deep()'] + ['    ' * (level + 1) + f'for i{level} = 0 to 1 then' for level in range(10)]
+    lines.append('    ' * 11 + 'var x = 7')
+    lines.extend('    ' * (level + 1) + 'end' for level in reversed(range(10)))
+    lines += ['    return x', 'end', 'for k = 0 to 5 then deep()']
+    value, tiered = run_tiered('\n'.join(lines), threshold=3)
+    assert value == '[7, 7, 7, 7, 7]'
+    (_, event, _, reason), = tiered.trace
+    assert event == 'promote => closure'
+    assert 'python unavailable (SyntaxError: too many statically nested blocks' in reason
+
+
+def test_promoted_sources_kept_apart():
+    # 每次升级生成的代码有各自的文件名与python函数名，linecache中同时保留
+    text = ('func a(n) -> n + 1\n'
+            'func b(n) -> n * 2\n'
+            'for i = 0 to 10 then [a(i), b(i)]')
+    _, tiered = run_tiered(text, threshold=3)
+    programs = {profile.name: profile.compiled.__self__ for profile in tiered.profiles.values()}
+    assert programs['a'].filename != programs['b'].filename
+    for program in programs.values():
+        assert ''.join(linecache.getlines(program.filename)) == program.source
+    assert 'def _a_line1_1_0(context):  # func a, line 1' in programs['a'].source
+    assert 'def _b_line2_2_0(context):  # func b, line 2' in programs['b'].source
@@ -0,0 +1,161 @@
+import pytest
+
+from test_modes import run_all_modes, reset_globals
+from main import run, parse, MODES
+from compiler import Compiler
+from type_operate import *
+
+
+####################
+# 运行时的值（type_operate.py）
+# python -m pytest test_values.py
+####################
+
+def numbers(*values):
+    return List([make_number(value) for value in values])
+
+
+def test_list_copy_shares_elements():
+    original = numbers(1, 2, 3)
+    copy = original.copy()
+    # 复制是O(1)的，直到修改前都共享同一个elements
+    assert copy.elements is original.elements
+    copy.append(make_number(4))
+    assert copy.elements is not original.elements
+    assert repr(original) == '[1, 2, 3]' and repr(copy) == '[1, 2, 3, 4]'
+
+
+def test_list_original_write_after_copy():
+    original = numbers(1, 2, 3)
+    copies = [original.copy(), original.copy().copy()]
+    original.pop(0)
+    original.extend([make_number(9)])
+    assert repr(original) == '[2, 3, 9]'
+    assert [repr(copy) for copy in copies] == ['[1, 2, 3]', '[1, 2, 3]']
+
+
+def test_list_operations_do_not_modify_operands():
+    original = numbers(1, 2)
+    results = [original.added_by(make_number(3))[0], original.subbed_by(make_number(0))[0],
+               original.multed_by(numbers(9))[0]]
+    assert repr(original) == '[1, 2]'
+    assert [repr(result) for result in results] == ['[1, 2, 3]', '[2]', '[1, 2, 9]']
+    # 非list的右操作数报错，而不是返回None
+    result, error = original.multed_by(make_number(2))
+    assert result is None and error is not None
+
+
+# 读取变量、传参得到的是副本：修改副本不影响原来的变量
+@pytest.mark.parametrize('text, expected', [
+    ('var a = [1, 2]\n'
+     'var b = a\n'
+     'var b = b + 3\n'
+     '[a, b, a - 0, a * [9]]', '[1, 2, 1, 2, 3, 2, 1, 2, 9]'),
+    ('func grow(l)\n'
+     '    var l = l + 1\n'
+     '    return l\n'
+     'end\n'
+     'var a = [0]\n'
+     '[a, grow(a)]', '[0, 0, 1]'),
+    ('var a = [1, 2, 3]\n'
+     'var r = append(a, 4)\n'
+     '[len(a), len(r)]', '[3, 4]'),
+])
+def test_list_value_semantics(text, expected):
+    assert run_all_modes(text) == expected
+
+
+def test_values_are_position_free():
+    number, string = make_number(3.5), String('s')
+    # 不可变的值复制时返回自身，不记录位置与上下文
+    assert number.copy() is number and string.copy() is string
+    for value in (number, string, numbers(1)):
+        assert not hasattr(value, 'pos_start') and not hasattr(value, 'context')
+
+
+def error_span(text):
+    """
+    :return: 所有模式相同的 (报错信息, 行, 开始列, 结束列)
+    """
+    spans = set()
+    for mode in MODES:
+        reset_globals()
+        _, error = run('<test>', text, mode)
+        spans.add((error.details, error.pos_start.ln, error.pos_start.col, error.pos_end.col))
+    assert len(spans) == 1, spans
+    return spans.pop()
+
+
+@pytest.mark.parametrize('text, expected', [
+    # 除数为0、下标越界定位到右操作数
+    ('var x = 5\nvar y = x / (x - 5)', ('Division by zero', 1, 13, 18)),
+    ('var l = [1, 2]\nl / 7', ('Element as this index could not be removed from list because index is out of bounds', 1, 4, 5)),
+    # 其他错误定位到整个运算表达式
+    ('1 + ("a" - 1)', ('Illegal operation', 0, 5, 12)),
+    ('-"a"', ('Illegal operation', 0, 0, 4)),
+])
+def test_operation_error_location(text, expected):
+    assert error_span(text) == expected
+
+
+def test_small_int_cache():
+    assert make_number(7) is make_number(7) is SMALL_INTS[7 - SMALL_INT_MIN]
+    assert make_number(SMALL_INT_MAX + 1) is not make_number(SMALL_INT_MAX + 1)
+    # 1.0 == 1，但浮点数不能取到缓存中的int
+    assert type(make_number(1.0).value) is float
+    result, _ = make_number(3).added_by(make_number(4))
+    assert result is make_number(7)
+    result, _ = make_number(3).get_comparison_lt(make_number(4))
+    assert result is Number.true
+
+
+def test_literal_values_built_once():
+    node, _ = parse('<test>', '42\n"s"\n1 + 1 + 1')
+    number_node, string_node, _ = node.element_nodes
+    assert number_node.value is make_number(42)
+    assert string_node.value.value == 's'
+    # 常量池中同一个对象只保存一次
+    code = Compiler().compile(node)
+    assert [repr(const) for const in code.constants] == ['42', '"s"', '1']
+
+
+def test_int_float_results():
+    assert run_all_modes('[7 / 7, 2 * 0.5, 3 - 1.0, 2 + 2, 1 == 1.0]') == '[1.0, 1.0, 2.0, 4, 1]'
+
+
+def test_loop_values_int_range():
+    # 都是int时循环次数在开始前确定
+    assert loop_values(0, 10, 3) == range(0, 10, 3)
+    assert loop_values(5, 0, -2) == range(5, 0, -2)
+    assert list(loop_values(3, 3, 1)) == []
+
+
+def test_loop_values_stepped():
+    assert not isinstance(loop_values(0, 1, 0.25), range)
+    assert list(loop_values(0, 1, 0.25)) == [0, 0.25, 0.5, 0.75]
+    assert list(loop_values(1, 0, -0.5)) == [1, 0.5]
+    assert list(loop_values(0.5, 3, 1)) == [0.5, 1.5, 2.5]
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('for i = 0 to 1 step 0.25 then i', '[0, 0.25, 0.5, 0.75]'),
+    ('for i = 5 to 0 step -2 then i', '[5, 3, 1]'),
+    ('for i = 0 to 0 then i', '[]'),
+    # continue、break，循环结束后循环变量保留最后的值
+    ('var n = 0\n'
+     'for i = 0 to 10 then\n'
+     '    if i == 2 then continue\n'
+     '    if i == 5 then break\n'
+     '    var n = n + i\n'
+     'end\n'
+     '[n, i]', '[8, 5]'),
+    # 循环体中给循环变量赋值不影响循环次数
+    ('var count = 0\n'
+     'for i = 0 to 3 then\n'
+     '    var i = 10\n'
+     '    var count = count + 1\n'
+     'end\n'
+     'count', '3'),
+])
+def test_counted_loops(text, expected):
+    assert run_all_modes(text) == expected
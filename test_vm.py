@@ -0,0 +1,143 @@
+import sys
+
+import pytest
+
+from test_modes import run_program, run_all_modes, reset_globals
+from main import run, parse
+from error import RTError
+from resolver import Resolver
+from compiler import Compiler
+from ast_node import CallNode, child_nodes
+from opcodes import *
+
+
+####################
+# 字节码编译器与虚拟机
+# python -m pytest test_vm.py
+####################
+
+def compile_program(text):
+    """
+    :return: 顶层程序的CodeObject
+    """
+    node, error = parse('<test>', text)
+    assert error is None
+    Resolver().resolve(node)
+    return Compiler().compile(node)
+
+
+def function_code(code, name):
+    return next(const for const in code.constants if getattr(const, 'name', None) == name and hasattr(const, 'ops'))
+
+
+def test_locals_use_slots():
+    code = compile_program('var only_global = 1\n'
+                           'func f(a)\n'
+                           '    var b = a + only_global\n'
+                           '    for i = 0 to 3 then var b = b + i\n'
+                           '    return b\n'
+                           'end\n'
+                           'f(2)')
+    func_code = function_code(code, 'f')
+    # 参数、赋值过的变量、for循环变量都是局部变量，参数在最前面
+    assert func_code.local_names == ['a', 'b', 'i']
+    loads = [(op, arg) for op, arg in zip(func_code.ops, func_code.args) if op in (LOAD_FAST, LOAD_NAME, LOAD_GLOBAL)]
+    # 没有函数绑定过 only_global，直接查全局符号表
+    assert loads == [(LOAD_FAST, 0), (LOAD_GLOBAL, 'only_global'), (LOAD_FAST, 1), (LOAD_FAST, 2), (LOAD_FAST, 1)]
+    # 顶层的变量仍然在全局符号表中
+    assert LOAD_FAST not in code.ops and STORE_FAST not in code.ops
+
+
+def test_outer_locals_are_not_bound():
+    # 内部函数中外层函数的变量按名字查找：调用者不一定是外层函数
+    code = compile_program('func outer(x)\n'
+                           '    func inner() -> x\n'
+                           '    return inner()\n'
+                           'end')
+    inner_code = function_code(function_code(code, 'outer'), 'inner')
+    assert inner_code.local_names == []
+    assert (LOAD_NAME, 'x') in zip(inner_code.ops, inner_code.args)
+
+
+def test_name_bound_by_later_program():
+    # reader 编译时还没有函数绑定 late_bound，之后的程序中 binder 把它作为局部变量，reader 仍然要读到调用者的值
+    reset_globals()
+    for text in ('var late_bound = 1\nfunc reader() -> late_bound',
+                 'func binder()\n    var late_bound = 5\n    return reader()\nend'):
+        result, error = run('<test>', text, 'vm')
+        assert error is None
+    result, error = run('<test>', '[binder(), reader(), late_bound]', 'vm')
+    assert repr(result.elements[-1]) == '[5, 1, 1]'
+
+
+def test_global_lookup_in_deep_recursion():
+    text = ('var limit = 500\n'
+            'func down(n) -> if n == limit then n else down(n + 1) + 0\n'
+            'down(0)')
+    assert run_program(text, 'vm') == '500'
+
+
+def call_nodes(node):
+    """
+    :return: {函数名: CallNode.is_tail_call}
+    """
+    calls = {}
+    nodes = [node]
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, CallNode):
+            calls[node.node_to_call.var_name_tok.value] = node.is_tail_call
+        nodes.extend(child_nodes(node))
+    return calls
+
+
+def test_tail_calls_marked():
+    node, _ = parse('<test>', 'func f(x) -> if x then g(x) else 1 + h(x)\n'
+                              'func k(x)\n'
+                              '    a(x)\n'
+                              '    if x then return b(x)\n'
+                              '    func inner() -> c()\n'
+                              '    return [d(x)]\n'
+                              'end')
+    assert call_nodes(node) == {'g': True, 'h': False, 'a': False, 'b': True, 'c': True, 'd': False}
+
+
+@pytest.mark.parametrize('text, expected', [
+    # 超过python的递归上限（1000）的尾递归
+    ('func sum(n, acc)\n'
+     '    if n == 0 then return acc\n'
+     '    return sum(n - 1, acc + n)\n'
+     'end\n'
+     'sum(2000, 0)', '2001000'),
+    ('func even(n) -> if n == 0 then 1 else odd(n - 1)\n'
+     'func odd(n) -> if n == 0 then 0 else even(n - 1)\n'
+     '[even(1501), odd(1501)]', '[0, 1]'),
+])
+def test_deep_tail_recursion(text, expected):
+    assert run_all_modes(text) == expected
+
+
+COUNT_SCRIPT = 'func count(n) -> if n == 0 then 0 else 1 + count(n - 1)\ncount(%d)'
+
+
+def test_call_depth_limit():
+    # count(n) 共调用 n + 1 层
+    reset_globals()
+    result, error = run('<test>', COUNT_SCRIPT % 49, 'vm', max_call_depth=50)
+    assert error is None and repr(result.elements[-1]) == '49'
+    result, error = run('<test>', COUNT_SCRIPT % 50, 'vm', max_call_depth=50)
+    assert isinstance(error, RTError)
+    assert error.details == 'Maximum call depth exceeded (50)'
+    assert error.generate_traceback().count('in count') == 50
+
+
+def test_deep_recursion_without_python_stack():
+    limit = sys.getrecursionlimit()
+    assert run_program(COUNT_SCRIPT % 5000, 'vm') == '5000'
+    assert sys.getrecursionlimit() == limit
+
+
+def test_tail_calls_do_not_count_as_depth():
+    reset_globals()
+    result, error = run('<test>', 'func down(n) -> if n == 0 then 0 else down(n - 1)\ndown(100)', 'vm', max_call_depth=10)
+    assert error is None and repr(result.elements[-1]) == '0'
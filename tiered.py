@@ -0,0 +1,189 @@
+import time
+
+from interpreter import Interpreter
+from closure_compiler import ClosureCompiler
+from transpiler import Transpiler
+from ast_node import FuncNode, child_nodes
+
+
+####################
+# TIERED EXECUTION 分层执行
+# 函数先由Interpreter（第0层）逐节点执行，同时统计每个函数体的调用次数与循环回边数（执行循环体的次数），
+# 两者之和达到阈值后，函数体被编译（升级）：
+#   python => 由 Transpiler 单独转译成python函数（无法编译时改用closure）
+#   closure => 由 ClosureCompiler 编译成闭包
+# 之后的调用直接执行编译结果；编译结果中的函数调用仍然经过TieredInterpreter，被调用的函数各自统计、各自升级
+# 编译结果的守卫检查（编译时的假设）不成立时抛出 Deoptimize，函数退回第0层（deoptimize）重新统计，
+# 这次调用由解释器执行函数体；退回 MAX_DEOPTS 次后不再升级
+# 守卫必须在产生副作用之前检查，所以由解释器重新执行不会重复输出、赋值
+# 其他python异常（非数字的for边界等）与解释器中抛出的相同，直接向外抛出，不重新执行、不计入退回次数
+# 升级只影响之后的调用，正在执行的调用（例如只调用一次、但循环很多次的函数）不会中途切换
+# 每次升级、退回都记录在 trace 中
+####################
+
+TIERS = ('python', 'closure')
+
+
+class Deoptimize(Exception):
+    """编译结果的守卫检查失败：编译时的假设对这次调用不成立，在产生副作用之前抛出"""
+
+
+class Profile(object):
+    """
+    一个函数体的执行统计
+    """
+
+    def __init__(self, name, body_node, line):
+        """
+        :param line: 函数定义（func 关键字）所在的行号，与生成代码中的注释 func Fib, line 4 一致
+        """
+        self.name = name
+        self.body_node = body_node
+        self.line = line
+        self.calls = 0 # 调用次数
+        self.back_edges = 0 # 函数体自身的循环回边数，不包括其中调用的函数
+        self.tier = None # 升级后所在的层，None表示由Interpreter执行
+        self.compiled = None # 升级后执行函数体的方法：visit(node, context) => RTResult
+        self.deopts = 0 # 退回第0层的次数
+
+    def hotness(self):
+        return self.calls + self.back_edges
+
+
+class TieredInterpreter(Interpreter):
+    """
+    与Interpreter的接口相同，顶层代码由解释器执行，函数体达到阈值后升级
+    """
+    # 调用次数 + 循环回边数 达到该值时升级
+    HOT_THRESHOLD = 100
+    # 退回第0层的次数达到该值后，函数一直由解释器执行
+    MAX_DEOPTS = 2
+
+    def __init__(self, fn='<program>', tier='python', threshold=HOT_THRESHOLD):
+        """
+        :param fn: 脚本文件名，用于生成的python代码的文件名
+        :param tier: 升级到的层，见 TIERS
+        :param threshold: 升级阈值
+        """
+        self.fn = fn
+        self.tier = tier
+        self.threshold = threshold
+        self.profiles = {} # 函数体节点 => Profile
+        self.definitions = {} # 函数体节点 => 函数定义所在的行号，见 run
+        # 编译结果中调用函数时，Function.execute 回到 self.execute_function
+        self.closure_compiler = ClosureCompiler(self)
+        self.trace = [] # (秒, 事件, Profile说明, 原因)
+        self.promotions = 0 # 升级次数，用于区分每次转译生成的代码
+        self.start_time = time.perf_counter()
+
+    def run(self, node, context):
+        """
+        执行整个程序，main.run 的入口
+        Function只保存函数体，执行前先记录程序中每个函数定义的行号，用于升级记录与生成代码的注释
+        """
+        nodes = [node]
+        while nodes:
+            node_ = nodes.pop()
+            if isinstance(node_, FuncNode):
+                self.definitions[node_.body_node] = node_.pos_start.ln + 1
+            nodes.extend(child_nodes(node_))
+        return self.visit(node, context)
+
+    def execute_function(self, func, context):
+        """
+        见 Interpreter.execute_function，统计调用次数与循环回边数，达到阈值时升级
+        """
+        body_node = func.body_node
+        profile = self.profiles.get(body_node)
+        if profile is None:
+            # 不是通过run执行的程序中定义的函数，使用函数体的行号
+            line = self.definitions.get(body_node, body_node.pos_start.ln + 1)
+            profile = self.profiles[body_node] = Profile(func.name, body_node, line)
+        profile.calls += 1
+        if profile.compiled:
+            return self.execute_compiled(profile, context)
+        return self.interpret(profile, context)
+
+    def interpret(self, profile, context):
+        """
+        由解释器执行函数体，执行后达到阈值时升级
+        """
+        # 函数体中调用的函数单独统计，执行完成后恢复调用者的计数
+        back_edges = self.back_edges
+        self.back_edges = 0
+        res = self.visit(profile.body_node, context)
+        profile.back_edges += self.back_edges
+        self.back_edges = back_edges
+
+        # 递归调用时，外层仍在解释执行的调用返回前，函数可能已经被内层调用升级
+        if profile.hotness() >= self.threshold and not profile.compiled and profile.deopts < self.MAX_DEOPTS:
+            self.promote(profile)
+        return res
+
+    def execute_compiled(self, profile, context):
+        """
+        执行编译结果，守卫检查失败时退回第0层，由解释器执行这次调用
+        """
+        try:
+            return profile.compiled(profile.body_node, context)
+        except Deoptimize as guard:
+            self.deoptimize(profile, f'guard failed in {profile.tier} code: {guard}')
+            return self.interpret(profile, context)
+
+    def promote(self, profile):
+        """
+        编译函数体，之后的调用执行编译结果
+        """
+        tier = self.tier
+        compiled = None
+        reason = f'{profile.calls} calls, {profile.back_edges} back-edges'
+        self.promotions += 1
+        if tier == 'python':
+            # 每次升级的代码使用不同的文件名与函数名，linecache与traceback中各自保留生成的源码
+            name = profile.name if profile.name.isidentifier() else 'anonymous'
+            unit = f'{name}_line{profile.line}_{self.promotions}'
+            program = Transpiler(self.fn, self, unit).transpile(profile.body_node, f'func {profile.name}, line {profile.line}')
+            if program.fallback_reason:
+                # 例如嵌套超过python的20层代码块限制
+                reason = f'{reason}; python unavailable ({program.fallback_reason})'
+                tier = 'closure'
+            else:
+                compiled = program.visit
+        if tier == 'closure':
+            try:
+                self.closure_compiler.compile(profile.body_node)
+            except RecursionError:
+                # 函数体嵌套过深，不再尝试升级
+                profile.deopts = self.MAX_DEOPTS
+                self.log('fail', profile, 'RecursionError while compiling')
+                return
+            compiled = self.closure_compiler.visit
+
+        profile.tier = tier
+        profile.compiled = compiled
+        self.log(f'promote => {tier}', profile, reason)
+
+    def deoptimize(self, profile, reason):
+        """
+        退回第0层，重新统计；递归调用时内层调用可能已经让函数退回，只退回一次
+        """
+        if profile.compiled is None: return
+        self.log(f'deopt <= {profile.tier}', profile, reason)
+        profile.tier = None
+        profile.compiled = None
+        profile.deopts += 1
+        profile.calls = profile.back_edges = 0
+
+    def log(self, event, profile, reason):
+        self.trace.append((time.perf_counter() - self.start_time, event, f'{profile.name} (line {profile.line})', reason))
+
+    def stats(self):
+        promoted = sum(1 for profile in self.profiles.values() if profile.tier)
+        deopts = sum(profile.deopts for profile in self.profiles.values())
+        return f'tiered: {len(self.profiles)} functions, {promoted} promoted, {deopts} deoptimized'
+
+    def report(self):
+        """
+        :return: ['   0.0012s promote => python  Fib (line 4): 100 calls, 0 back-edges', ...]
+        """
+        return [f'{elapsed:9.4f}s {event:<18} {name}: {reason}' for elapsed, event, name, reason in self.trace]
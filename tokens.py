@@ -64,6 +64,9 @@ KEYWORDS = [
 ]
 
 class Token(object):
+    # 大脚本中Token数量很多，使用__slots__，不创建__dict__
+    __slots__ = ('type', 'value', 'pos_start', 'pos_end')
+
     def __init__(self, type_, value=None, pos_start=None, pos_end=None):
         # Token = <token-name, attribute-value>
         self.type = type_
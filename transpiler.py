@@ -0,0 +1,453 @@
+import linecache
+
+from function import *
+from closure_compiler import ClosureCompiler, Signal, ContinueSignal, BreakSignal, ErrorSignal, raise_for
+
+
+####################
+# TRANSPILER 转译为python源码
+# 每个函数体（以及整个程序）转译成一个python函数 def _body_N(context)，通过 compile/exec 执行，
+# ToyPL的语义保持不变：
+#   变量仍然存放在符号表中（动态作用域，var 总是在当前符号表中重新绑定）
+#   值仍然是 type_operate.py 中的类型（List是值语义，读取变量时copy），运算通过 operators.py 的分派表
+#   函数仍然是 Function，调用时由 Function.execute 创建上下文、检查参数、执行尾调用，
+#   函数体通过 PythonProgram.visit 找到对应的python函数，没有返回值时自动返回 Number.null
+# 生成的源码可以通过 PythonProgram.source 查看，报错位置通过位置表 _P 映射回ToyPL的Position
+####################
+
+class FunctionWriter(object):
+    """
+    一个python函数的源码
+    """
+
+    def __init__(self, name, title):
+        self.name = name
+        self.title = title
+        self.lines = [] # (缩进, 代码, 位置表下标)
+        self.indent = 1
+        # 当前是否直接位于循环体中：是则 break/continue 直接生成python的break/continue，
+        # 否则（函数体顶层、while条件中）抛出 BreakSignal/ContinueSignal，与Interpreter一样交给外层处理
+        self.in_loop = False
+
+
+class Transpiler(object):
+    """
+    AST => python源码
+    Transpiler类方法名的规则: "transpile_" + ast_node.py中的类名
+    每个方法把计算节点值的语句写入当前函数，返回保存该值的python表达式（临时变量名或常量名）
+    """
+
+    def __init__(self, fn='<program>', executor=None, unit=None):
+        """
+        :param fn: 脚本文件名，用于生成代码的文件名
+        :param executor: 调用函数时传给 Function.execute 的对象，为None时是生成的PythonProgram（见 tiered.py）
+        :param unit: 单独转译的代码单元名（python标识符），同一个脚本转译多次时区分生成代码的文件名与python函数名，
+                     否则后转译的源码会覆盖 linecache 中之前的源码
+        """
+        self.filename = f'<toypl-python {fn}>' if unit is None else f'<toypl-python {fn} {unit}>'
+        self.body_prefix = '_body_' if unit is None else f'_{unit}_'
+        self.executor = executor
+        self.namespace = {
+            '_ok': success,
+            '_ret': success_return,
+            '_tail': success_tail_call,
+            '_undefined': undefined_error,
+            '_unsupported': unsupported_error,
+            '_locate': locate_error,
+            '_raise_for': raise_for,
+            '_ContinueSignal': ContinueSignal,
+            '_BreakSignal': BreakSignal,
+            '_List': List,
+            '_Function': Function,
+            '_loop_values': loop_values,
+            '_make_number': make_number,
+            '_null': Number.null,
+        }
+        self.positions = self.namespace['_P'] = [] # 位置表：(pos_start, pos_end)
+        self.position_indexes = {} # id(node) => 位置表下标
+        self.global_names = {} # id(对象) => 生成代码中的全局变量名
+        self.bodies = {} # 函数体节点 => python函数名
+        self.functions = [] # 已生成的 FunctionWriter
+        self.writer = None
+        self.current_position = -1
+        self.temp_count = 0
+
+    def transpile(self, node, title='<program>'):
+        """
+        :param node: 程序的AST根节点（或单独转译的函数体）
+        :param title: 写在生成的python函数后的注释
+        :return: PythonProgram；python无法编译生成的源码（嵌套过深等）时，返回的PythonProgram全部交给ClosureCompiler执行
+        """
+        try:
+            self.function(node, title)
+            source, line_positions = self.assemble()
+            code = compile(source, self.filename, 'exec')
+        except (SyntaxError, RecursionError, MemoryError) as e:
+            return PythonProgram(None, {}, [], [], self.filename, f'{type(e).__name__}: {e}', self.executor)
+
+        exec(code, self.namespace)
+        # 与普通python模块一样，traceback中可以显示生成的源码
+        linecache.cache[self.filename] = (len(source), None, source.splitlines(True), self.filename)
+        bodies = {body_node: self.namespace[name] for body_node, name in self.bodies.items()}
+        program = PythonProgram(source, bodies, line_positions, self.positions, self.filename, executor=self.executor)
+        # 生成的代码调用函数时，把program作为解释器传给 Function.execute
+        self.namespace['_program'] = self.executor or program
+        return program
+
+    def assemble(self):
+        """
+        :return: (源码, 每行源码对应的位置表下标)
+        """
+        lines = [f'# ToyPL => python: {self.filename}', '']
+        line_positions = [-1, -1]
+        # 程序最先开始生成、最后生成完，放在最后
+        for writer in self.functions:
+            lines.append(f'def {writer.name}(context):  # {writer.title}')
+            lines.append('    _st = context.symbol_table')
+            lines.append('    _sym = _st.symbols')
+            line_positions.extend((-1, -1, -1))
+            for indent, text, position in writer.lines:
+                lines.append('    ' * indent + text)
+                line_positions.append(position)
+            lines.append('')
+            line_positions.append(-1)
+        return '\n'.join(lines), line_positions
+
+    #########  生成代码的工具方法  ###########
+
+    def function(self, body_node, title):
+        """
+        函数体生成为一个单独的python函数
+        :return: python函数名
+        """
+        name = self.bodies[body_node] = f'{self.body_prefix}{len(self.bodies)}'
+        outer_writer, outer_position = self.writer, self.current_position
+        self.writer = FunctionWriter(name, title)
+        value = self.expr(body_node)
+        self.emit(f'return _ok({value})')
+        self.functions.append(self.writer)
+        self.writer, self.current_position = outer_writer, outer_position
+        return name
+
+    def expr(self, node):
+        outer_position = self.current_position
+        self.current_position = self.position(node)
+        method_name = f'transpile_{type(node).__name__}'
+        method = getattr(self, method_name, self.no_transpile_method)
+        value = method(node)
+        self.current_position = outer_position
+        return value
+
+    def no_transpile_method(self, node):
+        raise Exception(f'No transpile_{type(node).__name__} method defined')
+
+    def emit(self, text):
+        self.writer.lines.append((self.writer.indent, text, self.current_position))
+
+    def temp(self):
+        self.temp_count += 1
+        return f'_t{self.temp_count}'
+
+    def position(self, node):
+        """节点在位置表中的下标"""
+        index = self.position_indexes.get(id(node))
+        if index is None:
+            index = self.position_indexes[id(node)] = len(self.positions)
+            self.positions.append((node.pos_start, node.pos_end))
+        return index
+
+    def global_name(self, value, prefix, key=None):
+        """
+        把对象放入生成代码的全局变量中，返回变量名
+        :param key: 去重用的key，默认为id(value)；绑定方法每次取出都是新对象，需要指定
+        """
+        key = id(value) if key is None else key
+        name = self.global_names.get(key)
+        if name is None:
+            name = self.global_names[key] = f'{prefix}{len(self.global_names)}'
+            self.namespace[name] = value
+        return name
+
+    #########  字面量与变量  ###########
+
+    def transpile_NumberNode(self, node):
+        return self.global_name(node.value, '_k')
+
+    transpile_StringNode = transpile_NumberNode
+
+    def transpile_ListNode(self, node):
+        values = [self.expr(element_node) for element_node in node.element_nodes]
+        t = self.temp()
+        self.emit(f'{t} = _List([{", ".join(values)}])')
+        return t
+
+    def transpile_VarAccessNode(self, node):
+        var_name = node.var_name_tok.value
+        t = self.temp()
+        self.emit(f'{t} = _st.get({var_name!r})')
+        self.emit(f'if not {t}: raise _undefined(_P[{self.position(node)}], {var_name!r}, context)')
+        # 见 Interpreter.visit_VarAccessNode
+        self.emit(f'{t} = {t}.copy()')
+        return t
+
+    def transpile_VarAssignNode(self, node):
+        value = self.expr(node.value_node)
+        self.emit(f'_sym[{node.var_name_tok.value!r}] = {value}')
+        return value
+
+    #########  运算  ###########
+
+    def transpile_BinOpNode(self, node):
+        left = self.expr(node.left_node)
+        right = self.expr(node.right_node)
+        operator = node.operator
+        if operator is None:
+            self.emit(f'raise _unsupported(_P[{self.position(node)}], {node.op_tok.type!r}, context)')
+            return '_null'
+
+        table = self.global_name(operator.table, '_table')
+        generic = self.global_name(operator.generic, '_generic', ('generic', id(operator)))
+        t = self.temp()
+        self.emit(f'{t} = {table}.get((type({left}), type({right})))')
+        self.emit(f'{t}, _e = {t}({left}, {right}) if {t} is not None else {generic}({left}, {right})')
+        # 见 Interpreter.visit_BinOpNode，除数为0等错误定位到右操作数
+        self.emit(f'if _e: raise _locate(_e, _P[{self.position(node.right_node)}], _P[{self.position(node)}], context)')
+        return t
+
+    # 由Interpreter特化过的节点（TieredInterpreter升级函数时），按通用的BinOpNode处理
+    transpile_QuickBinOpNode = transpile_BinOpNode
+
+    def transpile_UnaryOpNode(self, node):
+        operand = self.expr(node.node)
+        table = self.global_name(node.operator.table, '_table')
+        generic = self.global_name(node.operator.generic, '_generic', ('generic', id(node.operator)))
+        t = self.temp()
+        self.emit(f'{t}, _e = {table}.get(type({operand}), {generic})({operand})')
+        position = self.position(node)
+        self.emit(f'if _e: raise _locate(_e, _P[{position}], _P[{position}], context)')
+        return t
+
+    #########  控制流  ###########
+
+    def transpile_IfNode(self, node):
+        """
+        if c1 then e1 elif c2 then e2 else e3 =>
+            if c1.is_true(): t = e1
+            else:
+                if c2.is_true(): t = e2
+                else: t = e3
+        条件的计算可能需要多条语句，所以elif生成为嵌套的if
+        """
+        t = self.temp()
+        outer_indent = self.writer.indent
+        for condition, expr, should_return_null in node.case:
+            condition_value = self.expr(condition)
+            self.emit(f'if {condition_value}.is_true():')
+            self.writer.indent += 1
+            value = self.expr(expr)
+            self.emit(f'{t} = {"_null" if should_return_null else value}')
+            self.writer.indent -= 1
+            self.emit('else:')
+            self.writer.indent += 1
+
+        if node.else_case:
+            expr, should_return_null = node.else_case
+            value = self.expr(expr)
+            self.emit(f'{t} = {"_null" if should_return_null else value}')
+        else:
+            self.emit(f'{t} = _null')
+        self.writer.indent = outer_indent
+        return t
+
+    def transpile_ForNode(self, node):
+        start = self.expr(node.start_value_node)
+        end = self.expr(node.end_value_node)
+        step = self.expr(node.step_value_node) if node.step_value_node else self.global_name(make_number(1), '_k')
+        collect = not (node.should_return_null or node.result_unused)
+
+        elements = self.temp()
+        if collect:
+            self.emit(f'{elements} = []')
+        i = self.temp()
+        # 见 Interpreter.visit_ForNode
+        self.emit(f'for {i} in _loop_values({start}.value, {end}.value, {step}.value):')
+        self.writer.indent += 1
+        self.emit(f'_sym[{node.var_name_tok.value!r}] = _make_number({i})')
+        self.loop_body(node, elements, collect)
+        self.writer.indent -= 1
+        return self.loop_value(elements, collect)
+
+    def transpile_WhileNode(self, node):
+        collect = not (node.should_return_null or node.result_unused)
+        elements = self.temp()
+        if collect:
+            self.emit(f'{elements} = []')
+        self.emit('while True:')
+        self.writer.indent += 1
+        # 条件中的break/continue不属于这个循环
+        in_loop, self.writer.in_loop = self.writer.in_loop, False
+        condition = self.expr(node.condition_node)
+        self.writer.in_loop = in_loop
+        self.emit(f'if not {condition}.is_true(): break')
+        self.loop_body(node, elements, collect)
+        self.writer.indent -= 1
+        return self.loop_value(elements, collect)
+
+    def loop_body(self, node, elements, collect):
+        """循环体，函数调用中抛出的 ContinueSignal/BreakSignal 也作用于这个循环"""
+        self.emit('try:')
+        self.writer.indent += 1
+        in_loop, self.writer.in_loop = self.writer.in_loop, True
+        emitted = len(self.writer.lines)
+        value = self.expr(node.body_node)
+        if len(self.writer.lines) == emitted:
+            # 循环体是常量（for ... then 1），没有生成任何语句
+            self.emit('pass')
+        self.writer.in_loop = in_loop
+        self.writer.indent -= 1
+        self.emit('except _ContinueSignal: continue')
+        self.emit('except _BreakSignal: break')
+        if collect:
+            self.emit(f'{elements}.append({value})')
+
+    def loop_value(self, elements, collect):
+        if not collect:
+            return '_null'
+        t = self.temp()
+        self.emit(f'{t} = _List({elements})')
+        return t
+
+    def transpile_ReturnNode(self, node):
+        value = self.expr(node.node_to_return) if node.node_to_return else '_null'
+        self.emit(f'return _ret({value})')
+        return '_null'
+
+    def transpile_ContinueNode(self, node):
+        self.emit('continue' if self.writer.in_loop else 'raise _ContinueSignal()')
+        return '_null'
+
+    def transpile_BreakNode(self, node):
+        self.emit('break' if self.writer.in_loop else 'raise _BreakSignal()')
+        return '_null'
+
+    #########  函数  ###########
+
+    def transpile_FuncNode(self, node):
+        func_name = node.var_name_tok.value if node.var_name_tok else None
+        line = node.pos_start.ln + 1
+        self.function(node.body_node, f'func {func_name or "<anonymous>"}, line {line}')
+
+        body_node = self.global_name(node.body_node, '_node')
+        arg_names = self.global_name([arg_name.value for arg_name in node.arg_name_toks], '_args')
+        t = self.temp()
+        self.emit(f'{t} = _Function({func_name!r}, {body_node}, {arg_names}, {node.should_auto_return})'
+                  f'.set_context(context).set_pos(*_P[{self.position(node)}])')
+        if func_name:
+            self.emit(f'_sym[{func_name!r}] = {t}')
+        return t
+
+    def transpile_CallNode(self, node):
+        callee = self.expr(node.node_to_call)
+        t = self.temp()
+        self.emit(f'{t} = {callee}.copy().set_pos(*_P[{self.position(node)}]).set_context(context)')
+        args = ', '.join(self.expr(arg_node) for arg_node in node.arg_nodes)
+        if node.is_tail_call:
+            # 见 Interpreter.visit_CallNode
+            self.emit(f'return _tail({t}, [{args}])')
+            return '_null'
+        self.emit(f'{t} = {t}.execute([{args}], _program)')
+        self.emit(f'if {t}.should_return(): _raise_for({t})')
+        self.emit(f'{t} = {t}.value')
+        return t
+
+
+class PythonProgram(object):
+    """
+    转译、编译后的程序
+    与Interpreter的接口相同：visit(node, context) => RTResult，可以直接传给 Function.execute
+    """
+
+    def __init__(self, source, bodies, line_positions, positions, filename, fallback_reason=None, executor=None):
+        """
+        :param source: 生成的python源码
+        :param bodies: 函数体节点 => python函数
+        :param line_positions: 源码每一行对应的位置表下标，-1表示没有对应的节点
+        :param positions: 位置表
+        :param fallback_reason: 无法转译的原因，此时全部交给ClosureCompiler执行
+        :param executor: 见 Transpiler
+        """
+        self.source = source
+        self.bodies = bodies
+        self.line_positions = line_positions
+        self.positions = positions
+        self.filename = filename
+        self.fallback_reason = fallback_reason
+        # 不是本次转译的函数体（例如之前的脚本中定义、保存在全局符号表中的函数）
+        self.fallback = ClosureCompiler(executor)
+
+    def visit(self, node, context):
+        body = self.bodies.get(node)
+        if body is None:
+            return self.fallback.visit(node, context)
+        try:
+            return body(context)
+        except Signal as signal:
+            return signal.to_result()
+        except Exception as exception:
+            self.annotate(exception)
+            raise
+
+    def execute_function(self, func, context):
+        """见 Interpreter.execute_function"""
+        return self.visit(func.body_node, context)
+
+    def position_of(self, lineno):
+        """
+        生成源码的行号 => ToyPL的 (pos_start, pos_end)
+        :return: 没有对应的节点返回None
+        """
+        if 0 < lineno <= len(self.line_positions):
+            index = self.line_positions[lineno - 1]
+            if index >= 0:
+                return self.positions[index]
+        return None
+
+    def annotate(self, exception):
+        """
+        生成的代码中抛出python异常（与Interpreter中同样会抛出的异常）时，在异常上附加对应的ToyPL位置
+        每一层函数调用附加一条，最内层在前
+        """
+        tb = exception.__traceback__
+        while tb and tb.tb_frame.f_code.co_filename != self.filename:
+            tb = tb.tb_next
+        position = self.position_of(tb.tb_lineno) if tb else None
+        if position and hasattr(exception, 'add_note'):
+            pos_start = position[0]
+            exception.add_note(f'  ToyPL File {pos_start.fn}, line {pos_start.ln + 1}, in {tb.tb_frame.f_code.co_name}')
+
+
+def success(value):
+    return RTResult().success(value)
+
+
+def success_return(value):
+    return RTResult().success_return(value)
+
+
+def success_tail_call(func, args):
+    return RTResult().success_tail_call(func, args)
+
+
+def undefined_error(position, var_name, context):
+    """见 Interpreter.visit_VarAccessNode"""
+    return ErrorSignal(RTError(*position, f"{var_name} is not defined", context))
+
+
+def unsupported_error(position, op_type, context):
+    return ErrorSignal(RTError(*position, f"{op_type} is not suppert", context))
+
+
+def locate_error(error, right_position, node_position, context):
+    """见 Interpreter.visit_BinOpNode"""
+    pos_start, pos_end = right_position if error.at_right_operand else node_position
+    return ErrorSignal(error.locate(pos_start, pos_end, context))
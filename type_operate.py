@@ -7,18 +7,11 @@ from error import *
 ####################
 
 class Value(object):
-    def __init__(self):
-        self.set_pos()
-        self.set_context()
-
-    def set_pos(self, pos_start=None, pos_end=None):
-        self.pos_start = pos_start
-        self.pos_end = pos_end
-        return self
-
-    def set_context(self, context=None):
-        self.context = context
-        return self
+    """
+    运行时的值
+    Number、String、List 不记录位置与上下文，可以在多处共享；
+    运算出错时返回不带位置的RTError，由正在执行的AST节点通过 RTError.locate 补全报错位置
+    """
 
     def copy(self):
         raise Exception('No copy method defined')
@@ -27,14 +20,19 @@ class Value(object):
         return False
 
     def illegal_operation(self, other=None):
-        if not other:
-            other = self
-        return RTError(
-            self.pos_start, other.pos_end,
-            # Illegal operation => 非法操作
-            "Illegal operation",
-            self.context
-        )
+        # Illegal operation => 非法操作，报错位置为整个运算表达式
+        return RTError(None, None, "Illegal operation", None)
+
+
+def operand_error(details):
+    """
+    由右操作数引起的错误（除数为0、下标越界），报错位置为右操作数
+    :param details: 错误细节
+    :return: RTError
+    """
+    error = RTError(None, None, details, None)
+    error.at_right_operand = True
+    return error
 
 
 class Number(Value):
@@ -45,103 +43,100 @@ class Number(Value):
     def added_by(self, other):
         """加法操作"""
         if isinstance(other, Number):
-            return Number(self.value + other.value).set_context(self.context), None
+            return make_number(self.value + other.value), None
         else:
-            return None, Value.illegal_operation(self, other)
+            return None, self.illegal_operation(other)
 
     def subbed_by(self, other):
         """减法操作"""
         if isinstance(other, Number):
-            return Number(self.value - other.value).set_context(self.context), None
+            return make_number(self.value - other.value), None
         else:
-            return None, Value.illegal_operation(self, other)
+            return None, self.illegal_operation(other)
 
     def multed_by(self, other):
         """乘法操作"""
         if isinstance(other, Number):
-            return Number(self.value * other.value).set_context(self.context), None
+            return make_number(self.value * other.value), None
         else:
-            return None, Value.illegal_operation(self, other)
+            return None, self.illegal_operation(other)
 
     def dived_by(self, other):
         """除法操作"""
         if isinstance(other, Number):
             if other.value == 0:
                 # 除法分母不可为0
-                return None, RTError(
-                    other.pos_start, other.pos_end,
-                    'Division by zero',
-                    self.context
-                )
+                return None, operand_error('Division by zero')
 
-            return Number(self.value / other.value).set_context(self.context), None
+            return make_number(self.value / other.value), None
         else:
-            return None, Value.illegal_operation(self, other)
+            return None, self.illegal_operation(other)
 
     def powed_by(self, other):
         """幂运算"""
         if isinstance(other, Number):
-            return Number(self.value ** other.value).set_context(self.context), None
+            return make_number(self.value ** other.value), None
         else:
-            return None, Value.illegal_operation(self, other)
+            return None, self.illegal_operation(other)
 
     def get_comparison_eq(self, other):
         if isinstance(other, Number):
-            return Number(int(self.value == other.value)).set_context(self.context), None
+            return (Number.true if self.value == other.value else Number.false), None
         else:
-            return None, Value.illegal_operation(self, other)
+            return None, self.illegal_operation(other)
 
     def get_comparison_ne(self, other):
         if isinstance(other, Number):
-            return Number(int(self.value != other.value)).set_context(self.context), None
+            return (Number.true if self.value != other.value else Number.false), None
         else:
-            return None, Value.illegal_operation(self, other)
+            return None, self.illegal_operation(other)
 
     def get_comparison_lt(self, other):
         if isinstance(other, Number):
-            return Number(int(self.value < other.value)).set_context(self.context), None
+            return (Number.true if self.value < other.value else Number.false), None
         else:
-            return None, Value.illegal_operation(self, other)
+            return None, self.illegal_operation(other)
 
     def get_comparison_gt(self, other):
         if isinstance(other, Number):
-            return Number(int(self.value > other.value)).set_context(self.context), None
+            return (Number.true if self.value > other.value else Number.false), None
         else:
-            return None, Value.illegal_operation(self, other)
+            return None, self.illegal_operation(other)
 
     def get_comparison_lte(self, other):
         if isinstance(other, Number):
-            return Number(int(self.value <= other.value)).set_context(self.context), None
+            return (Number.true if self.value <= other.value else Number.false), None
         else:
-            return None, Value.illegal_operation(self, other)
+            return None, self.illegal_operation(other)
 
     def get_comparison_gte(self, other):
         if isinstance(other, Number):
-            return Number(int(self.value >= other.value)).set_context(self.context), None
+            return (Number.true if self.value >= other.value else Number.false), None
         else:
-            return None, Value.illegal_operation(self, other)
+            return None, self.illegal_operation(other)
 
     def anded_by(self, other):
         if isinstance(other, Number):
-            return Number(int(self.value and other.value)).set_context(self.context), None
+            return make_number(int(self.value and other.value)), None
         else:
-            return None, Value.illegal_operation(self, other)
+            return None, self.illegal_operation(other)
 
     def ored_by(self, other):
         if isinstance(other, Number):
-            return Number(int(self.value or other.value)).set_context(self.context), None
+            return make_number(int(self.value or other.value)), None
         else:
-            return None, Value.illegal_operation(self, other)
+            return None, self.illegal_operation(other)
 
     def notted(self):
-        return Number(1 if self.value == 0 else 0).set_context(self.context), None
+        return (Number.true if self.value == 0 else Number.false), None
 
     def copy(self):
-        """copy本身"""
-        copy = Number(self.value)
-        copy.set_pos(self.pos_start, self.pos_end)
-        copy.set_context(self.context)
-        return copy
+        """Number不可变，不需要copy"""
+        return self
+
+    def __reduce__(self):
+        """pickle（AST缓存）后加载时，小整数仍然从缓存中获取"""
+        return make_number, (self.value,)
 
     def is_true(self):
         return self.value != 0
@@ -150,13 +145,68 @@ class Number(Value):
         return str(self.value)
 
 
+####################
+# SMALL INT CACHE 小整数缓存
+####################
+
+# Number不可变，常用的小整数只创建一次，循环变量、比较结果、字面量都直接复用
+SMALL_INT_MIN = -5
+SMALL_INT_MAX = 256
+SMALL_INTS = [Number(i) for i in range(SMALL_INT_MIN, SMALL_INT_MAX + 1)]
+
+
+def make_number(value):
+    """
+    创建Number，小整数从缓存中获取
+    :param value: python int/float
+    :return: Number
+    """
+    # 注意 1.0 == 1，所以必须判断类型，浮点数不走缓存
+    if type(value) is int and SMALL_INT_MIN <= value <= SMALL_INT_MAX:
+        return SMALL_INTS[value - SMALL_INT_MIN]
+    return Number(value)
+
+
+####################
+# COUNTED LOOP 计数循环
+####################
+
+def loop_values(start, end, step):
+    """
+    for循环变量依次取的值，step为负数时从大到小
+    start、end、step都是int时，循环次数在开始前就已确定，直接使用range，每次循环不再比较、累加
+    :param start: python int/float
+    :param end: python int/float
+    :param step: python int/float
+    :return: 可迭代对象
+    """
+    if type(start) is int and type(end) is int and type(step) is int and step != 0:
+        return range(start, end, step)
+    return stepped_values(start, end, step)
+
+
+def stepped_values(start, end, step):
+    """
+    逐次累加的通用实现，float的累积误差与 i += step 相同；step为0时与原来一样不会结束
+    """
+    i = start
+    if step >= 0:
+        while i < end:
+            yield i
+            i += step
+    else:
+        while i > end:
+            yield i
+            i += step
+
+
 ####################
 # built variable 内建变量
 ####################
 
 Number.null = Number(0)
-Number.false = Number(0)
-Number.true = Number(1)
+Number.false = make_number(0)
+Number.true = make_number(1)
 Number.PI = Number(math.pi)
 
 
@@ -166,28 +216,29 @@ class String(Value):
         super().__init__()
         self.value = value
 
-    def added_to(self, other):
+    def added_by(self, other):
         """字符串相加"""
         if isinstance(other, String):
-            return String(self.value + other.value).set_context(self.context), None
+            return String(self.value + other.value), None
         else:
-            return None, Value.illegal_operation(self, other)
+            return None, self.illegal_operation(other)
 
     def multed_by(self, other):
-        """复制多个字符串"""
-        if isinstance(other, String):
-            return String(self.value * other.value).set_context(self.context), None
+        """
+        复制多个字符串
+        "ab" * 3 = "ababab"
+        """
+        if isinstance(other, Number) and isinstance(other.value, int):
+            return String(self.value * other.value), None
         else:
-            return None, Value.illegal_operation(self, other)
+            return None, self.illegal_operation(other)
 
     def is_true(self):
         return len(self.value) > 0
 
     def copy(self):
-        copy = String(self.value)
-        copy.set_pos(self.pos_start, self.pos_end)
-        copy.set_context(self.context)
-        return copy
+        """String不可变，不需要copy"""
+        return self
 
     def __str__(self):
         return self.value
@@ -200,6 +251,28 @@ class List(Value):
     def __init__(self, elements):
         super().__init__()
         self.elements = elements
+        # 写时复制：copy 出来的 List 与原 List 共享同一个 elements 列表，
+        # 只有在真正修改（append/pop/extend）之前才复制，读取变量不再是 O(n)
+        self.shared = False
+
+    def own_elements(self):
+        """
+        获得可以修改的elements，与其他List共享时先复制一份
+        :return:
+        """
+        if self.shared:
+            self.elements = self.elements[:]
+            self.shared = False
+        return self.elements
+
+    def append(self, value):
+        self.own_elements().append(value)
+
+    def pop(self, index):
+        return self.own_elements().pop(index)
+
+    def extend(self, elements):
+        self.own_elements().extend(elements)
 
     def added_by(self, other):
         """
@@ -209,9 +282,8 @@ class List(Value):
         :param other:
         :return:
         """
-        new_list = self.copy()
-        new_list.elements.append(other)
-        return new_list, None
+        # 直接构建新的elements，不需要先copy再修改
+        return List(self.elements + [other]), None
 
     def subbed_by(self, other):
         """
@@ -223,17 +295,15 @@ class List(Value):
             new_list = self.copy()
             try:
                 # pop 弹出list中对应下标的元素
-                new_list.elements.pop(other.value)
+                new_list.pop(other.value)
                 return new_list, None
             except:
-                return None, RTError(
-                    other.pos_start, other.pos_end,
-                    # 超过list边界
-                    "Element as this index could not be removed from list because index is out of bounds",
-                    self.context
+                # 超过list边界
+                return None, operand_error(
+                    "Element as this index could not be removed from list because index is out of bounds"
                 )
         else:
-            return None, Value.illegal_operation(self, other)
+            return None, self.illegal_operation(other)
 
     def multed_by(self, other):
         """
@@ -243,9 +313,9 @@ class List(Value):
         :return:
         """
         if isinstance(other, List):
-            new_list = self.copy()
-            new_list.elements.extend(other.elements)
-            return new_list, None
+            return List(self.elements + other.elements), None
+        else:
+            return None, self.illegal_operation(other)
 
     def dived_by(self, other):
         """
@@ -258,18 +328,16 @@ class List(Value):
             try:
                 return self.elements[other.value], None
             except:
-                return None, RTError(
-                    other.pos_start, other.pos_end,
-                    "Element as this index could not be removed from list because index is out of bounds",
-                    self.context
+                return None, operand_error(
+                    "Element as this index could not be removed from list because index is out of bounds"
                 )
         else:
-            return None, Value.illegal_operation(self, other)
+            return None, self.illegal_operation(other)
 
     def copy(self):
-        copy = List(self.elements[:])
-        copy.set_pos(self.pos_start, self.pos_end)
-        copy.set_context(self.context)
+        """O(1)，与原List共享elements，双方在修改前都会先复制"""
+        copy = List(self.elements)
+        copy.shared = self.shared = True
         return copy
 
     def __str__(self):
@@ -0,0 +1,294 @@
+from opcodes import *
+from function import *
+from resolver import LOCAL_NAMES
+
+
+####################
+# VM 栈式虚拟机
+####################
+
+# ToyPL函数调用的最大深度
+MAX_CALL_DEPTH = 10000
+
+
+class VM(object):
+    """
+    执行Compiler生成的字节码
+    与Interpreter一样，值使用type_operate.py中的类型，报错使用RTError，返回RTResult
+    """
+
+    def __init__(self, max_call_depth=MAX_CALL_DEPTH):
+        """
+        :param max_call_depth: ToyPL函数调用的最大深度，超过时报错而不是让python崩溃
+        """
+        self.max_call_depth = max_call_depth
+
+    def run(self, code, context):
+        """
+        执行CodeObject
+        调用CompiledFunction（以及记忆化的CompiledFunction）时不递归调用run，而是把调用者的执行状态 (code, pc, stack, context)
+        压入call_stack，切换到被调用函数的字节码继续执行，返回时再弹出恢复，
+        所以递归深度只受 max_call_depth 限制，与python的递归上限无关
+        :param code: CodeObject
+        :param context: 上下文，符号表与报错定位都依赖它
+        :return: RTResult
+        """
+        res = RTResult()
+        symbol_table = context.symbol_table
+        call_stack = []
+        stack = []
+        pc = 0
+
+        while True:
+            # 进入/返回函数后，重新加载当前函数的执行状态
+            ops = code.ops
+            args = code.args
+            positions = code.positions
+            constants = code.constants
+            frame = context.frame
+            slots = frame.slots if frame else None
+            push = stack.append
+            pop = stack.pop
+
+            while True:
+                op = ops[pc]
+                arg = args[pc]
+                pc += 1
+
+                if op == LOAD_FAST:
+                    value = slots[arg]
+                    if value is None:
+                        # 局部变量还没有赋值（var x = x + 1），与Interpreter一样从调用者开始按变量名查找
+                        value = self.lookup(code.local_names[arg], context)
+                        if value is None:
+                            return res.failure(self.undefined(code.local_names[arg], positions[pc - 1], context))
+                    push(value.copy())
+
+                elif op == LOAD_NAME:
+                    # 顶层直接查符号表，函数中不是局部变量的名字沿调用者链查找
+                    value = self.lookup(arg, context) if frame else symbol_table.get(arg)
+                    if value is None:
+                        return res.failure(self.undefined(arg, positions[pc - 1], context))
+                    # 与 Interpreter.visit_VarAccessNode 一样，copy本身
+                    push(value.copy())
+
+                elif op == LOAD_GLOBAL:
+                    # 没有函数把这个名字绑定为局部变量，调用者的Frame中不会有，直接查全局符号表；
+                    # 编译之后执行的程序中有函数绑定了这个名字时，仍然沿调用者链查找
+                    if arg in LOCAL_NAMES:
+                        value = self.lookup(arg, context)
+                    else:
+                        value = context.symbol_table.get(arg)
+                    if value is None:
+                        return res.failure(self.undefined(arg, positions[pc - 1], context))
+                    push(value.copy())
+
+                elif op == LOAD_CONST:
+                    # 常量不可变，直接共享
+                    push(constants[arg])
+
+                elif op == BINARY_OP:
+                    right = pop()
+                    left = pop()
+                    # arg为BinaryOperator，按左右值的类型查表
+                    operate = arg.table.get((type(left), type(right)))
+                    if operate is None:
+                        result, error = arg.generic(left, right)
+                    else:
+                        result, error = operate(left, right)
+                    if error:
+                        if error.at_right_operand:
+                            pos_start, pos_end = code.operand_positions[pc - 1]
+                        else:
+                            pos_start, pos_end = positions[pc - 1]
+                        return res.failure(error.locate(pos_start, pos_end, context))
+                    push(result)
+
+                elif op == POP_JUMP_IF_FALSE:
+                    if not pop().is_true():
+                        pc = arg
+
+                elif op == JUMP:
+                    pc = arg
+
+                elif op == STORE_FAST:
+                    slots[arg] = stack[-1]
+
+                elif op == STORE_NAME:
+                    symbol_table.set(arg, stack[-1])
+
+                elif op == POP_TOP:
+                    pop()
+
+                elif op == FOR_ITER:
+                    # 栈顶为循环变量取值的迭代器（见 FOR_PREP）; arg => (var_name, slot, exit_target)
+                    i = next(stack[-1], None)
+                    if i is not None:
+                        if arg[1] is None:
+                            symbol_table.set(arg[0], make_number(i))
+                        else:
+                            slots[arg[1]] = make_number(i)
+                    else:
+                        pop()
+                        pc = arg[2]
+
+                elif op == CALL or (op == TAIL_CALL and isinstance(stack[-arg - 1], MemoizedFunction)):
+                    # 记忆化的函数返回时要写入缓存，尾调用也按普通调用执行
+                    if arg:
+                        call_args = stack[-arg:]
+                        del stack[-arg:]
+                    else:
+                        call_args = []
+                    value_to_call = pop().copy().set_pos(*positions[pc - 1]).set_context(context)
+                    memo = None
+                    if isinstance(value_to_call, MemoizedFunction) and isinstance(value_to_call.func, CompiledFunction):
+                        # 不经过 MemoizedFunction.execute（嵌套调用run），未命中时与普通函数一样压栈执行
+                        key, return_value = value_to_call.lookup(call_args)
+                        if return_value is not None:
+                            push(return_value)
+                            continue
+                        memo = (value_to_call, key)
+                        value_to_call = value_to_call.func.copy().set_pos(*positions[pc - 1]).set_context(context)
+                    if isinstance(value_to_call, CompiledFunction):
+                        if len(call_stack) >= self.max_call_depth:
+                            return res.failure(self.too_deep(positions[pc - 1], context))
+                        exec_ctx = self.enter(res, value_to_call, call_args)
+                        if res.should_return(): return res
+                        # 保存调用者的执行状态，切换到被调用的函数；memo为返回时要写入的缓存
+                        call_stack.append((code, pc, stack, context, memo))
+                        code, pc, stack, context = value_to_call.code, 0, [], exec_ctx
+                        break
+                    # 内建函数直接执行
+                    return_value = res.register(value_to_call.execute(call_args, self))
+                    if res.should_return(): return res
+                    push(return_value)
+
+                elif op == TAIL_CALL:
+                    if arg:
+                        call_args = stack[-arg:]
+                        del stack[-arg:]
+                    else:
+                        call_args = []
+                    value_to_call = pop().copy().set_pos(*positions[pc - 1]).set_context(context)
+                    if not call_stack:
+                        # 当前函数由 CompiledFunction.execute 执行，交给它执行尾调用
+                        return res.success_tail_call(value_to_call, call_args)
+                    if isinstance(value_to_call, CompiledFunction):
+                        exec_ctx = self.enter(res, value_to_call, call_args)
+                        if res.should_return(): return res
+                        # 被调用的函数直接替换当前函数，call_stack不增长
+                        code, pc, stack, context = value_to_call.code, 0, [], exec_ctx
+                        break
+                    # 内建函数执行后，结果直接返回给调用者
+                    return_value = res.register(value_to_call.execute(call_args, self))
+                    if res.should_return(): return res
+                    code, pc, stack, context, memo = call_stack.pop()
+                    if memo:
+                        memo[0].store(memo[1], return_value)
+                    stack.append(return_value)
+                    break
+
+                elif op == LOAD_NULL:
+                    push(Number.null)
+
+                elif op == UNARY_OP:
+                    number = pop()
+                    number, error = arg.table.get(type(number), arg.generic)(number)
+                    if error:
+                        return res.failure(error.locate(*positions[pc - 1], context))
+                    push(number)
+
+                elif op == LIST_APPEND:
+                    value = pop()
+                    stack[-arg].append(value)
+
+                elif op == BUILD_LIST:
+                    if arg:
+                        elements = stack[-arg:]
+                        del stack[-arg:]
+                    else:
+                        elements = []
+                    push(List(elements))
+
+                elif op == LIST_NEW:
+                    push([])
+
+                elif op == LIST_BUILD:
+                    stack[-1] = List(stack[-1])
+
+                elif op == FOR_PREP:
+                    step_value = pop()
+                    end_value = pop()
+                    start_value = pop()
+                    # 与 Interpreter.visit_ForNode 相同，都是int时为range
+                    push(iter(loop_values(start_value.value, end_value.value, step_value.value)))
+
+                elif op == MAKE_FUNCTION:
+                    func_code = constants[arg]
+                    push(CompiledFunction(func_code.name, func_code).set_context(context).set_pos(*positions[pc - 1]))
+
+                elif op == RETURN_VALUE:
+                    if not call_stack:
+                        return res.success_return(pop())
+                    # 返回调用者，与 CompiledFunction.execute 对返回值的处理一致
+                    return_value = pop()
+                    code, pc, stack, context, memo = call_stack.pop()
+                    if memo:
+                        memo[0].store(memo[1], return_value)
+                    stack.append(return_value)
+                    break
+
+                elif op == END:
+                    if not call_stack:
+                        return res.success(pop())
+                    # 函数体执行结束，-> 形式的函数返回函数体的值，否则返回null
+                    return_value = pop() if code.should_auto_return else Number.null
+                    code, pc, stack, context, memo = call_stack.pop()
+                    if memo:
+                        memo[0].store(memo[1], return_value)
+                    stack.append(return_value)
+                    break
+
+                else:
+                    raise Exception(f'Unknown opcode {op}')
+
+    def enter(self, res, func, call_args):
+        """
+        创建被调用函数的上下文并填充参数
+        :param res: 参数个数不对时，错误记录在res中
+        :return: 函数上下文
+        """
+        exec_ctx = func.generate_new_context()
+        res.register(func.check_and_populate_args(func.code.arg_names, call_args, exec_ctx))
+        return exec_ctx
+
+    def too_deep(self, position, context):
+        pos_start, pos_end = position
+        return RTError(
+            pos_start, pos_end,
+            f"Maximum call depth exceeded ({self.max_call_depth})",
+            context
+        )
+
+    def lookup(self, name, context):
+        """
+        动态作用域查找，与Interpreter中 SymbolTable.get 沿调用者的符号表查找的顺序相同：
+        依次查找调用者、调用者的调用者……的Frame，直到没有Frame的上下文（顶层程序），再查它的符号表
+        :param context: 当前函数的上下文，当前函数自己的局部变量已经由调用方查找过
+        :return: 未找到返回None
+        """
+        caller = context.parent
+        while caller is not None and caller.frame is not None:
+            value = caller.frame.get(name)
+            if value is not None:
+                return value
+            caller = caller.parent
+        return (caller or context).symbol_table.get(name)
+
+    def undefined(self, name, position, context):
+        pos_start, pos_end = position
+        return RTError(
+            pos_start, pos_end,
+            f"{name} is not defined",
+            context
+        )